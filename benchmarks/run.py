@@ -0,0 +1,391 @@
+"""
+Benchmarks for the ACME math and trade-management hot paths.
+
+Every case runs on synthetic data drawn from a fixed seed, so two runs on the same machine
+measure the same work. Run from the repository root, where config.yaml lives:
+
+    python -m benchmarks.run                     # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline     # run and store the results as the new baseline
+    python -m benchmarks.run --filter acme       # only cases whose name contains 'acme'
+    python -m benchmarks.run --output out.json   # also write the results to a file
+    python -m benchmarks.run --ci                # fail unless every case is checked against a baseline
+
+Results are printed as a table; they are written as JSON only with --output or, as the new
+baseline, with --save-baseline. When a baseline exists, each case's median is compared with
+it and the run exits with status 1 if any case got slower than the threshold.
+Without a baseline the results are only reported, except in CI mode (--ci, or the CI
+environment variable set), where a missing baseline or a case missing from it exits with
+status 1 too, so a pipeline cannot pass without comparing anything.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from tabulate import tabulate
+
+SEED = 1234
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# A case is reported as a regression when its median is this many times the baseline median.
+THRESHOLD = 1.25
+# Open entries in the market_exits cases.
+BOOK_SIZES = (10, 100, 1000, 10000)
+
+cases = []
+
+
+def case(name: str, ops: int = 1, repeat: int = 7):
+    """
+    Registers a benchmark case.
+
+    The decorated function receives a seeded random.Random and returns a (prepare, run) pair.
+    prepare() is called before every timed repeat and its result passed to run(), so cases that
+    consume their input, like market_exits, start each repeat from the same state. prepare may
+    be None.
+
+    :param name: Case name, used in the results and the baseline.
+    :param ops: Operations one run() performs; timings are reported per operation.
+    :param repeat: Timed repeats; the median and minimum are reported.
+    :return: The decorator.
+    """
+    def register(factory):
+        cases.append((name, ops, repeat, factory))
+        return factory
+    return register
+
+
+def measure(ops: int, repeat: int, prepare, run) -> dict:
+    """
+    Times run() `repeat` times, after a single untimed warm-up.
+
+    :return: Dictionary of per-operation timings in microseconds.
+    """
+    run(prepare() if prepare else None)
+    samples = []
+    for _ in range(repeat):
+        state = prepare() if prepare else None
+        started = time.perf_counter()
+        run(state)
+        samples.append((time.perf_counter() - started) / ops * 1e6)
+    return {
+        "ops": ops,
+        "repeat": repeat,
+        "median_us": statistics.median(samples),
+        "min_us": min(samples),
+        "max_us": max(samples),
+    }
+
+
+def scaled_prices(rng: random.Random, count: int) -> list:
+    """
+    :return: Random scaled prices, spread over the [1, 100) range the ACME frame covers.
+    """
+    return [10 ** rng.uniform(0, 2) for _ in range(count)]
+
+
+def scaled_candles(rng: random.Random, count: int) -> list:
+    """
+    :return: Random (open, close) pairs of scaled prices with 1m-sized moves.
+    """
+    candles = []
+    for price in scaled_prices(rng, count):
+        candles.append((price, price * (1 + rng.gauss(0, 0.01))))
+    return candles
+
+
+def klines(rng: random.Random, count: int, interval_ms: int) -> list:
+    """
+    :return: Synthetic klines in exchange format, ending with the bar that is forming now.
+    """
+    now = int(time.time() * 1000)
+    last_open = now - now % interval_ms
+    return [[last_open - i * interval_ms, "1", "1", "1", "1", f"{rng.expovariate(1 / 5000):.3f}"]
+            for i in range(count - 1, -1, -1)]
+
+
+def open_entries(rng: random.Random, entries: int) -> tuple:
+    """
+    Open entries near their symbols' live prices, so a share of them exit.
+
+    :return: Tuple of (list of (symbol, entry price, side), live prices keyed by symbol).
+    """
+    from lib.tradebook import Side
+    symbols = [f"SYM{i}USDT" for i in range(max(1, min(entries // 10, 200)))]
+    prices = {symbol: 10 ** rng.uniform(0, 2) for symbol in symbols}
+    book = []
+    for _ in range(entries):
+        symbol = rng.choice(symbols)
+        entry_price = prices[symbol] * (1 + rng.uniform(-0.008, 0.008))
+        book.append((symbol, entry_price, rng.choice((Side.BUY, Side.SELL))))
+    return book, prices
+
+
+def performance(rng: random.Random, symbols: int, entries: int) -> dict:
+    """
+    :return: A TradeBook.performance-style dictionary for the Discord summary.
+    """
+    from lib.tradebook import Side
+    return {f"SYM{i}USDT": [(rng.uniform(1, 100), rng.uniform(1, 100), rng.uniform(-0.6, 0.7),
+                             rng.choice((Side.BUY, Side.SELL))) for _ in range(entries)]
+            for i in range(symbols)}
+
+
+@case("acme.constant_frame", repeat=3)
+def bench_constant_frame(rng):
+    from lib import acme
+    return None, lambda _: acme.constant_frame(*acme.CONSTANTS, ceiling=acme.FRAME_CEILING)
+
+
+@case("acme.init", repeat=3)
+def bench_init(rng):
+    from lib import acme
+    return None, lambda _: acme.init()
+
+
+@case("acme.get_scale", ops=100_000)
+def bench_get_scale(rng):
+    from lib import acme
+    prices = [10 ** rng.uniform(-10, 8) for _ in range(100_000)]
+
+    def run(_):
+        for price in prices:
+            acme.get_scale(price)
+    return None, run
+
+
+@case("acme.price_within", ops=10_000)
+def bench_price_within(rng):
+    from lib import acme
+    acme.ensure_init()
+    zones = acme.pnz_lg[3]
+    prices = scaled_prices(rng, 10_000)
+
+    def run(_):
+        for price in prices:
+            acme.price_within(zones, price)
+    return None, run
+
+
+@case("acme.through_pnz_small", ops=10_000)
+def bench_through_pnz_small(rng):
+    from lib import acme
+    acme.ensure_init()
+    zones = acme.pnz_sm[1]
+    candles = scaled_candles(rng, 10_000)
+
+    def run(_):
+        for candle_open, candle_close in candles:
+            acme.through_pnz_small(zones, candle_open, candle_close)
+    return None, run
+
+
+@case("get_pnz", ops=10_000)
+def bench_get_pnz(rng):
+    import liquidation_acme
+    liquidation_acme.acme.ensure_init()
+    candles = scaled_candles(rng, 10_000)
+
+    async def batch():
+        for candle_open, candle_close in candles:
+            await liquidation_acme.get_pnz(candle_open, candle_close, [])
+    return None, lambda _: asyncio.run(batch())
+
+
+@case("volume_filter.seed", ops=100)
+def bench_zscore_seed(rng):
+    from lib import zscore
+    timeframes = list(zscore.TIMEFRAME_MS)
+    lookback = 27
+    bars = [{timeframe: klines(rng, lookback, zscore.TIMEFRAME_MS[timeframe]) for timeframe in timeframes}
+            for _ in range(100)]
+
+    def run(_):
+        for symbol_bars in bars:
+            engine = zscore.VolumeEngine(lookback, timeframes)
+            for timeframe in timeframes:
+                engine.seed(timeframe, symbol_bars[timeframe])
+            engine.zscores()
+    return None, run
+
+
+@case("volume_filter.update", ops=10_000)
+def bench_zscore_update(rng):
+    from lib import zscore
+    timeframes = list(zscore.TIMEFRAME_MS)
+    lookback = 27
+    seed_bars = {timeframe: klines(rng, lookback, zscore.TIMEFRAME_MS[timeframe]) for timeframe in timeframes}
+    first_minute = int(seed_bars["1m"][-1][0])
+    # Ten updates per minute with growing volume, then the next minute.
+    updates = [(first_minute + (i // 10) * zscore.MINUTE_MS, (i % 10 + 1) * rng.uniform(100, 500))
+               for i in range(10_000)]
+
+    def prepare():
+        engine = zscore.VolumeEngine(lookback, timeframes)
+        for timeframe in timeframes:
+            engine.seed(timeframe, seed_bars[timeframe])
+        return engine
+
+    def run(engine):
+        for minute_open, volume in updates:
+            engine.update(minute_open, volume)
+            engine.zscores()
+    return prepare, run
+
+
+def bench_market_exits(entries: int, books: int):
+    def factory(rng):
+        import liquidation_acme
+        from lib.tradebook import TradeBook
+        book, prices = open_entries(rng, entries)
+
+        def prepare():
+            trade_books = []
+            for _ in range(books):
+                trade_book = TradeBook()
+                for symbol, entry_price, side in book:
+                    trade_book.add(symbol, entry_price, side)
+                trade_books.append(trade_book)
+            return trade_books
+
+        async def batch(open_trades_books):
+            for open_trades_book in open_trades_books:
+                await liquidation_acme.market_exits(open_trades_book, prices)
+
+        def run(open_trades_books):
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(batch(open_trades_books))
+        return prepare, run
+    return factory
+
+
+# Small books run many times per repeat, so the event loop start-up does not dominate.
+for size in BOOK_SIZES:
+    books = max(1, 10_000 // size)
+    case(f"market_exits[{size}]", ops=books, repeat=7 if size < 10_000 else 3)(bench_market_exits(size, books))
+
+
+@case("tradebook.performance[10000]", repeat=5)
+def bench_performance(rng):
+    from lib.tradebook import TradeBook
+    book, prices = open_entries(rng, 10_000)
+    trade_book = TradeBook()
+    for symbol, entry_price, side in book:
+        trade_book.add(symbol, entry_price, side)
+    return None, lambda _: trade_book.performance(prices)
+
+
+@case("discord.send_dictionary_to_channel", ops=100)
+def bench_send_dictionary(rng):
+    from lib import discord
+    dictionaries = [performance(rng, 20, 5) for _ in range(100)]
+
+    def run(_):
+        # Format only; the rendered messages are discarded instead of queued for delivery.
+        enqueue = discord._enqueue
+        discord._enqueue = lambda *args, **kwargs: None
+        try:
+            for dictionary in dictionaries:
+                discord.send_dictionary_to_channel(dictionary, 1.5)
+        finally:
+            discord._enqueue = enqueue
+    return None, run
+
+
+def run_cases(name_filter: str = None) -> dict:
+    """
+    Runs every registered case whose name contains `name_filter`.
+
+    :return: Dictionary of case name to timings.
+    """
+    results = {}
+    for name, ops, repeat, factory in cases:
+        if name_filter and name_filter not in name:
+            continue
+        rng = random.Random(f"{SEED}:{name}")
+        prepare, run = factory(rng)
+        results[name] = measure(ops, repeat, prepare, run)
+        print(f"{name}: {results[name]['median_us']:.3f} us/op", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple:
+    """
+    :return: Tuple of (table rows, names of the cases slower than threshold times the baseline).
+    """
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            rows.append([name, result["median_us"], None, None, "new"])
+            continue
+        ratio = result["median_us"] / before["median_us"]
+        status = "REGRESSION" if ratio > threshold else "faster" if ratio < 1 / threshold else "ok"
+        if status == "REGRESSION":
+            regressions.append(name)
+        rows.append([name, result["median_us"], before["median_us"], ratio, status])
+    return rows, regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the ACME math and trade-management hot paths.")
+    parser.add_argument("--filter", help="only run cases whose name contains this text")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="slowdown ratio reported as a regression")
+    parser.add_argument("--output", help="also write the results JSON to this file")
+    parser.add_argument("--ci", action="store_true", default=bool(os.environ.get("CI")),
+                        help="fail when there is no baseline to compare with (default when CI is set)")
+    args = parser.parse_args()
+    if args.ci and not args.save_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; store one with --save-baseline on the reference machine.")
+        sys.exit(1)
+
+    results = run_cases(args.filter)
+    report = {
+        "seed": SEED,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "created": int(time.time()),
+        "results": results,
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+    rows, regressions = compare(results, baseline, args.threshold)
+    print(tabulate(rows, headers=["Case", "Median us/op", "Baseline us/op", "Ratio", "Status"],
+                   floatfmt=".3f"))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            baseline_file.write(output + "\n")
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to store one.")
+
+    unchecked = [name for name in results if name not in baseline] if args.ci and not args.save_baseline else []
+    if unchecked:
+        print(f"Cases missing from the baseline: {', '.join(unchecked)}")
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+    if regressions or unchecked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import yaml
 import datetime
 from typing import TypedDict
 
+from lib import exchange
+
 CONFIG_ERROR_MSG: str = "Configuration file incorrectly formatted"
 
 
@@ -14,6 +16,213 @@ class Filters(TypedDict):
     zscore: int
 
 
+class Exchange(TypedDict):
+    """
+    Exchange config option dictionary hint typing.
+    """
+
+    rest_url: str
+    stream_url: str
+    timeout: float
+    max_concurrency: int
+    max_retries: int
+    weight_limit: int
+    background_share: float
+
+
+# The client's own defaults, copied before configure() changes them.
+EXCHANGE_DEFAULTS: Exchange = dict(exchange.settings)
+
+
+class LiquidationStream(TypedDict):
+    """
+    Liquidation stream connections config option dictionary hint typing.
+    """
+
+    connections: int
+    lifetime: float
+    dedup_size: int
+
+
+LIQUIDATION_STREAM_DEFAULTS: LiquidationStream = {
+    "connections": 2,
+    "lifetime": 82800.0,
+    "dedup_size": 10000,
+}
+
+
+class Queue(TypedDict):
+    """
+    Queue config option dictionary hint typing.
+    """
+
+    maxsize: int
+    overflow: str
+
+
+QUEUE_DEFAULTS: Queue = {
+    "maxsize": 10000,
+    "overflow": "block",
+}
+
+
+class DiscordDispatcher(TypedDict):
+    """
+    Discord dispatcher config option dictionary hint typing.
+    """
+
+    batch_window: float
+    max_queue: int
+
+
+DISCORD_DISPATCHER_DEFAULTS: DiscordDispatcher = {
+    "batch_window": 1.0,
+    "max_queue": 1000,
+}
+
+
+class Candles(TypedDict):
+    """
+    Candle store config option dictionary hint typing.
+    """
+
+    max_age: float
+    idle_timeout: float
+    max_symbols: int
+
+
+CANDLES_DEFAULTS: Candles = {
+    "max_age": 10.0,
+    "idle_timeout": 600.0,
+    "max_symbols": 200,
+}
+
+
+class MarkPrices(TypedDict):
+    """
+    Mark price exits config option dictionary hint typing.
+    """
+
+    enabled: bool
+    max_age: float
+
+
+MARK_PRICES_DEFAULTS: MarkPrices = {
+    "enabled": True,
+    "max_age": 5.0,
+}
+
+
+class Recorder(TypedDict):
+    """
+    Liquidation recorder config option dictionary hint typing.
+    """
+
+    enabled: bool
+    directory: str
+    batch_size: int
+    flush_interval: float
+
+
+RECORDER_DEFAULTS: Recorder = {
+    "enabled": False,
+    "directory": "data/liquidations",
+    "batch_size": 1024,
+    "flush_interval": 1.0,
+}
+
+
+class Trades(TypedDict):
+    """
+    Trade exit levels config option dictionary hint typing.
+    """
+
+    take_profit: float
+    stop_loss: float
+
+
+TRADES_DEFAULTS: Trades = {
+    "take_profit": 0.6,
+    "stop_loss": -0.5,
+}
+
+
+class Journal(TypedDict):
+    """
+    Trade book persistence config option dictionary hint typing.
+    """
+
+    enabled: bool
+    directory: str
+    flush_interval: float
+    snapshot_interval: float
+    fsync: bool
+
+
+JOURNAL_DEFAULTS: Journal = {
+    "enabled": True,
+    "directory": "data/tradebook",
+    "flush_interval": 0.5,
+    "snapshot_interval": 60.0,
+    "fsync": True,
+}
+
+
+class Cache(TypedDict):
+    """
+    Cache bounds config option dictionary hint typing.
+    """
+
+    volume_engines: int
+    klines_maxsize: int
+    klines_ttl: float
+
+
+CACHE_DEFAULTS: Cache = {
+    "volume_engines": 500,
+    "klines_maxsize": 256,
+    "klines_ttl": 1.0,
+}
+
+
+class Sinks(TypedDict):
+    """
+    Alert sinks config option dictionary hint typing.
+    """
+
+    queue_size: int
+    console: bool
+    jsonl_path: str
+    socket_host: str
+    socket_port: int
+
+
+SINKS_DEFAULTS: Sinks = {
+    "queue_size": 1000,
+    "console": True,
+    "jsonl_path": None,
+    "socket_host": "127.0.0.1",
+    "socket_port": None,
+}
+
+
+class Metrics(TypedDict):
+    """
+    Metrics endpoint config option dictionary hint typing.
+    """
+
+    enabled: bool
+    host: str
+    port: int
+
+
+METRICS_DEFAULTS: Metrics = {
+    "enabled": True,
+    "host": "127.0.0.1",
+    "port": 9108,
+}
+
+
 class Config:
     """
     Configuration object based on configuration file.
@@ -23,6 +232,21 @@ class Config:
     zscore_timeframes: list
     zscore_lookback: int
     excluded_symbols: list
+    workers: int
+    coalesce_window: float
+    shards: int
+    exchange: Exchange
+    liquidation_stream: LiquidationStream
+    queue: Queue
+    discord_dispatcher: DiscordDispatcher
+    candles: Candles
+    mark_prices: MarkPrices
+    recorder: Recorder
+    trades: Trades
+    journal: Journal
+    cache: Cache
+    sinks: Sinks
+    metrics: Metrics
 
     def __init__(self, config_file: str) -> None:
         """
@@ -69,6 +293,63 @@ class Config:
                     self.excluded_symbols = config.get(
                         "excluded_symbols"
                     )
+                    self.workers = config.get(
+                        "workers", 4
+                    )
+                    self.coalesce_window = config.get(
+                        "coalesce_window", 0.25
+                    )
+                    self.shards = config.get(
+                        "shards", 1
+                    )
+                    self.exchange = {
+                        **EXCHANGE_DEFAULTS,
+                        **(config.get("exchange") or {})
+                    }
+                    self.liquidation_stream = {
+                        **LIQUIDATION_STREAM_DEFAULTS,
+                        **(config.get("liquidation_stream") or {})
+                    }
+                    self.queue = {
+                        **QUEUE_DEFAULTS,
+                        **(config.get("queue") or {})
+                    }
+                    self.candles = {
+                        **CANDLES_DEFAULTS,
+                        **(config.get("candles") or {})
+                    }
+                    self.mark_prices = {
+                        **MARK_PRICES_DEFAULTS,
+                        **(config.get("mark_prices") or {})
+                    }
+                    self.recorder = {
+                        **RECORDER_DEFAULTS,
+                        **(config.get("recorder") or {})
+                    }
+                    self.trades = {
+                        **TRADES_DEFAULTS,
+                        **(config.get("trades") or {})
+                    }
+                    self.journal = {
+                        **JOURNAL_DEFAULTS,
+                        **(config.get("journal") or {})
+                    }
+                    self.cache = {
+                        **CACHE_DEFAULTS,
+                        **(config.get("cache") or {})
+                    }
+                    self.sinks = {
+                        **SINKS_DEFAULTS,
+                        **(config.get("sinks") or {})
+                    }
+                    self.metrics = {
+                        **METRICS_DEFAULTS,
+                        **(config.get("metrics") or {})
+                    }
+                    self.discord_dispatcher = {
+                        **DISCORD_DISPATCHER_DEFAULTS,
+                        **(config.get("discord_dispatcher") or {})
+                    }
                 except (AttributeError, yaml.YAMLError) as e:
                     raise AttributeError(CONFIG_ERROR_MSG + f": {e}")
         except EnvironmentError:
@@ -92,5 +373,20 @@ class Config:
                 raise ValueError("Please provide Z-Score lookback value.")
             if self.zscore_timeframes is None:
                 raise ValueError("Please provide Z-Score timeframes.")
+            if not isinstance(self.workers, int) or self.workers < 1:
+                raise ValueError("Workers must be a positive whole number.")
+            if not isinstance(self.coalesce_window, (int, float)) or self.coalesce_window < 0:
+                raise ValueError("Coalesce window must be a number of seconds, 0 or more.")
+            if not isinstance(self.shards, int) or self.shards < 1:
+                raise ValueError("Shards must be a positive whole number.")
+            if not isinstance(self.liquidation_stream["connections"], int) \
+                    or self.liquidation_stream["connections"] < 1:
+                raise ValueError("Liquidation stream connections must be a positive whole number.")
+            if self.liquidation_stream["lifetime"] <= 0:
+                raise ValueError("Liquidation stream lifetime must be a positive number of seconds.")
+            if self.trades["take_profit"] <= 0 or self.trades["stop_loss"] >= 0:
+                raise ValueError("Trades take_profit must be positive and stop_loss negative.")
+            if self.queue["overflow"] not in ("block", "drop_smallest", "drop_oldest"):
+                raise ValueError("Queue overflow must be block, drop_smallest or drop_oldest.")
         except ValueError as e:
             raise ValueError(CONFIG_ERROR_MSG + f": {e}")
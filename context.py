@@ -0,0 +1,223 @@
+import locale
+import time
+from contextlib import contextmanager
+from functools import cached_property
+
+from tabulate import tabulate
+
+from config import Config
+from lib import acme, discord, exchange, pipeline, sinks
+from lib.cache import AsyncCache
+from lib.candles import CandleStore
+from lib.journal import TradeJournal
+from lib.markprice import MarkPriceFeed
+from lib.recorder import Recorder
+from lib.tradebook import TradeBook
+
+
+class AppContext:
+    """
+    The application's configuration and the components built from it.
+
+    Nothing is read, computed or opened when the context is created: the configuration is
+    parsed on first access, once, and every component is created the first time it is used.
+    Importing the application modules therefore does no I/O, so tests, benchmarks and shard
+    processes can import them freely and only pay for what they touch.
+
+    start() prepares the process for a run: the locale used for the alert currency format,
+    the exchange and Discord client settings and the ACME tables. Those phases, the journal
+    load and the components created by build() are timed, and report() lists the timings for
+    the startup profiling mode.
+    """
+
+    # Components created by build(), in order.
+    COMPONENTS = ("messages", "coalescer", "candles", "recorder", "volume_engines", "recent_klines",
+                  "alert_sinks", "trade_book", "mark_prices", "journal")
+
+    def __init__(self, config_file: str = "config.yaml") -> None:
+        """
+        Initialize the AppContext object.
+
+        :param config_file: Path of the configuration file.
+        """
+        self.config_file = config_file
+        self.timings = {}  # phase -> seconds, in the order the phases ran
+        self.started = False
+
+    @contextmanager
+    def timed(self, phase: str):
+        """
+        Adds the time spent in the block to a startup phase.
+
+        :param phase: Name of the phase.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - started
+
+    def report(self) -> str:
+        """
+        :return: Table of the time spent in each startup phase so far.
+        """
+        rows = [[phase, seconds * 1000] for phase, seconds in self.timings.items()]
+        rows.append(["total", sum(self.timings.values()) * 1000])
+        return tabulate(rows, headers=["Phase", "ms"], tablefmt="simple", floatfmt=".1f")
+
+    def start(self, tables: str = None) -> None:
+        """
+        Prepares the process to run: sets the currency locale, applies the client settings
+        and makes the ACME tables available. Calling it again does nothing.
+
+        :param tables: Name of a shared memory block with the ACME tables to attach to
+        instead of loading them, as shard processes do.
+        :return: None
+        """
+        if self.started:
+            return
+        conf = self.conf
+        with self.timed("locale"):
+            locale.setlocale(locale.LC_MONETARY, 'en_US.UTF-8')
+        with self.timed("clients"):
+            exchange.configure(**conf.exchange)
+            discord.configure(conf.discord_webhook, conf.discord_webhook_2, **conf.discord_dispatcher)
+        with self.timed("acme"):
+            if tables is not None:
+                acme.attach_tables(tables)
+            acme.ensure_init()
+        self.started = True
+
+    def build(self) -> None:
+        """
+        Creates every component now instead of on first use, timing each as its own phase.
+
+        :return: None
+        """
+        for name in self.COMPONENTS:
+            with self.timed(name):
+                getattr(self, name)
+
+    @cached_property
+    def conf(self) -> Config:
+        """
+        The configuration, read and validated on first access.
+        """
+        with self.timed("config"):
+            return Config(self.config_file)
+
+    @cached_property
+    def messages(self) -> pipeline.LiquidationQueue:
+        """
+        Liquidation queue between the coalescer and the workers.
+        """
+        return pipeline.LiquidationQueue(**self.conf.queue)
+
+    @cached_property
+    def coalescer(self) -> pipeline.CascadeCoalescer:
+        """
+        Merges each cascade's orders per symbol and side before they are queued.
+        """
+        return pipeline.CascadeCoalescer(self.messages, self.conf.coalesce_window)
+
+    @cached_property
+    def candles(self) -> CandleStore:
+        """
+        Live 1m candles for active symbols, feeding the volume Z-Score engines.
+        """
+        store = CandleStore(exchange.settings["stream_url"], **self.conf.candles)
+        store.add_listener(self.feed_volume_engine)
+        return store
+
+    @cached_property
+    def recorder(self):
+        """
+        Raw event log, None when disabled.
+        """
+        settings = self.conf.recorder
+        if not settings["enabled"]:
+            return None
+        return Recorder(settings["directory"], settings["batch_size"], settings["flush_interval"])
+
+    @cached_property
+    def volume_engines(self) -> AsyncCache:
+        """
+        Rolling volume Z-Score engine per symbol, stale once it stops being fed 1m updates.
+        """
+        return AsyncCache(self.conf.cache["volume_engines"], name="volume_engines",
+                          validate=lambda engine: engine.is_current(int(time.time() * 1000)))
+
+    @cached_property
+    def recent_klines(self) -> AsyncCache:
+        """
+        Recent REST 1m klines per symbol, for symbols without a streamed candle.
+        """
+        return AsyncCache(self.conf.cache["klines_maxsize"], ttl=self.conf.cache["klines_ttl"], name="klines",
+                          cacheable=bool)
+
+    @cached_property
+    def alert_sinks(self) -> sinks.Fanout:
+        """
+        Console, Discord, file and socket outputs of the alerts.
+        """
+        return sinks.from_config(self.conf.sinks, self.conf.discord_webhook_enabled)
+
+    @cached_property
+    def trade_book(self) -> TradeBook:
+        """
+        The open trades.
+        """
+        return TradeBook(**self.conf.trades)
+
+    @cached_property
+    def mark_prices(self):
+        """
+        Exits of the trade book on every pushed mark price, None when disabled.
+        """
+        settings = self.conf.mark_prices
+        if not settings["enabled"]:
+            return None
+        return MarkPriceFeed(exchange.settings["stream_url"], self.trade_book, settings["max_age"])
+
+    @cached_property
+    def journal(self):
+        """
+        Persistence of the trade book, None when disabled. Loaded with load_journal().
+        """
+        return self.shard_journal(None)
+
+    def shard_journal(self, shard: int = None):
+        """
+        :param shard: Index of a shard process, whose journal lives in a shard-N subdirectory.
+        :return: A trade journal in the configured directory, None when journaling is disabled.
+        """
+        settings = self.conf.journal
+        if not settings["enabled"]:
+            return None
+        directory = settings["directory"] if shard is None else f"{settings['directory']}/shard-{shard}"
+        return TradeJournal(directory, settings["flush_interval"], settings["snapshot_interval"], settings["fsync"])
+
+    def load_journal(self, journal) -> None:
+        """
+        Restores the trade book from a journal, timed as the journal phase.
+
+        :param journal: The journal, or None to do nothing.
+        :return: None
+        """
+        if journal is not None:
+            with self.timed("journal"):
+                journal.load(self.trade_book)
+
+    def feed_volume_engine(self, symbol: str, open_time: int, volume: float) -> None:
+        """
+        Passes a 1m candle update to the symbol's Z-Score engine, dropping the engine if it
+        missed a minute so the next volume_filter call seeds it again.
+
+        :param symbol: Symbol the candle belongs to.
+        :param open_time: Open time of the 1m candle in milliseconds.
+        :param volume: Volume of the candle so far.
+        :return: None
+        """
+        engine = self.volume_engines.peek(symbol)
+        if engine is not None and not engine.update(open_time, volume):
+            self.volume_engines.invalidate(symbol)
@@ -1,36 +1,78 @@
+import hashlib
 import json
+import os
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from multiprocessing import shared_memory
 from statistics import mean, stdev
 
 from requests import get
 
+# Constants iterated to build the frame.
+CONSTANTS = (1.32, 0.787, 1.1, 1.1494, 1.2346, 1.8786,
+             1.9453, 2.3571, 2.6149, 2.8017, 3.5327,
+             3.7396, 4.1245, 4.2817, 4.7494, 0.54325,
+             0.57596, 0.57722, 0.59017, 0.59635, 0.60793,
+             0.62432, 0.63092, 0.63212, 0.64341, 0.66016,
+             0.66132, 0.66171, 0.66274, 0.67823, 0.69315,
+             0.73908, 0.76422, 0.82248, 0.83463, 0.83565,
+             0.85074, 0.87059, 0.91596, 0.91894, 0.95532,
+             0.97027, 0.98943, 1.00743, 1.01494, 1.13199,
+             1.1547, 1.16803, 1.17628, 1.18657, 1.18745,
+             1.20207, 1.2337, 1.25992, 1.28243, 1.29129,
+             1.30358, 1.30568, 1.30638, 1.32472, 1.41421,
+             1.44225, 1.45136, 1.45607, 1.46708, 1.50659,
+             1.5396, 1.58496, 1.60667, 1.61803, 1.66169,
+             1.70521, 1.73205, 1.78723, 1.90216, 2.09455,
+             2.10974, 2.23606, 2.29317, 2.29559, 2.39996,
+             2.50291, 2.58498, 2.62206, 2.66514, 2.68545,
+             2.71828, 2.74724, 2.80777, 3.14159, 3.35989,
+             4.53236, 4.6692, 23.14609)
+# Every frame value is below this ceiling.
+FRAME_CEILING = 100
+# Price scales tried by get_scale, smallest first.
+SCALES = (0.000000000001, 0.00000000001, 0.0000000001,
+          0.000000001, 0.00000001, 0.0000001, 0.000001,
+          0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10, 100, 1000,
+          10000, 100000, 1000000, 10000000, 1000000000)
+# Binary cache of the computed frame and zone tables.
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".acme_cache.bin")
+CACHE_MAGIC = b"ACME"
+CACHE_VERSION = 1
+# Header of the shared-memory tables: magic, number of float64 sections.
+SHARED_HEADER = struct.Struct("<4sI")
+SHARED_MAGIC = b"ACMS"
+
 # Initiate Data Structures.
+frame = []
 gaps = []
 pnz_lg = {1: [], 2: [], 3: [], 4: [], 5: [], 6: [], 7: []}
 pnz_sm = {1: []}
+# Large zone levels reported by get_pnz, in lookup order.
+PNZ_LG_KEYS = (3, 4, 5)
+# Sorted zone boundaries for bisect lookups, built by build_zone_index().
+small_index = ([], [], [])
+large_index = {}
+# Whether the tables above have been computed or loaded.
+loaded = False
+# Shared memory block the tables are read from in a shard process, see attach_tables().
+_shared = None
 
 
 def init() -> None:
-    # Define constants for calculation.
-    frame_values = constant_frame(1.32, 0.787, 1.1, 1.1494, 1.2346, 1.8786,
-                                  1.9453, 2.3571, 2.6149, 2.8017, 3.5327,
-                                  3.7396, 4.1245, 4.2817, 4.7494, 0.54325,
-                                  0.57596, 0.57722, 0.59017, 0.59635, 0.60793,
-                                  0.62432, 0.63092, 0.63212, 0.64341, 0.66016,
-                                  0.66132, 0.66171, 0.66274, 0.67823, 0.69315,
-                                  0.73908, 0.76422, 0.82248, 0.83463, 0.83565,
-                                  0.85074, 0.87059, 0.91596, 0.91894, 0.95532,
-                                  0.97027, 0.98943, 1.00743, 1.01494, 1.13199,
-                                  1.1547, 1.16803, 1.17628, 1.18657, 1.18745,
-                                  1.20207, 1.2337, 1.25992, 1.28243, 1.29129,
-                                  1.30358, 1.30568, 1.30638, 1.32472, 1.41421,
-                                  1.44225, 1.45136, 1.45607, 1.46708, 1.50659,
-                                  1.5396, 1.58496, 1.60667, 1.61803, 1.66169,
-                                  1.70521, 1.73205, 1.78723, 1.90216, 2.09455,
-                                  2.10974, 2.23606, 2.29317, 2.29559, 2.39996,
-                                  2.50291, 2.58498, 2.62206, 2.66514, 2.68545,
-                                  2.71828, 2.74724, 2.80777, 3.14159, 3.35989,
-                                  4.53236, 4.6692, 23.14609
-                                  )
+    """
+    Computes the frame, gaps and zone tables from CONSTANTS and FRAME_CEILING, replacing any
+    tables already in memory.
+
+    :return: None
+    """
+    global loaded
+    frame_values = constant_frame(*CONSTANTS, ceiling=FRAME_CEILING)
+    frame[:] = frame_values
+    gaps.clear()
+    for zones in list(pnz_lg.values()) + list(pnz_sm.values()):
+        zones.clear()
 
     # Find the average gap between the lines created by constants being
     # iterated, then find the standard deviation of these gaps.
@@ -47,9 +89,10 @@ def init() -> None:
         for j in sorted(pnz_lg.keys(), reverse=True):
             if gap > average + (j * deviation):
                 pnz_lg[j].append((frame_values[i - 1], frame_values[i]))
+                members = set(pnz_lg[j])
                 for k in range(j - 1, 0, -1):
                     pnz_lg[k] = \
-                        [value for value in pnz_lg[k] if value not in pnz_lg[j]]
+                        [value for value in pnz_lg[k] if value not in members]
 
     # Populate pnz_sm dictionary with the relevant data
     for i in range(1, len(frame_values)):
@@ -57,8 +100,253 @@ def init() -> None:
         if gap < average - (1 * deviation):
             pnz_sm[1].append((frame_values[i - 1], frame_values[i]))
 
+    build_zone_index()
+    loaded = True
+
+
+def ensure_init(cache_file: str = CACHE_FILE) -> None:
+    """
+    Makes the frame and zone tables available, doing the work only on the first call.
+
+    The tables are read from the binary cache file when it was written for the current
+    CONSTANTS and FRAME_CEILING. Otherwise they are computed with init() and the cache file is
+    rewritten, so a change to the inputs rebuilds the cache automatically.
+
+    :param cache_file: Path of the binary cache file.
+    :return: None
+    """
+    if loaded:
+        return
+    if not load_cache(cache_file):
+        init()
+        save_cache(cache_file)
+
+
+def cache_key() -> bytes:
+    """
+    :return: SHA-256 digest of the inputs the tables are computed from.
+    """
+    return hashlib.sha256(repr((CONSTANTS, FRAME_CEILING, CACHE_VERSION)).encode()).digest()
+
+
+def save_cache(cache_file: str = CACHE_FILE) -> None:
+    """
+    Writes the tables in memory to a compact binary cache file.
+
+    The file holds a header (magic, version, input digest) followed by length-prefixed float64
+    sections: frame, gaps, pnz_sm[1] and each pnz_lg level, zones stored as flat lower/upper
+    pairs. It is written to a temporary file and renamed, so readers never see a partial file.
+    A failure to write is reported and otherwise ignored.
+
+    :param cache_file: Path of the binary cache file.
+    :return: None
+    """
+    sections = [frame, gaps, [v for zone in pnz_sm[1] for v in zone]]
+    sections += [[v for zone in pnz_lg[key] for v in zone] for key in sorted(pnz_lg)]
+    parts = [CACHE_MAGIC, struct.pack("<HH", CACHE_VERSION, len(sections)), cache_key()]
+    for values in sections:
+        parts.append(struct.pack("<I", len(values)))
+        parts.append(array("d", values).tobytes())
+    try:
+        temp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "wb") as stored_data:
+            stored_data.write(b"".join(parts))
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        print(f"Could not write ACME cache: {e}")
+
 
-def constant_frame(*consts: float) -> list:
+def load_cache(cache_file: str = CACHE_FILE) -> bool:
+    """
+    Loads the tables from the binary cache file written by save_cache.
+
+    :param cache_file: Path of the binary cache file.
+    :return: True if the tables were loaded, False if the file is missing, unreadable or was
+    written for different inputs.
+    """
+    global loaded
+    try:
+        with open(cache_file, "rb") as stored_data:
+            data = stored_data.read()
+    except OSError:
+        return False
+    header = struct.calcsize("<HH")
+    if data[:4] != CACHE_MAGIC or data[4 + header:36 + header] != cache_key():
+        return False
+    count = struct.unpack_from("<HH", data, 4)[1]
+    offset = 36 + header
+    sections = []
+    try:
+        for _ in range(count):
+            (length,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            values = array("d")
+            values.frombytes(data[offset:offset + 8 * length])
+            if len(values) != length:
+                return False
+            sections.append(values.tolist())
+            offset += 8 * length
+    except struct.error:
+        return False
+    if len(sections) != 3 + len(pnz_lg):
+        return False
+
+    frame[:] = sections[0]
+    gaps[:] = sections[1]
+    pnz_sm[1] = _pairs(sections[2])
+    for key, values in zip(sorted(pnz_lg), sections[3:]):
+        pnz_lg[key] = _pairs(values)
+    build_zone_index()
+    loaded = True
+    return True
+
+
+def _pairs(values: list) -> list:
+    """
+    :param values: Flat list of lower, upper, lower, upper... bounds.
+    :return: List of (lower, upper) tuples.
+    """
+    return list(zip(values[0::2], values[1::2]))
+
+
+def build_zone_index() -> None:
+    """
+    Builds the sorted boundary arrays used by small_zones_crossed and large_zone_containing.
+
+    Zones are pairs of consecutive frame values, so within each table both the lower and the
+    upper bounds are already in ascending order and never overlap. That lets a single bisect
+    on each bound array find every zone a price or a candle touches. Duplicate small zones are
+    dropped, keeping their first occurrence.
+
+    :return: None
+    """
+    global small_index
+    zones = list(dict.fromkeys(pnz_sm[1]))
+    small_index = (zones, [zone[0] for zone in zones], [zone[1] for zone in zones])
+    large_index.clear()
+    for key, zones in pnz_lg.items():
+        large_index[key] = (zones, [zone[0] for zone in zones], [zone[1] for zone in zones])
+
+
+class ZoneView:
+    """
+    Read-only sequence of (lower, upper) zones over two float64 buffers, used for tables that
+    live in shared memory. Indexing gives a tuple and slicing a list of tuples, like the
+    lists of zones it stands in for.
+    """
+
+    __slots__ = ("lowers", "uppers")
+
+    def __init__(self, lowers: memoryview, uppers: memoryview) -> None:
+        self.lowers = lowers
+        self.uppers = uppers
+
+    def __len__(self) -> int:
+        return len(self.lowers)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(self.lowers[index].tolist(), self.uppers[index].tolist()))
+        return self.lowers[index], self.uppers[index]
+
+    def __iter__(self):
+        return zip(self.lowers.tolist(), self.uppers.tolist())
+
+
+def _shared_sections() -> list:
+    """
+    :return: The tables placed in shared memory, in order: frame, gaps, the small zone index
+    bounds, then the lower and upper bounds of each large zone level.
+    """
+    zones, lowers, uppers = small_index
+    sections = [list(frame), list(gaps), list(lowers), list(uppers)]
+    for key in sorted(large_index):
+        _, key_lowers, key_uppers = large_index[key]
+        sections += [list(key_lowers), list(key_uppers)]
+    return sections
+
+
+def share_tables() -> shared_memory.SharedMemory:
+    """
+    Copies the frame and zone index tables into a new shared memory block, so shard processes
+    can use them through attach_tables() without computing or loading them again.
+
+    The block holds a header, the length of every section and then the float64 sections
+    themselves. The caller owns the block and should close() and unlink() it when the shard
+    processes are done.
+
+    :return: The shared memory block; pass its name to attach_tables().
+    """
+    ensure_init()
+    sections = _shared_sections()
+    head = SHARED_HEADER.pack(SHARED_MAGIC, len(sections)) + struct.pack(f"<{len(sections)}Q",
+                                                                       *map(len, sections))
+    data = b"".join([head] + [array("d", values).tobytes() for values in sections])
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return block
+
+
+def attach_tables(name: str) -> None:
+    """
+    Uses the tables published by share_tables() in place of computing them.
+
+    The frame, gaps and zone indexes become read-only views into the shared block; the zone
+    lookups then work on it directly. pnz_lg levels and pnz_sm[1] become ZoneView sequences,
+    the latter without the duplicate zones the index drops.
+
+    :param name: Name of the shared memory block.
+    :return: None
+    """
+    global _shared, small_index, frame, gaps, loaded
+    block = shared_memory.SharedMemory(name=name)
+    magic, count = SHARED_HEADER.unpack_from(block.buf)
+    if magic != SHARED_MAGIC:
+        block.close()
+        raise ValueError(f"Shared memory block {name} does not hold ACME tables.")
+    lengths = struct.unpack_from(f"<{count}Q", block.buf, SHARED_HEADER.size)
+    # The header and lengths are 8 bytes each, so every section starts 8-byte aligned.
+    offset = SHARED_HEADER.size + 8 * count
+    sections = []
+    for length in lengths:
+        sections.append(block.buf[offset:offset + 8 * length].cast("d"))
+        offset += 8 * length
+    frame, gaps = sections[0], sections[1]
+    small_index = (ZoneView(sections[2], sections[3]), sections[2], sections[3])
+    pnz_sm[1] = small_index[0]
+    large_index.clear()
+    for i, key in enumerate(sorted(pnz_lg)):
+        key_lowers, key_uppers = sections[4 + 2 * i], sections[5 + 2 * i]
+        pnz_lg[key] = ZoneView(key_lowers, key_uppers)
+        large_index[key] = (pnz_lg[key], key_lowers, key_uppers)
+    _shared = block
+    loaded = True
+
+
+def detach_tables() -> None:
+    """
+    Releases the views into the shared block and closes it, leaving the tables empty.
+
+    :return: None
+    """
+    global _shared, small_index, frame, gaps, loaded
+    if _shared is None:
+        return
+    views = [frame, gaps] + [view for zones in large_index.values() for view in zones[1:]] + list(small_index[1:])
+    frame, gaps = [], []
+    small_index = ([], [], [])
+    pnz_sm[1] = []
+    for key in pnz_lg:
+        pnz_lg[key] = []
+    large_index.clear()
+    for view in views:
+        view.release()
+    _shared.close()
+    _shared = None
+    loaded = False
+
+
+def constant_frame(*consts: float, ceiling: float = FRAME_CEILING) -> list:
     """
     Generates a sorted list of values based on the input constants.
     For each constant, it continues to incrementally add the constant to itself until
@@ -72,6 +360,8 @@ def constant_frame(*consts: float) -> list:
     to generate sequences of values. Each constant generates its own sequence, and all
     sequences are combined into a single sorted list.
 
+    :param ceiling: The limit the summed values stay below, 100 by default.
+
     :return: A sorted list of values, each value being the result of successively adding
     a constant to itself up to a limit of 100. Each constant produces its own sequence of
     values, and all these sequences are merged and sorted to produce the returned list.
@@ -92,9 +382,9 @@ def constant_frame(*consts: float) -> list:
     for const in consts:
         const_sequence = [const]
         const_added = const
-        while const_added < 100:
+        while const_added < ceiling:
             const_added += const
-            if const_added < 100:
+            if const_added < ceiling:
                 const_sequence.append(round(const_added, 5))
             else:
                 break
@@ -134,11 +424,7 @@ def get_scale(price: float) -> float:
     print(scale)  # Outputs: 1000
     ```
     """
-    scales = [0.000000000001, 0.00000000001, 0.0000000001,
-              0.000000001, 0.00000001, 0.0000001, 0.000001,
-              0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10, 100, 1000,
-              10000, 100000, 1000000, 10000000, 1000000000]
-    for scale in scales:
+    for scale in SCALES:
         if scale <= price < (scale * 100):
             return scale
     return 1
@@ -272,3 +558,66 @@ def through_pnz_small(bounds_list: list, candle_open: float, candle_close: float
         elif (candle_open < bounds[0]) and (candle_close > bounds[1]):
             return True
     return False
+
+
+def small_zones_crossed(candle_open: float, candle_close: float) -> list:
+    """
+    Returns every small zone (pnz_sm[1]) the candle has crossed through, in ascending order.
+
+    This gives the same zones as calling through_pnz_small([zone], candle_open, candle_close)
+    for each zone, but answers with two bisect lookups, O(log n), plus the size of the result.
+
+    :param candle_open: A float representing the opening price of the candlestick.
+
+    :param candle_close: A float representing the closing price of the candlestick.
+
+    :return: A list of (lower, upper) tuples crossed by the candle, without duplicates.
+    """
+    ensure_init()
+    zones, lowers, uppers = small_index
+    if candle_open > candle_close:
+        # Cross under: the zone lies entirely between the close and the open.
+        start = bisect_right(lowers, candle_close)
+        end = bisect_left(uppers, candle_open)
+    else:
+        # Cross over: the zone lies entirely between the open and the close.
+        start = bisect_right(lowers, candle_open)
+        end = bisect_left(uppers, candle_close)
+    return zones[start:end]
+
+
+def large_zone_containing(price: float, keys: tuple = PNZ_LG_KEYS):
+    """
+    Finds the large zone holding a price, checking the levels in the order given.
+
+    This gives the same result as calling price_within([zone], price) on each zone of
+    pnz_lg[key] for each key in turn, but with one bisect per level. Where two zones share a
+    boundary the lower zone is returned, as a linear scan would.
+
+    :param price: The price to be checked.
+
+    :param keys: The pnz_lg levels to check, in order.
+
+    :return: A (key, zone) tuple for the first level with a zone holding the price, or None.
+    """
+    ensure_init()
+    for key in keys:
+        zones, lowers, uppers = large_index[key]
+        i = bisect_left(uppers, price)
+        if i < len(zones) and lowers[i] <= price:
+            return key, zones[i]
+    return None
+
+
+def zone_hits(candles: list, keys: tuple = PNZ_LG_KEYS) -> list:
+    """
+    Batch variant of small_zones_crossed and large_zone_containing for many candles.
+
+    :param candles: A list of (open, close) tuples.
+
+    :param keys: The pnz_lg levels to check for the close, in order.
+
+    :return: A list with one (small zones crossed, large zone or None) tuple per candle.
+    """
+    return [(small_zones_crossed(candle_open, candle_close), large_zone_containing(candle_close, keys))
+            for candle_open, candle_close in candles]
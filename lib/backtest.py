@@ -0,0 +1,312 @@
+import argparse
+
+import numpy as np
+
+from . import acme
+from .tradebook import Side, TAKE_PROFIT, STOP_LOSS
+from .zscore import TIMEFRAME_MS, MINUTE_MS
+
+# Side codes used in event and result arrays.
+BUY = int(Side.BUY)
+SELL = int(Side.SELL)
+
+
+def get_scale(prices: np.ndarray) -> np.ndarray:
+    """
+    Vectorized acme.get_scale.
+
+    The scale of a price is the first entry of acme.SCALES with scale <= price < scale * 100,
+    or 1 if there is none, exactly as get_scale computes it for a single price.
+
+    :param prices: Array of prices.
+    :return: Array of scale factors.
+    """
+    scales = np.array(acme.SCALES, dtype=np.float64)
+    upper = np.array([scale * 100 for scale in acme.SCALES], dtype=np.float64)
+    idx = np.searchsorted(upper, prices, side="right")
+    clipped = np.minimum(idx, len(scales) - 1)
+    found = (idx < len(scales)) & (scales[clipped] <= prices)
+    return np.where(found, scales[clipped], 1.0)
+
+
+def zone_hits(scaled_open: np.ndarray, scaled_close: np.ndarray, keys: tuple = acme.PNZ_LG_KEYS) -> tuple:
+    """
+    Vectorized ACME zone test, matching get_pnz.
+
+    :param scaled_open: Array of scaled candle opens.
+    :param scaled_close: Array of scaled candle closes.
+    :param keys: The pnz_lg levels checked for the close, in order.
+    :return: Tuple of (number of small zones crossed, first large level holding the close or 0).
+    """
+    acme.ensure_init()
+    _, lowers, uppers = acme.small_index
+    lowers = np.asarray(lowers, dtype=np.float64)
+    uppers = np.asarray(uppers, dtype=np.float64)
+    low_price = np.minimum(scaled_open, scaled_close)
+    high_price = np.maximum(scaled_open, scaled_close)
+    # Zones lying strictly between the open and the close, as in acme.small_zones_crossed.
+    small = np.searchsorted(uppers, high_price, side="left") - np.searchsorted(lowers, low_price, side="right")
+    small = np.maximum(small, 0)
+
+    large = np.zeros(len(scaled_close), dtype=np.int8)
+    for key in reversed(keys):
+        _, key_lowers, key_uppers = acme.large_index[key]
+        if not key_lowers:
+            continue
+        key_lowers = np.asarray(key_lowers, dtype=np.float64)
+        key_uppers = np.asarray(key_uppers, dtype=np.float64)
+        i = np.searchsorted(key_uppers, scaled_close, side="left")
+        clipped = np.minimum(i, len(key_uppers) - 1)
+        inside = (i < len(key_uppers)) & (key_lowers[clipped] <= scaled_close)
+        large = np.where(inside, key, large)
+    return small, large
+
+
+def volume_zscores(minute_volume: np.ndarray, minutes: np.ndarray, timeframe: str, lookback: int,
+                   first_minute: int = 0) -> np.ndarray:
+    """
+    Vectorized volume_filter Z-Score for one symbol and timeframe.
+
+    For each event minute the window is the `lookback - 1` bars closed before the event's bar
+    plus the event's bar formed by the minutes closed before the event minute. The Z-Score is
+    the last closed bar against the window's mean and sample standard deviation, as in
+    volume_filter.
+
+    The event minute itself is left out: a recording only holds its final volume, most of
+    which may trade after the event. The forming bar is therefore a lower bound of the one
+    the live path sees, never a look at the future.
+
+    :param minute_volume: 1m volumes on a gap-free minute grid starting at a 4h boundary.
+    :param minutes: Grid index of the minute each event happened in.
+    :param timeframe: A key of zscore.TIMEFRAME_MS.
+    :param lookback: Candles per window, forming bar included.
+    :param first_minute: Grid index of the first recorded minute. Bars starting before it are
+    incomplete and left out of the window, as if the market had not existed yet.
+    :return: Array of Z-Scores, NaN where there is not enough data.
+    """
+    size = TIMEFRAME_MS[timeframe] // MINUTE_MS
+    bars = np.add.reduceat(minute_volume, np.arange(0, len(minute_volume), size))
+    # Shifting every value by a constant leaves the Z-Score unchanged and keeps the sums small.
+    shift = bars.mean() if len(bars) else 0.0
+    shifted = bars - shift
+    bar_sum = np.concatenate(([0.0], np.cumsum(shifted)))
+    bar_sum_sq = np.concatenate(([0.0], np.cumsum(shifted ** 2)))
+    minute_sum = np.concatenate(([0.0], np.cumsum(minute_volume)))
+
+    bar = minutes // size
+    first = np.maximum(bar - (lookback - 1), -(-first_minute // size))
+    count = np.maximum(bar - first, 0)
+    first = np.minimum(first, bar)
+    partial = minute_sum[minutes] - minute_sum[bar * size] - shift
+    total = bar_sum[bar] - bar_sum[first] + partial
+    mean = total / (count + 1)
+    m2 = bar_sum_sq[bar] - bar_sum_sq[first] + partial ** 2 - (count + 1) * mean ** 2
+    # A window of identical volumes has no deviation; cancellation can leave a tiny residue.
+    spread = m2 > 1e-12 * (bar_sum_sq[bar] - bar_sum_sq[first] + partial ** 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (shifted[np.maximum(bar - 1, 0)] - mean) / np.sqrt(m2 / count)
+    return np.where((count >= 1) & spread, z, np.nan)
+
+
+def first_crossing(table: list, start: np.ndarray, threshold: np.ndarray, above: bool) -> np.ndarray:
+    """
+    Finds, for many queries at once, the first index at or after `start` where the series
+    reaches the threshold, using binary lifting over a sparse table of range maxima/minima.
+
+    :param table: Sparse table, table[k][i] = max (or min) of series[i:i + 2 ** k].
+    :param start: First index each query may match.
+    :param threshold: Threshold per query.
+    :param above: True to find series >= threshold (max table), False for <= (min table).
+    :return: Index of the first match per query, len(series) where there is none.
+    """
+    n = len(table[0])
+    position = start.copy()
+    for level in range(len(table) - 1, -1, -1):
+        step = 1 << level
+        fits = position + step <= n
+        block = table[level][np.minimum(position, n - step)]
+        skip = fits & ((block < threshold) if above else (block > threshold))
+        position = np.where(skip, position + step, position)
+    return position
+
+
+def sparse_table(series: np.ndarray, reduce) -> list:
+    """
+    :param series: Array to index.
+    :param reduce: np.maximum or np.minimum.
+    :return: List of levels, level k holding reduce over each window of 2 ** k values.
+    """
+    table = [series]
+    step = 1
+    while step * 2 <= len(series):
+        previous = table[-1]
+        table.append(reduce(previous[:-step], previous[step:]))
+        step *= 2
+    return table
+
+
+def minute_grid(klines: np.ndarray) -> tuple:
+    """
+    Spreads 1m klines onto a gap-free minute grid starting at a 4h boundary, so every
+    timeframe's bars line up with the grid the way exchange bars line up with the epoch.
+
+    Missing minutes get zero volume and the previous close as open and close.
+
+    :param klines: Array of rows [open_time, open, close, volume], sorted by open time.
+    :return: Tuple of (grid start time in ms, index of the first kline on the grid, opens,
+    closes, volumes).
+    """
+    open_time = klines[:, 0].astype(np.int64)
+    start = int(open_time[0] - open_time[0] % TIMEFRAME_MS["4h"])
+    index = (open_time - start) // MINUTE_MS
+    length = int(index[-1]) + 1
+    present = np.zeros(length, dtype=bool)
+    present[index] = True
+    opens = np.zeros(length)
+    closes = np.zeros(length)
+    volumes = np.zeros(length)
+    opens[index] = klines[:, 1]
+    closes[index] = klines[:, 2]
+    volumes[index] = klines[:, 3]
+    # Forward fill the last close into empty minutes.
+    source = np.maximum.accumulate(np.where(present, np.arange(length), index[0]))
+    closes = closes[source]
+    opens = np.where(present, opens, closes)
+    return start, int(index[0]), opens, closes, volumes
+
+
+def run(events: dict, klines: dict, liquidation_filter: float, zscore_filter: float,
+        lookback: int, timeframes: list, excluded_symbols: list = (),
+        take_profit: float = TAKE_PROFIT, stop_loss: float = STOP_LOSS) -> dict:
+    """
+    Replays the ACME + volume Z-Score strategy over recorded liquidations and 1m klines.
+
+    The decisions follow process_event and market_exits: a liquidation above the value filter
+    takes the 1m candle it happened in, scales it with get_scale, checks the ACME zones as
+    get_pnz does, then enters against the liquidated side if any timeframe's volume Z-Score is
+    above the filter. Each entry exits at the first later 1m close whose gain reaches
+    `take_profit` or falls to `stop_loss` percent.
+
+    Everything is computed with array operations per symbol. Three approximations remain, all
+    from data the live path sees and a recording does not: the candle close is the 1m close
+    rather than the last trade at processing time, the volume traded in the event's minute
+    before the event is left out of the Z-Scores, and exits are checked on 1m closes instead
+    of every 3 seconds.
+
+    :param events: Dictionary of equal-length arrays: 'time' (ms), 'symbol' (str), 'side'
+    ('BUY'/'SELL' of the forced order), 'quantity' and 'price'.
+    :param klines: Dictionary of symbol to an array of rows [open_time, open, close, volume].
+    :param liquidation_filter: Liquidation value to exceed.
+    :param zscore_filter: Z-Score to exceed on at least one timeframe.
+    :param lookback: Candles per Z-Score window.
+    :param timeframes: Z-Score timeframes.
+    :param excluded_symbols: Symbols to ignore.
+    :param take_profit: Exit gain in percent.
+    :param stop_loss: Exit loss in percent (negative).
+    :return: Dictionary of per-event arrays ('filtered', 'scaled_open', 'scaled_close', 'pnz',
+    'zscores', 'entry', 'side', 'exit_time', 'gain') and the summed 'total_profit' of closed entries.
+    """
+    time = np.asarray(events["time"], dtype=np.int64)
+    symbols = np.asarray(events["symbol"])
+    quantity = np.asarray(events["quantity"], dtype=np.float64)
+    price = np.asarray(events["price"], dtype=np.float64)
+    forced_buy = np.asarray(events["side"]) == "BUY"
+    count = len(time)
+
+    filtered = (np.round(quantity * price, 2) > liquidation_filter) & ~np.isin(symbols, list(excluded_symbols))
+    scaled_open = np.full(count, np.nan)
+    scaled_close = np.full(count, np.nan)
+    pnz = np.zeros(count, dtype=bool)
+    zscores = np.full((count, len(timeframes)), np.nan)
+    entry = np.zeros(count, dtype=bool)
+    exit_time = np.full(count, -1, dtype=np.int64)
+    gain = np.full(count, np.nan)
+    # Liquidated buyers (forced SELL) are bought, liquidated sellers are sold.
+    side = np.where(forced_buy, SELL, BUY).astype(np.int8)
+
+    for symbol in np.unique(symbols[filtered]):
+        symbol_klines = klines.get(str(symbol))
+        if symbol_klines is None or len(symbol_klines) == 0:
+            continue
+        start, first_kline, opens, closes, volumes = minute_grid(np.asarray(symbol_klines, dtype=np.float64))
+        selected = np.flatnonzero(filtered & (symbols == symbol))
+        minutes = (time[selected] - start) // MINUTE_MS
+        inside = (minutes >= first_kline) & (minutes < len(closes))
+        selected, minutes = selected[inside], minutes[inside]
+
+        candle_open = opens[minutes]
+        candle_close = closes[minutes]
+        scale = get_scale(np.minimum(candle_open, candle_close))
+        scaled_open[selected] = candle_open / scale
+        scaled_close[selected] = candle_close / scale
+        small, large = zone_hits(scaled_open[selected], scaled_close[selected])
+        hit = (small > 0) | (large > 0)
+        pnz[selected] = hit
+
+        for column, timeframe in enumerate(timeframes):
+            zscores[selected, column] = volume_zscores(volumes, minutes, timeframe, lookback, first_kline)
+        with np.errstate(invalid="ignore"):
+            entered = hit & (zscores[selected] > zscore_filter).any(axis=1)
+        entry[selected] = entered
+
+        chosen = selected[entered]
+        if not len(chosen):
+            continue
+        entry_minute = minutes[entered]
+        entry_price = candle_close[entered]
+        long = side[chosen] == BUY
+        upper = np.where(long, entry_price * (1 + take_profit / 100), entry_price * (1 - stop_loss / 100))
+        lower = np.where(long, entry_price * (1 + stop_loss / 100), entry_price * (1 - take_profit / 100))
+        first = entry_minute + 1
+        up = first_crossing(sparse_table(closes, np.maximum), first, upper, above=True)
+        down = first_crossing(sparse_table(closes, np.minimum), first, lower, above=False)
+        exit_minute = np.minimum(up, down)
+        closed = exit_minute < len(closes)
+        exit_price = closes[np.minimum(exit_minute, len(closes) - 1)]
+        realised = np.where(long, (exit_price - entry_price) / entry_price, (entry_price - exit_price) / entry_price) * 100
+        exit_time[chosen] = np.where(closed, start + exit_minute * MINUTE_MS, -1)
+        gain[chosen] = np.where(closed, realised, np.nan)
+
+    return {
+        "filtered": filtered,
+        "scaled_open": scaled_open,
+        "scaled_close": scaled_close,
+        "pnz": pnz,
+        "zscores": zscores,
+        "entry": entry,
+        "side": side,
+        "exit_time": exit_time,
+        "gain": gain,
+        "total_profit": float(np.nansum(gain)),
+    }
+
+
+def main() -> None:
+    """
+    Command line entry point: python -m lib.backtest EVENTS.npz KLINES.npz
+
+    EVENTS.npz holds the arrays described in run(); KLINES.npz holds one array of 1m kline
+    rows per symbol, keyed by symbol. Filters come from the configuration file.
+    """
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Offline backtest of the ACME + Z-Score strategy.")
+    parser.add_argument("events", help="npz file of liquidation event arrays")
+    parser.add_argument("klines", help="npz file of 1m klines per symbol")
+    parser.add_argument("--config", default="config.yaml", help="configuration file")
+    args = parser.parse_args()
+
+    conf = Config(args.config)
+    with np.load(args.events) as events_file, np.load(args.klines) as klines_file:
+        events = {key: events_file[key] for key in events_file.files}
+        klines = {key: klines_file[key] for key in klines_file.files}
+    result = run(events, klines, conf.filters["liquidation"], conf.filters["zscore"],
+                 conf.zscore_lookback, conf.zscore_timeframes, conf.excluded_symbols)
+    exited = ~np.isnan(result["gain"])
+    print(f"Events: {len(result['entry'])}, passed filter: {int(result['filtered'].sum())}, "
+          f"ACME: {int(result['pnz'].sum())}, entries: {int(result['entry'].sum())}, "
+          f"exits: {int(exited.sum())}, total profit: {result['total_profit']:.2f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+
+class AsyncCache:
+    """
+    Bounded async cache with least-recently-used eviction, time-to-live expiry and
+    single-flight loading.
+
+    get() returns a cached value while it is fresh; otherwise it runs the loader. Callers
+    asking for a key that is already being loaded wait for that load instead of starting their
+    own, so a burst of requests for one key costs a single fetch. The load runs as its own task:
+    a caller that is cancelled does not cancel it for the others. A loader that raises caches
+    nothing and the exception reaches every waiting caller.
+
+    Hits, misses, coalesced waits and evictions are counted in stats() and, for a named cache,
+    in the acme_cache_* metrics.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None, name: str = None, validate=None,
+                 cacheable=None) -> None:
+        """
+        Initialize the AsyncCache object.
+
+        :param maxsize: Most entries kept; the least recently used entry is evicted beyond it.
+        :param ttl: Seconds an entry stays fresh, None for no expiry.
+        :param name: Name used for the metrics, None to leave the cache out of them.
+        :param validate: Optional callable; an entry for which validate(value) is false is stale.
+        :param cacheable: Optional callable; a loaded value for which cacheable(value) is false is
+        returned but not stored, e.g. an empty result of a failed request.
+        """
+        if maxsize < 1:
+            raise ValueError("Cache maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.validate = validate
+        self.cacheable = cacheable
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, expiry as monotonic time or None)
+        self._loading = {}  # key -> task of the load in flight
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        :return: Dictionary with the size, hits, misses, coalesced waits and evictions.
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+    def peek(self, key, default=None):
+        """
+        Returns a cached value that has not expired, without loading, validating or counting.
+
+        :param key: The key.
+        :param default: Returned when the key is missing or expired.
+        :return: The value or default.
+        """
+        entry = self._entries.get(key)
+        if entry is None or (entry[1] is not None and time.monotonic() >= entry[1]):
+            return default
+        return entry[0]
+
+    def put(self, key, value, ttl: float = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries beyond maxsize.
+
+        :param key: The key.
+        :param value: The value.
+        :param ttl: Seconds the value stays fresh, the cache's ttl if None.
+        :return: None
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._entries[key] = (value, None if ttl is None else time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            if self.name is not None:
+                metrics.CACHE_EVICTIONS.inc(self.name)
+
+    def invalidate(self, key) -> None:
+        """
+        Drops a key, so the next get() loads it again.
+
+        :param key: The key.
+        :return: None
+        """
+        self._entries.pop(key, None)
+
+    async def get(self, key, loader, ttl: float = None):
+        """
+        Returns the cached value of a key, loading it with `loader` when it is missing or stale.
+
+        :param key: The key.
+        :param loader: Coroutine function taking no arguments that produces the value.
+        :param ttl: Seconds the loaded value stays fresh, the cache's ttl if None.
+        :return: The value.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expiry = entry
+            if (expiry is None or time.monotonic() < expiry) and (self.validate is None or self.validate(value)):
+                self._entries.move_to_end(key)
+                self._count("hit")
+                return value
+            del self._entries[key]
+
+        task = self._loading.get(key)
+        if task is not None:
+            self._count("coalesced")
+        else:
+            self._count("miss")
+            task = self._loading[key] = asyncio.ensure_future(self._load(key, loader, ttl))
+            # Marks a failure as seen even if every caller was cancelled before it finished.
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, ttl: float):
+        try:
+            value = await loader()
+            if self.cacheable is None or self.cacheable(value):
+                self.put(key, value, ttl)
+            return value
+        finally:
+            del self._loading[key]
+
+    def _count(self, result: str) -> None:
+        if result == "hit":
+            self.hits += 1
+        elif result == "miss":
+            self.misses += 1
+        else:
+            self.coalesced += 1
+        if self.name is not None:
+            metrics.CACHE_REQUESTS.inc(self.name, result)
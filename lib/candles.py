@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from .streams import StreamClient
+
+# Index of each field in a stored candle.
+OPEN_TIME, OPEN, CLOSE, VOLUME, UPDATED = range(5)
+
+
+class CandleStore:
+    """
+    In-memory store of the current 1m candle per symbol, fed by kline websocket streams.
+
+    Symbols are subscribed when they are first tracked and unsubscribed once nothing has
+    asked for them for `idle_timeout` seconds. A candle that has not been updated for
+    `max_age` seconds, or any candle while the stream is disconnected, is treated as stale
+    and not returned, so callers fall back to REST.
+    """
+
+    def __init__(self, stream_url: str, max_age: float = 10.0, idle_timeout: float = 600.0,
+                 max_symbols: int = 200) -> None:
+        """
+        Initialize the CandleStore object.
+
+        :param stream_url: Base websocket URL of the exchange.
+        :param max_age: Seconds after which a candle without updates is stale.
+        :param idle_timeout: Seconds without track() calls before a symbol is unsubscribed.
+        :param max_symbols: Most symbols streamed at once; further symbols use REST only.
+        """
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.max_symbols = max_symbols
+        self.client = StreamClient(stream_url, self._on_message, on_disconnect=self._candles_clear)
+        self._candles = {}
+        self._last_used = {}
+        self._listeners = []
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a callable run on every kline update as listener(symbol, open_time, volume).
+
+        :param listener: The callable.
+        :return: None
+        """
+        self._listeners.append(listener)
+
+    def track(self, symbol: str) -> None:
+        """
+        Marks a symbol as in use, subscribing to its kline stream if it is not streamed yet.
+
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :return: None
+        """
+        if symbol not in self._last_used:
+            if len(self._last_used) >= self.max_symbols:
+                return
+            self.client.subscribe(self._stream(symbol))
+        self._last_used[symbol] = time.monotonic()
+
+    def get(self, symbol: str):
+        """
+        Returns the current 1m candle of a symbol if it is fresh.
+
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :return: List of [open_time, open, close, volume, updated] or None if missing or stale.
+        """
+        candle = self._candles.get(symbol)
+        if candle is None or time.monotonic() - candle[UPDATED] > self.max_age:
+            return None
+        return candle
+
+    async def run(self) -> None:
+        """
+        Runs the stream connection and unsubscribes idle symbols once a minute.
+        """
+        stream = asyncio.create_task(self.client.run())
+        try:
+            while True:
+                await asyncio.sleep(60)
+                cutoff = time.monotonic() - self.idle_timeout
+                for symbol in [s for s, used in self._last_used.items() if used < cutoff]:
+                    del self._last_used[symbol]
+                    self._candles.pop(symbol, None)
+                    self.client.unsubscribe(self._stream(symbol))
+        finally:
+            stream.cancel()
+
+    @staticmethod
+    def _stream(symbol: str) -> str:
+        return f"{symbol.lower()}@kline_1m"
+
+    def _candles_clear(self) -> None:
+        self._candles.clear()
+
+    def _on_message(self, stream: str, data: dict) -> None:
+        """
+        Stores a kline update and passes it to the listeners.
+
+        :param stream: Stream name.
+        :param data: Kline event payload.
+        :return: None
+        """
+        kline = data["k"]
+        symbol = data["s"]
+        open_time = int(kline["t"])
+        volume = float(kline["v"])
+        candle = self._candles.get(symbol)
+        if candle is not None and candle[OPEN_TIME] > open_time:
+            return
+        self._candles[symbol] = [open_time, float(kline["o"]), float(kline["c"]), volume, time.monotonic()]
+        for listener in self._listeners:
+            listener(symbol, open_time, volume)
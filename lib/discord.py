@@ -1,8 +1,282 @@
-import requests
+import asyncio
+import time
+from collections import deque
 
-from config import Config
+import aiohttp
 
-conf = Config("config.yaml")
+from . import metrics
+
+# Webhooks and dispatcher behaviour, set from the configuration by configure().
+settings = {
+    "webhook": None,
+    "webhook_2": None,
+    "max_queue": 1000,
+    "batch_window": 1.0,
+}
+# Discord rejects message content longer than this.
+MAX_CONTENT_LENGTH = 2000
+# Attempts made for one message before it is given up on.
+MAX_ATTEMPTS = 5
+# Delivery latencies kept for the reported average.
+LATENCY_SAMPLES = 100
+
+
+class _Message:
+    """
+    Outbound webhook message waiting in the dispatcher queue.
+    """
+
+    __slots__ = ("url", "content", "entry", "queued_at")
+
+    def __init__(self, url: str, content: str, entry: bool) -> None:
+        self.url = url
+        self.content = content
+        self.entry = entry
+        self.queued_at = time.monotonic()
+
+
+_queue = None  # Created on first use, sized by the max_queue setting.
+_session = None
+# Rate limit state learned from response headers.
+_webhook_buckets = {}  # webhook url -> bucket id
+_bucket_resets = {}  # bucket id -> monotonic time the bucket has capacity again
+_global_reset = 0.0
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+_counters = {"sent": 0, "dropped": 0, "failed": 0, "rate_limited": 0}
+# Callable taking (url, content, entry) that messages go to instead of the local queue.
+_forward = None
+
+
+def configure(webhook: str = None, webhook_2: str = None, max_queue: int = None,
+              batch_window: float = None) -> None:
+    """
+    Updates the dispatcher settings. Values left as None keep their current setting.
+
+    The queue size takes effect when the queue is created, so this should be called before
+    the first message is queued.
+
+    :param webhook: Webhook URL entry alerts are posted to.
+    :param webhook_2: Webhook URL trade book summaries and notices are posted to.
+    :param max_queue: Most messages waiting for delivery; further ones are dropped.
+    :param batch_window: Seconds entry alerts are gathered for before being sent together.
+    :return: None
+    """
+    for key, value in (("webhook", webhook), ("webhook_2", webhook_2), ("max_queue", max_queue),
+                       ("batch_window", batch_window)):
+        if value is not None:
+            settings[key] = value
+
+
+def _get_queue() -> asyncio.Queue:
+    """
+    :return: The dispatcher queue, created on first use.
+    """
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(settings["max_queue"])
+    return _queue
+
+
+def stats() -> dict:
+    """
+    Snapshot of the dispatcher state.
+
+    :return: Dictionary with the queue depth, delivery counters and the last and average
+    delivery latency in seconds, measured from queueing to Discord accepting the message.
+    """
+    return {
+        "depth": _queue.qsize() if _queue is not None else 0,
+        **_counters,
+        "latency_last": _latencies[-1] if _latencies else None,
+        "latency_avg": sum(_latencies) / len(_latencies) if _latencies else None,
+    }
+
+
+def forward_to(callback) -> None:
+    """
+    Hands every message to `callback` instead of this process's dispatcher. Shard processes
+    use it to pass their alerts to the coordinator, so a single dispatcher posts to Discord
+    and sees every rate limit.
+
+    :param callback: Callable taking the webhook URL, the content and the entry flag, or None
+    to dispatch locally again.
+    :return: None
+    """
+    global _forward
+    _forward = callback
+
+
+def enqueue(url: str, content: str, entry: bool = False) -> None:
+    """
+    Queues a message for the dispatcher without blocking the caller, e.g. one forwarded by
+    a shard process.
+
+    :param url: Webhook URL to post to.
+    :param content: Message content.
+    :param entry: True for entry alerts, which may be combined with other entry alerts.
+    :return: None
+    """
+    _enqueue(url, content, entry)
+
+
+def _enqueue(url: str, content: str, entry: bool = False) -> None:
+    """
+    Queues a message for the dispatcher without blocking the caller.
+
+    :param url: Webhook URL to post to.
+    :param content: Message content.
+    :param entry: True for entry alerts, which may be combined with other entry alerts.
+    :return: None
+    """
+    if _forward is not None:
+        _forward(url, content, entry)
+        return
+    try:
+        _get_queue().put_nowait(_Message(url, content, entry))
+    except asyncio.QueueFull:
+        _counters["dropped"] += 1
+        print("Discord queue full, message dropped.")
+
+
+async def run_dispatcher() -> None:
+    """
+    Background task delivering queued messages to Discord.
+
+    Messages are posted over one persistent session in the order they were queued. Entry
+    alerts for the same webhook that arrive within `batch_window` seconds of the first one
+    are combined into a single message, as long as the result fits Discord's content limit.
+    Rate limit bucket headers are tracked so requests wait for capacity instead of being
+    rejected, and a 429 response is retried after the Retry-After delay.
+    """
+    global _session
+    queue = _get_queue()
+    _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15))
+    pending = None
+    try:
+        while True:
+            first = pending or await queue.get()
+            pending = None
+            batch = [first]
+            if first.entry:
+                batch, pending = await _collect_entries(first)
+            await _deliver(first.url, _render(batch), batch)
+    finally:
+        await _session.close()
+
+
+async def _collect_entries(first: _Message) -> tuple:
+    """
+    Gathers further entry alerts for the same webhook within the batch window.
+
+    :param first: The entry alert that opened the batch.
+    :return: Tuple of the batched messages and the first message that did not fit, if any.
+    """
+    batch = [first]
+    queue = _get_queue()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings["batch_window"]
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return batch, None
+        try:
+            message = await asyncio.wait_for(queue.get(), remaining)
+        except asyncio.TimeoutError:
+            return batch, None
+        if not message.entry or message.url != first.url \
+                or len(_render(batch + [message])) > MAX_CONTENT_LENGTH:
+            return batch, message
+        batch.append(message)
+
+
+def _render(batch: list) -> str:
+    """
+    :param batch: Messages to send together.
+    :return: Content of the combined message.
+    """
+    if not batch[0].entry:
+        return batch[0].content
+    title = "**New Entry**" if len(batch) == 1 else f"**New Entries ({len(batch)})**"
+    return "\n".join([title] + [message.content for message in batch])
+
+
+async def _deliver(url: str, content: str, batch: list) -> None:
+    """
+    Posts one message to a webhook, waiting on rate limits and retrying on 429 and errors.
+
+    :param url: Webhook URL to post to.
+    :param content: Message content.
+    :param batch: The queued messages the content was built from, for latency tracking.
+    :return: None
+    """
+    global _global_reset
+    for attempt in range(MAX_ATTEMPTS):
+        now = time.monotonic()
+        wait = max(_global_reset, _bucket_resets.get(_webhook_buckets.get(url), 0.0)) - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            posted = time.monotonic()
+            async with _session.post(url, json={"content": content, "username": "ACME"}) as response:
+                _track_bucket(url, response.headers)
+                if response.status == 429:
+                    _counters["rate_limited"] += 1
+                    retry_after = await _retry_after(response)
+                    if response.headers.get("X-RateLimit-Global"):
+                        _global_reset = time.monotonic() + retry_after
+                    else:
+                        _bucket_resets[_webhook_buckets.get(url)] = time.monotonic() + retry_after
+                    continue
+                if response.status >= 400:
+                    print(f"Discord webhook returned {response.status}: {await response.text()}")
+                    if response.status < 500:
+                        break  # The request itself is rejected, retrying will not help.
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            print(err)
+            await asyncio.sleep(2 ** attempt)
+            continue
+        delivered = time.monotonic()
+        metrics.STAGE_SECONDS.observe(delivered - posted, "discord_post")
+        for message in batch:
+            _latencies.append(delivered - message.queued_at)
+        _counters["sent"] += len(batch)
+        return
+    _counters["failed"] += len(batch)
+    print("Discord message could not be delivered and was dropped.")
+
+
+def _track_bucket(url: str, headers) -> None:
+    """
+    Records the rate limit bucket state from Discord's response headers.
+
+    :param url: Webhook URL the response belongs to.
+    :param headers: Response headers.
+    :return: None
+    """
+    bucket = headers.get("X-RateLimit-Bucket")
+    if bucket is not None:
+        _webhook_buckets[url] = bucket
+    remaining = headers.get("X-RateLimit-Remaining")
+    reset_after = headers.get("X-RateLimit-Reset-After")
+    if remaining is not None and reset_after is not None:
+        if int(remaining) == 0:
+            _bucket_resets[_webhook_buckets.get(url)] = time.monotonic() + float(reset_after)
+        else:
+            _bucket_resets.pop(_webhook_buckets.get(url), None)
+
+
+async def _retry_after(response: aiohttp.ClientResponse) -> float:
+    """
+    :param response: A 429 response.
+    :return: Seconds to wait before retrying, from the body or the Retry-After header.
+    """
+    try:
+        body = await response.json(content_type=None)
+        return float(body["retry_after"])
+    except (ValueError, KeyError, TypeError, aiohttp.ContentTypeError):
+        return float(response.headers.get("Retry-After", 1))
 
 
 def send_dictionary_to_channel(dictionary, total_profit):
@@ -11,12 +285,12 @@ def send_dictionary_to_channel(dictionary, total_profit):
     net_profit = 0  # Initialize net profit
     for symbol, entries in dictionary.items():
         lines.append(symbol)
-        for entry, data in entries.items():
-            entry_num = entry.split('_')[1]  # Extract entry number from 'entry_X'
-            side = data['side']  # Simplify side
-            entry_price = round(data['entry_price'], 2)  # Round to 2 decimal places
-            market_price = round(data['market_price'], 2)  # Round to 2 decimal places
-            gain = round(data['percentage_gain'], 2)  # Round gain to 2 decimal places
+        # Entries are (entry price, market price, percentage gain, side), as TradeBook.performance gives them
+        for entry_num, (entry_price, market_price, gain, side) in enumerate(entries, start=1):
+            side = side.label  # Simplify side
+            entry_price = round(entry_price, 2)  # Round to 2 decimal places
+            market_price = round(market_price, 2)  # Round to 2 decimal places
+            gain = round(gain, 2)  # Round gain to 2 decimal places
             net_profit += gain  # Add gain to net profit
             # Add emoji based on gain
             emoji = '🟩' if gain > 0 else '🟥' if gain < 0 else '🟧'
@@ -36,45 +310,17 @@ def send_dictionary_to_channel(dictionary, total_profit):
     # Combine all lines into a single string, with line breaks between lines
     message = "\n".join(lines)
 
-    # Send the message
-    result = requests.post(conf.discord_webhook_2, json={
-        "content": f"```\n{message}\n```",  # Surrounding the message with backticks for code block formatting in Discord
-        "username": "ACME"
-    })
-
-    try:
-        result.raise_for_status()
-    except requests.exceptions.HTTPError as err:
-        print(err)
-
-
-
+    # Queue the message, surrounded with backticks for code block formatting in Discord
+    _enqueue(settings["webhook_2"], f"```\n{message}\n```")
 
 
 def send_simple_message_to_channel(message):
-    result = requests.post(conf.discord_webhook_2, json={
-        "content": message,
-        "username": "ACME"
-    })
-
-    try:
-        result.raise_for_status()
-    except requests.exceptions.HTTPError as err:
-        print(err)
+    _enqueue(settings["webhook_2"], message)
 
 
 def send_to_channel(zs_table, table, confirmation):
     content = ("\n" + "-" * 65 + "\n").join([zs_table, table])
-
-    result = requests.post(conf.discord_webhook, json={
-        "content": f"**New Entry**\n```{content}\n\n{confirmation}```",
-        "username": "ACME"
-    })
-
-    try:
-        result.raise_for_status()
-    except requests.exceptions.HTTPError as err:
-        print(err)
+    _enqueue(settings["webhook"], f"```{content}\n\n{confirmation}```", entry=True)
 
 
 # def send_trade_book(dictionary):
@@ -0,0 +1,90 @@
+import json
+
+try:
+    # Optional, noticeably faster decoder; the standard library is used when it is missing.
+    from orjson import loads
+except ImportError:
+    loads = json.loads
+
+
+def _decimals(text: str) -> int:
+    """
+    :return: Number of decimal places written in a number string.
+    """
+    point = text.find(".")
+    return 0 if point < 0 else len(text) - point - 1
+
+
+class LiquidationEvent:
+    """
+    One liquidation order, decoded once from a forceOrder message.
+
+    Only the fields the processor uses are kept. Quantity and price are parsed to floats a
+    single time; the original strings are kept as well, since they are what the alert shows.
+
+    An event can also stand for several orders of one symbol and side merged with absorb():
+    the quantity and value are then totals, the price is the volume-weighted average, `count`
+    is the number of orders and `max_value` the value of the largest one.
+    """
+
+    __slots__ = ("symbol", "side", "quantity", "price", "value", "quantity_text", "price_text",
+                 "trade_time", "event_time", "count", "max_value")
+
+    def __init__(self, symbol: str, side: str, quantity_text: str, price_text: str,
+                 trade_time: int, event_time: int = None) -> None:
+        """
+        Initialize the LiquidationEvent object.
+
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :param side: Side of the liquidation order, 'BUY' or 'SELL'.
+        :param quantity_text: Original quantity as sent by the exchange.
+        :param price_text: Price as sent by the exchange.
+        :param trade_time: Order trade time in milliseconds.
+        :param event_time: Event time in milliseconds, the trade time if not given.
+        """
+        self.symbol = symbol
+        self.side = side
+        self.quantity_text = quantity_text
+        self.price_text = price_text
+        self.quantity = float(quantity_text)
+        self.price = float(price_text)
+        self.value = self.quantity * self.price
+        self.trade_time = trade_time
+        self.event_time = trade_time if event_time is None else event_time
+        self.count = 1
+        self.max_value = self.value
+
+    def absorb(self, other: "LiquidationEvent") -> None:
+        """
+        Merges another order of the same symbol and side into this event.
+
+        The texts are rewritten with as many decimals as the exchange used, and the times
+        become those of the latest order.
+
+        :param other: The order to merge.
+        :return: None
+        """
+        self.quantity += other.quantity
+        self.value += other.value
+        self.price = self.value / self.quantity if self.quantity else other.price
+        quantity_decimals = max(_decimals(self.quantity_text), _decimals(other.quantity_text))
+        price_decimals = max(_decimals(self.price_text), _decimals(other.price_text))
+        self.quantity_text = f"{self.quantity:.{quantity_decimals}f}"
+        self.price_text = f"{self.price:.{price_decimals}f}"
+        self.trade_time = max(self.trade_time, other.trade_time)
+        self.event_time = max(self.event_time, other.event_time)
+        self.count += other.count
+        self.max_value = max(self.max_value, other.max_value)
+
+    @classmethod
+    def from_message(cls, message: dict) -> "LiquidationEvent":
+        """
+        :param message: A decoded forceOrder message, with its "E" event time and "o" order.
+        :return: The liquidation event.
+        """
+        order = message["o"]
+        return cls(order["s"], order["S"], order["q"], order["p"], order["T"], message.get("E"))
+
+    def __repr__(self) -> str:
+        orders = f", {self.count} orders" if self.count > 1 else ""
+        return f"LiquidationEvent({self.symbol} {self.side} {self.quantity_text} @ {self.price_text}{orders})"
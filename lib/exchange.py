@@ -1,38 +1,443 @@
-from requests import get
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
 
+import aiohttp
 
-async def fetch_kline(parameters: dict) -> dict:
+from . import metrics
+from .cache import AsyncCache
+
+# Client settings, overridden from the configuration file through configure().
+settings = {
+    "rest_url": "https://fapi.binance.com",
+    "stream_url": "wss://fstream.binance.com",
+    "timeout": 10.0,
+    "max_concurrency": 16,
+    "max_retries": 3,
+    "weight_limit": 2400,
+    "background_share": 0.8,
+}
+# Request priority lanes: entry-path fetches are served before background polling.
+ENTRY = 0
+BACKGROUND = 1
+LANE_NAMES = {ENTRY: "entry", BACKGROUND: "background"}
+# Seconds over which the exchange counts request weight.
+WEIGHT_WINDOW = 60.0
+# Response header with the weight used in the current window.
+USED_WEIGHT_HEADER = "X-MBX-USED-WEIGHT-1M"
+# HTTP statuses worth retrying: rate limited, IP banned (418) and server side.
+RETRY_STATUSES = {418, 429, 500, 502, 503, 504}
+# Base delay in seconds for the exponential retry backoff.
+RETRY_BASE_DELAY = 0.25
+# Seconds an all-symbols price snapshot is reused for.
+PRICE_SNAPSHOT_TTL = 1.0
+# Seconds the last good snapshot keeps being served while refreshes fail, a few polling
+# cycles; after that no prices are returned rather than exiting trades on old ones.
+PRICE_SNAPSHOT_MAX_STALE = 10.0
+
+_session = None
+_semaphore = None
+_limiter = None
+# Part of the address's weight budget this process uses, set by share_weight().
+_weight_share = 1.0
+# All-symbols price snapshot, and the last one fetched successfully with its monotonic fetch time.
+_price_snapshots = AsyncCache(maxsize=1, ttl=PRICE_SNAPSHOT_TTL, name="price_snapshot")
+_last_prices = ({}, 0.0)
+
+
+def configure(rest_url: str = None, stream_url: str = None, timeout: float = None,
+              max_concurrency: int = None, max_retries: int = None, weight_limit: int = None,
+              background_share: float = None) -> None:
     """
-    Fetch data from a specified URL, using provided parameters and headers. This function sends an
-    asynchronous HTTP GET request to the URL, using the parameters and headers to customize the request.
-    Upon receiving the response, it converts the JSON response content into a Python dictionary and returns it.
+    Updates the REST client settings. Values left as None keep their current setting.
 
-    This function is an essential building block for any program that interacts with web APIs. By packaging
-    the request sending and response processing into a single function, it simplifies the process of fetching
-    data from a web API.
+    Settings take effect the next time the shared session is created, so this should be
+    called before the first request is made (or after close()).
 
-    :param url: A string that represents the URL to which the HTTP GET request will be sent. This should be
-    the endpoint of the web API that you want to interact with.
+    :param rest_url: Base URL of the futures REST API, e.g. a local stub for offline runs.
+    :param stream_url: Base URL of the futures websocket streams.
+    :param timeout: Total seconds allowed for a single request attempt.
+    :param max_concurrency: Number of requests allowed in flight at the same time.
+    :param max_retries: Number of attempts made after the first one before giving up.
+    :param weight_limit: Request weight the exchange allows per minute.
+    :param background_share: Fraction of the weight budget background requests may use; the
+    rest is kept for entry-path requests.
+    :return: None
+    """
+    for key, value in (("rest_url", rest_url), ("stream_url", stream_url), ("timeout", timeout),
+                       ("max_concurrency", max_concurrency), ("max_retries", max_retries),
+                       ("weight_limit", weight_limit), ("background_share", background_share)):
+        if value is not None:
+            settings[key] = value
+    settings["rest_url"] = settings["rest_url"].rstrip("/")
+    settings["stream_url"] = settings["stream_url"].rstrip("/")
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Returns the shared keep-alive session, creating it on first use.
+
+    All requests go through one session so TCP and TLS connections to the exchange are
+    pooled and reused rather than opened per request. The connection pool is sized to the
+    concurrency limit.
+
+    :return: The shared aiohttp.ClientSession.
+    """
+    global _session, _semaphore, _limiter
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=settings["max_concurrency"], keepalive_timeout=60)
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings["timeout"]),
+        )
+        _semaphore = asyncio.Semaphore(settings["max_concurrency"])
+        # The limiter outlives sessions, so a reconnect keeps the used weight and any ban pause.
+        if _limiter is None:
+            _limiter = WeightLimiter(settings["weight_limit"], WEIGHT_WINDOW, settings["background_share"],
+                                     _weight_share)
+        else:
+            _limiter.resize(settings["weight_limit"], settings["background_share"], _weight_share)
+    return _session
+
+
+def share_weight(share: float) -> None:
+    """
+    Limits this process to a share of the request weight budget, for processes that send
+    requests from the same IP address, such as shard processes.
+
+    :param share: Fraction of the weight limit this process may use, e.g. 1 / shards.
+    :return: None
+    """
+    global _weight_share
+    _weight_share = share
+    if _limiter is not None:
+        _limiter.resize(settings["weight_limit"], settings["background_share"], share)
+
+
+def limiter() -> "WeightLimiter":
+    """
+    :return: The request weight limiter, created with the shared session.
+    """
+    get_session()
+    return _limiter
 
-    :param parameters: A dictionary of key-value pairs that will be sent as query parameters in the HTTP GET
-    request. These can be used to customize the request based on the API's specifications. For example,
-    parameters could be used to specify the data that you want to receive from the API.
 
-    :return: A dictionary that represents the JSON content of the HTTP GET request's response. This dictionary
-    can then be used in your program to interact with the data that the API returned.
+class WeightLimiter:
+    """
+    Token bucket over the exchange's request weight, with priority lanes.
+
+    The bucket holds up to `limit` weight and refills at `limit` per `window` seconds. A request
+    takes its weight from the bucket before it is sent and waits while there is not enough.
+    Waiting requests are served strictly in lane order, first come first served within a lane,
+    so entry-path requests overtake queued background polling. Background requests may also
+    only use `background_share` of the budget, which keeps room for entries in a burst.
+
+    The exchange's own count is authoritative: every response's used-weight header pulls the
+    bucket down to what is actually left, and a rate limit or ban response empties it until
+    the Retry-After time, pausing every lane. Requests are delayed, never failed.
+
+    Processes sharing an IP address each take a `share` of the exchange's limit. The header
+    counts the weight of the whole address, so it is scaled by the share before it lowers the
+    bucket: together the processes can still use the full limit.
+    """
+
+    def __init__(self, limit: int, window: float = WEIGHT_WINDOW, background_share: float = 0.8,
+                 share: float = 1.0) -> None:
+        """
+        Initialize the WeightLimiter object.
+
+        :param limit: Weight the exchange allows per window.
+        :param window: Window length in seconds.
+        :param background_share: Fraction of the budget background requests may use.
+        :param share: Fraction of the limit this limiter's process may use.
+        """
+        self.share = share
+        self.limit = limit * share
+        self.rate = self.limit / window
+        self.reserve = self.limit * (1 - background_share)
+        self.tokens = float(self.limit)
+        self.waited = 0
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (lane, sequence, weight, future)
+        self._sequence = itertools.count()
+        self._timer = None
+
+    def resize(self, limit: int, background_share: float, share: float = 1.0) -> None:
+        """
+        Changes the budget, keeping the weight already used and any pause in effect.
+
+        :param limit: Weight the exchange allows per window.
+        :param background_share: Fraction of the budget background requests may use.
+        :param share: Fraction of the limit this limiter's process may use.
+        :return: None
+        """
+        self._refill()
+        budget = limit * share
+        self.rate = self.rate * budget / self.limit
+        self.share = share
+        self.limit = budget
+        self.reserve = budget * (1 - background_share)
+        self.tokens = min(self.tokens, float(budget))
+
+    def available(self) -> float:
+        """
+        :return: Weight currently left in the bucket.
+        """
+        self._refill()
+        return self.tokens
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.limit, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
 
-    Note: The function is asynchronous and should be awaited when called. This means that it will not block
-    the rest of your program while it waits for the HTTP GET request to be sent and the response to be received.
+    def _floor(self, lane: int) -> float:
+        return 0.0 if lane == ENTRY else self.reserve
+
+    async def acquire(self, weight: int, lane: int = ENTRY) -> None:
+        """
+        Waits until the bucket has `weight` to spare for the lane, then takes it.
+
+        :param weight: Request weight.
+        :param lane: ENTRY or BACKGROUND.
+        :return: None
+        """
+        weight = min(weight, self.limit - self._floor(lane))
+        self._refill()
+        if not self._waiters and self.tokens - self._floor(lane) >= weight:
+            self.tokens -= weight
+            return
+        self.waited += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._sequence), weight, future))
+        self._grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.tokens += weight  # Granted just as the caller went away.
+            self._grant()
+            raise
+
+    def _grant(self) -> None:
+        """
+        Hands out weight to the waiters in lane order, and schedules itself for when the first
+        one still waiting can be served.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            lane, _, weight, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            deficit = weight + self._floor(lane) - self.tokens
+            if deficit > 0:
+                self._timer = asyncio.get_running_loop().call_later(deficit / self.rate, self._grant)
+                return
+            heapq.heappop(self._waiters)
+            self.tokens -= weight
+            future.set_result(None)
+
+    def observe(self, used: int) -> None:
+        """
+        Lowers the bucket to this process's share of the weight the exchange reports as left
+        in its window.
+
+        :param used: Weight the exchange counts as used by the whole address.
+        :return: None
+        """
+        self._refill()
+        self.tokens = min(self.tokens, self.limit - used * self.share)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Empties the bucket for `seconds`, after a rate limit or ban response.
+
+        :param seconds: Seconds until the exchange accepts requests again.
+        :return: None
+        """
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def request_weight(path: str, parameters: dict = None) -> int:
+    """
+    Request weight the exchange charges for an endpoint.
+
+    :param path: Endpoint path, e.g. '/fapi/v1/klines'.
+    :param parameters: Query parameters of the request.
+    :return: The weight.
+    """
+    parameters = parameters or {}
+    if path == "/fapi/v1/klines":
+        limit = int(parameters.get("limit", 500))
+        return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+    if path in ("/fapi/v1/ticker/price", "/fapi/v2/ticker/price"):
+        return 1 if "symbol" in parameters else 2
+    return 1
+
+
+async def close() -> None:
+    """
+    Closes the shared session and its pooled connections.
+
+    :return: None
+    """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def _retry_after(value: str):
+    """
+    :param value: A Retry-After header, in seconds or as an HTTP date.
+    :return: Seconds to wait, or None if the header cannot be understood.
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff delay for the given retry attempt.
+
+    :param attempt: Zero-based retry attempt number.
+    :return: Seconds to wait before the next attempt.
+    """
+    return random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt))
+
+
+async def get_json(path: str, parameters: dict = None, lane: int = ENTRY):
+    """
+    Sends a GET request to the exchange REST API and returns the decoded JSON body.
+
+    Requests share a pooled session and are limited to `max_concurrency` in flight. Every
+    attempt first takes its request weight from the weight limiter in the given lane. Timeouts,
+    connection errors and retryable statuses (429, 418, 5xx) are retried up to `max_retries`
+    times with jittered exponential backoff, honouring a Retry-After header when the exchange
+    sends one. Any other error status is not retried.
+
+    :param path: Endpoint path relative to the REST base URL, e.g. '/fapi/v1/klines'.
+    :param parameters: Query parameters for the request.
+    :param lane: Priority lane of the request, ENTRY or BACKGROUND.
+    :return: The decoded JSON body, or None if the request failed.
+    """
+    session = get_session()
+    weight = request_weight(path, parameters)
+    for attempt in range(settings["max_retries"] + 1):
+        delay = _backoff(attempt)
+        started = time.perf_counter()
+        await _limiter.acquire(weight, lane)
+        metrics.REST_WEIGHT_WAIT_SECONDS.observe(time.perf_counter() - started, LANE_NAMES[lane])
+        try:
+            async with _semaphore:
+                async with session.get(settings["rest_url"] + path, params=parameters) as response:
+                    metrics.REST_REQUESTS.inc(path, str(response.status))
+                    used = response.headers.get(USED_WEIGHT_HEADER)
+                    if used is not None and used.isdigit():
+                        _limiter.observe(int(used))
+                    if response.status < 400:
+                        return await response.json(content_type=None)
+                    if response.status not in RETRY_STATUSES:
+                        print(f"Request to {path} failed with status {response.status}: "
+                              f"{await response.text()}")
+                        return None
+                    retry_after = _retry_after(response.headers.get("Retry-After", ""))
+                    if retry_after is not None:
+                        delay = max(delay, retry_after)
+                        if response.status in (418, 429):
+                            _limiter.pause(retry_after)
+                    error = f"status {response.status}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.REST_REQUESTS.inc(path, "error")
+            error = repr(e)
+        if attempt < settings["max_retries"]:
+            await asyncio.sleep(delay)
+    print(f"Request to {path} failed after {settings['max_retries'] + 1} attempts: {error}")
+    return None
+
+
+async def fetch_kline(parameters: dict, lane: int = ENTRY) -> list:
+    """
+    Fetch candlestick (kline) data from the futures REST API. This function sends a non-blocking
+    HTTP GET request through the shared connection pool and returns the decoded JSON response.
+
+    Calls made concurrently (e.g. through asyncio.gather) genuinely overlap, up to the configured
+    concurrency limit, and the event loop keeps serving other tasks such as the liquidation
+    websocket while a request is in flight.
+
+    :param parameters: A dictionary of key-value pairs that will be sent as query parameters in the HTTP GET
+    request, for example {'symbol': 'BTCUSDT', 'interval': '1m', 'limit': 1}.
+    :param lane: Priority lane of the request; klines are fetched on the entry path by default.
+
+    :return: A list of klines as returned by the exchange. An empty list is returned if the request
+    failed after all retries, so callers should check for empty data.
 
     Example usage:
 
     ```
-    data = await fetch_data(
-        'https://api.example.com/data',
-        {'param1': 'value1', 'param2': 'value2'},
-        {'Authorization': 'Bearer example_token'}
-    )
+    data = await fetch_kline({'symbol': 'BTCUSDT', 'interval': '1m', 'limit': 1})
     ```
     """
-    response = get('https://fapi.binance.com/fapi/v1/klines', params=parameters)
-    return response.json()
+    data = await get_json('/fapi/v1/klines', parameters, lane)
+    return data if isinstance(data, list) else []
+
+
+async def fetch_ticker_prices(lane: int = BACKGROUND) -> dict:
+    """
+    Fetch the latest traded price of every futures symbol in a single request.
+
+    :param lane: Priority lane of the request; price polling is background work by default.
+    :return: Dictionary of symbol to price. Empty if the request failed.
+    """
+    data = await get_json('/fapi/v1/ticker/price', lane=lane)
+    if not isinstance(data, list):
+        return {}
+    prices = {}
+    for ticker in data:
+        try:
+            prices[ticker["symbol"]] = float(ticker["price"])
+        except (KeyError, TypeError, ValueError):
+            continue  # Skip a malformed entry rather than losing the whole snapshot.
+    return prices
+
+
+async def price_snapshot(max_age: float = PRICE_SNAPSHOT_TTL, lane: int = BACKGROUND) -> dict:
+    """
+    All-symbols price snapshot shared between callers.
+
+    The snapshot is fetched with one request and reused for `max_age` seconds, so the cost of
+    pricing any number of symbols stays at one request per interval. Concurrent callers wait
+    for the same fetch instead of issuing their own. A failed refresh keeps serving the
+    previous snapshot for up to PRICE_SNAPSHOT_MAX_STALE seconds after it was fetched, and
+    then nothing, so an outage never prices trades from minutes-old data.
+
+    :param max_age: Seconds a fetched snapshot is reused for.
+    :param lane: Priority lane of a refresh.
+    :return: Dictionary of symbol to price, empty when no recent snapshot is available.
+    """
+    async def refresh() -> dict:
+        global _last_prices
+        fresh = await fetch_ticker_prices(lane)
+        if fresh:
+            _last_prices = (fresh, time.monotonic())
+            return fresh
+        prices, fetched_at = _last_prices
+        if time.monotonic() - fetched_at > PRICE_SNAPSHOT_MAX_STALE:
+            return {}
+        return prices
+
+    return await _price_snapshots.get("all", refresh, ttl=max_age)
@@ -0,0 +1,355 @@
+import asyncio
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from . import metrics
+from .tradebook import Side, TradeBook
+
+# Record kinds.
+OPEN = 1
+EXIT = 2
+# Every record is framed as (payload length, CRC-32 of the payload) followed by the payload.
+FRAME = struct.Struct("<HI")
+OPEN_RECORD = struct.Struct("<Bqdb")  # kind, entry id, entry price, side; then the symbol
+EXIT_RECORD = struct.Struct("<Bqd")  # kind, entry id, gain; then the symbol
+# Magic, version, generation, next entry id, total profit, entries, symbol table bytes, body CRC-32.
+SNAPSHOT_HEADER = struct.Struct("<4sHqqdqII")
+SNAPSHOT_MAGIC = b"TBK1"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "snapshot.bin"
+# Snapshot body columns after the newline-separated symbol table, one value per entry.
+SNAPSHOT_COLUMNS = (("entry_id", "<i8"), ("price", "<f8"), ("side", "i1"), ("symbol", "<u4"))
+
+
+def _frame(payload: bytes) -> bytes:
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_open(entry_id: int, symbol: str, price: float, side: Side) -> bytes:
+    """
+    :return: A framed record of an opened entry.
+    """
+    name = symbol.encode()
+    return _frame(OPEN_RECORD.pack(OPEN, entry_id, price, side) + bytes([len(name)]) + name)
+
+
+def encode_exit(entry_id: int, symbol: str, gain: float) -> bytes:
+    """
+    :return: A framed record of a closed entry.
+    """
+    name = symbol.encode()
+    return _frame(EXIT_RECORD.pack(EXIT, entry_id, gain) + bytes([len(name)]) + name)
+
+
+def decode(data: bytes, offset: int = 0):
+    """
+    Decodes framed records until the data ends or a record is incomplete or corrupt, which is
+    where a crash interrupted the last write. An empty frame, as in a tail the file system
+    filled with zeros, passes the CRC check (the CRC-32 of no bytes is 0) and so also ends
+    the log, as do a truncated record and an unknown record kind.
+
+    :param data: File contents.
+    :param offset: Position of the first record.
+    :return: Generator of ('open', entry id, symbol, price, side) and ('exit', entry id, symbol, gain).
+    """
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if length < 1 or len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        offset += FRAME.size + length
+        try:
+            if payload[0] == OPEN:
+                _, entry_id, price, side = OPEN_RECORD.unpack_from(payload)
+                symbol = _symbol(payload, OPEN_RECORD.size)
+                record = "open", entry_id, symbol, price, Side(side)
+            elif payload[0] == EXIT:
+                _, entry_id, gain = EXIT_RECORD.unpack_from(payload)
+                record = "exit", entry_id, _symbol(payload, EXIT_RECORD.size), gain
+            else:
+                return
+        except (struct.error, ValueError, IndexError):
+            return
+        yield record
+
+
+def _symbol(payload: bytes, offset: int) -> str:
+    """
+    :return: The length-prefixed symbol at `offset` of a record payload.
+    :raises ValueError: If the symbol runs past the end of the payload.
+    """
+    size = payload[offset]
+    if offset + 1 + size > len(payload):
+        raise ValueError("truncated symbol")
+    return payload[offset + 1:offset + 1 + size].decode()
+
+
+def _fsync_directory(directory: str) -> None:
+    """
+    Flushes a directory's entries to the disk, so a file created or renamed in it survives
+    a power loss.
+
+    :param directory: The directory.
+    :return: None
+    """
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class TradeJournal:
+    """
+    Crash-safe persistence of a TradeBook: periodic snapshots plus a write-ahead log.
+
+    Every entry opened or closed is appended to the current log generation, wal-N.bin, as a
+    small CRC-framed record. Records are buffered and written from a worker thread every
+    `flush_interval` seconds, so the event loop never waits on disk. Every `snapshot_interval`
+    seconds the whole book is written to snapshot.bin (atomically, through a temporary file)
+    and a new log generation is started; logs older than the snapshot are then deleted.
+
+    On startup load() reads the snapshot and replays the logs written after it. A record cut
+    short by a crash, or a zero-filled tail, ends the replay of that log there.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 0.5, snapshot_interval: float = 300.0,
+                 fsync: bool = True) -> None:
+        """
+        Initialize the TradeJournal object.
+
+        :param directory: Directory for the snapshot and logs, created if missing.
+        :param flush_interval: Longest time in seconds a record stays buffered.
+        :param snapshot_interval: Seconds between snapshots.
+        :param fsync: Whether writes are flushed to the disk before they count as done.
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        self.generation = 0
+        self._book = None
+        self._buffer = []
+        self._write_lock = asyncio.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, book: TradeBook) -> int:
+        """
+        Rebuilds a trade book from the snapshot and logs, then records its future changes.
+
+        :param book: An empty trade book.
+        :return: Number of records replayed from the logs.
+        """
+        started = time.perf_counter()
+        generation = 0
+        try:
+            with open(os.path.join(self.directory, SNAPSHOT_FILE), "rb") as snapshot_file:
+                generation = self._read_snapshot(snapshot_file.read(), book)
+        except FileNotFoundError:
+            pass
+        except (struct.error, ValueError) as e:
+            print(f"Trade book snapshot unreadable ({e}), replaying the logs only.")
+
+        replayed = 0
+        for log_generation in self._log_generations():
+            if log_generation < generation:
+                continue
+            with open(self._log_path(log_generation), "rb") as log_file:
+                for record in decode(log_file.read()):
+                    if record[0] == "open":
+                        _, entry_id, symbol, price, side = record
+                        book.add(symbol, price, side, entry_id)
+                    else:
+                        _, entry_id, symbol, gain = record
+                        book.close(symbol, entry_id, gain)
+                    replayed += 1
+            generation = max(generation, log_generation)
+
+        # Continue in a fresh generation, so a torn tail is never appended to.
+        self.generation = generation + 1
+        self._book = book
+        book.journal = self
+        print(f"Trade book restored: {len(book)} open entries, total profit {book.total_profit:.2f}%, "
+              f"{replayed} log records replayed in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return replayed
+
+    def opened(self, entry_id: int, symbol: str, price: float, side: Side) -> None:
+        """
+        Records an opened entry. Called by the trade book.
+        """
+        self._buffer.append((self.generation, encode_open(entry_id, symbol, price, side)))
+
+    def closed(self, entry_id: int, symbol: str, gain: float) -> None:
+        """
+        Records a closed entry. Called by the trade book.
+        """
+        self._buffer.append((self.generation, encode_exit(entry_id, symbol, gain)))
+
+    async def run(self) -> None:
+        """
+        Writes buffered records every `flush_interval` seconds and a snapshot every
+        `snapshot_interval` seconds until cancelled; on the way out both are written once more.
+        """
+        loop = asyncio.get_running_loop()
+        last_snapshot = loop.time()
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+                if loop.time() - last_snapshot >= self.snapshot_interval:
+                    await self.snapshot()
+                    last_snapshot = loop.time()
+        finally:
+            await self.flush()
+            await self.snapshot()
+
+    async def flush(self) -> bool:
+        """
+        Appends the buffered records to their logs from a worker thread.
+
+        If the disk refuses them, the records that were not written go back to the front of
+        the buffer, so the next flush tries them again.
+
+        :return: True if the buffer was written out.
+        """
+        if not self._buffer:
+            return True
+        records, self._buffer = self._buffer, []
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._append, records)
+            except OSError as e:
+                self._buffer[:0] = records
+                metrics.JOURNAL_WRITE_ERRORS.inc("log")
+                print(f"Trade journal failed to write {len(records)} records: {e!r}")
+                return False
+        return True
+
+    async def snapshot(self) -> None:
+        """
+        Writes the whole trade book to the snapshot file and starts a new log generation.
+
+        The book is copied on the event loop, which takes a few milliseconds even for
+        thousands of entries; encoding and writing happen in a worker thread.
+        """
+        if self._book is None:
+            return
+        await self.flush()
+        self.generation += 1
+        state = (self.generation, self._book.next_id, self._book.total_profit,
+                 [(symbol, self._book.entries(symbol)) for symbol in self._book.symbols()])
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write_snapshot, *state)
+            except OSError as e:
+                # The logs the snapshot would have replaced are kept, so nothing is lost.
+                metrics.JOURNAL_WRITE_ERRORS.inc("snapshot")
+                print(f"Trade journal failed to write a snapshot: {e!r}")
+
+    def _log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"wal-{generation:08d}.bin")
+
+    def _log_generations(self) -> list:
+        return sorted(int(name[4:-4]) for name in os.listdir(self.directory)
+                      if name.startswith("wal-") and name.endswith(".bin"))
+
+    def _append(self, records: list) -> None:
+        """
+        Appends records to the logs of their generations. Runs in a worker thread.
+
+        Records are removed from the list as their generation is written, so on an error the
+        list holds exactly the records still to write. A partly written batch is cut off again,
+        as a torn tail would end the replay of everything appended after it.
+        """
+        by_generation = {}
+        for generation, record in records:
+            by_generation.setdefault(generation, []).append(record)
+        for generation, generation_records in by_generation.items():
+            path = self._log_path(generation)
+            created = not os.path.exists(path)
+            with open(path, "ab") as log_file:
+                size = log_file.tell()
+                try:
+                    log_file.write(b"".join(generation_records))
+                    log_file.flush()
+                    if self.fsync:
+                        os.fsync(log_file.fileno())
+                except OSError:
+                    try:
+                        log_file.truncate(size)
+                    except OSError:
+                        pass
+                    raise
+            if created and self.fsync:
+                _fsync_directory(self.directory)
+            records[:] = [item for item in records if item[0] != generation]
+
+    @staticmethod
+    def _read_snapshot(data: bytes, book: TradeBook) -> int:
+        """
+        Loads a snapshot into an empty trade book, one bulk add per symbol.
+
+        :param data: Snapshot file contents.
+        :param book: The trade book.
+        :return: The log generation the snapshot was taken at.
+        """
+        magic, version, generation, next_id, total_profit, count, symbols_size, crc = \
+            SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("unknown snapshot format")
+        body = memoryview(data)[SNAPSHOT_HEADER.size:]
+        if zlib.crc32(body) != crc:
+            raise ValueError("checksum mismatch")
+        symbols = bytes(body[:symbols_size]).decode().split("\n")
+        offset = symbols_size
+        columns = {}
+        for name, dtype in SNAPSHOT_COLUMNS:
+            columns[name] = np.frombuffer(body, dtype=dtype, count=count, offset=offset)
+            offset += count * np.dtype(dtype).itemsize
+        book.total_profit = total_profit
+        book.restore_id(next_id)
+        # Entries are stored grouped by symbol, oldest first, so each symbol is one slice.
+        boundaries = np.flatnonzero(np.diff(columns["symbol"])) + 1
+        for start, end in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [count]))):
+            if start == end:
+                continue
+            book.add_many(symbols[columns["symbol"][start]], columns["entry_id"][start:end].tolist(),
+                          columns["price"][start:end].tolist(), columns["side"][start:end].tolist())
+        return generation
+
+    def _write_snapshot(self, generation: int, next_id: int, total_profit: float, entries: list) -> None:
+        """
+        Writes a snapshot atomically and removes the logs it supersedes. Runs in a worker thread.
+
+        :param generation: Log generation started with the snapshot.
+        :param next_id: The trade book's next entry id.
+        :param total_profit: The trade book's total profit.
+        :param entries: List of (symbol, list of (entry id, price, side)).
+        :return: None
+        """
+        symbols = [symbol for symbol, _ in entries]
+        rows = [(entry_id, price, side, index)
+                for index, (_, symbol_entries) in enumerate(entries)
+                for entry_id, price, side in symbol_entries]
+        table = np.array(rows, dtype=list(SNAPSHOT_COLUMNS)) if rows else np.empty(0, dtype=list(SNAPSHOT_COLUMNS))
+        symbol_table = "\n".join(symbols).encode()
+        body = symbol_table + b"".join(np.ascontiguousarray(table[name]).tobytes() for name, _ in SNAPSHOT_COLUMNS)
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, next_id, total_profit,
+                                      len(rows), len(symbol_table), zlib.crc32(body))
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(header + body)
+            snapshot_file.flush()
+            if self.fsync:
+                os.fsync(snapshot_file.fileno())
+        os.replace(temporary, path)
+        if self.fsync:
+            _fsync_directory(self.directory)
+        for log_generation in self._log_generations():
+            if log_generation < generation:
+                os.remove(self._log_path(log_generation))
@@ -0,0 +1,122 @@
+import time
+
+from . import acme, metrics
+from .streams import StreamClient
+from .tradebook import TradeBook
+
+
+class MarkPriceFeed:
+    """
+    Exits evaluated on every mark price pushed for the symbols with open entries.
+
+    The feed follows the trade book: a symbol is subscribed to its `<symbol>@markPrice@1s`
+    stream when an entry opens on it and unsubscribed once its last entry has closed. Each
+    update applies the price to that symbol alone with TradeBook.update, so an exit follows
+    the price within the stream's one second cadence instead of waiting for a polling cycle.
+
+    The exits taken are kept until take_exits() hands them to the trade book summary, as the
+    entries they closed are gone from the book by the time it is reported. The latest scaled
+    prices are kept for the summary too. A price that has not been
+    updated for `max_age` seconds, or any price while the stream is disconnected, is stale
+    and not returned, so callers price the symbol another way.
+    """
+
+    def __init__(self, stream_url: str, trade_book: TradeBook, max_age: float = 5.0) -> None:
+        """
+        Initialize the MarkPriceFeed object.
+
+        :param stream_url: Base websocket URL of the exchange.
+        :param trade_book: The trade book whose symbols are followed and exited.
+        :param max_age: Seconds after which a price without updates is stale.
+        """
+        self.trade_book = trade_book
+        self.max_age = max_age
+        self.client = StreamClient(stream_url, self._on_message, on_disconnect=self._prices_clear)
+        self._followed = set()
+        self._prices = {}  # symbol -> (scaled price, monotonic time received)
+        self._exits = []
+
+    def follow(self, symbol: str) -> None:
+        """
+        Subscribes to a symbol's mark price if it is not followed yet.
+
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :return: None
+        """
+        if symbol not in self._followed:
+            self._followed.add(symbol)
+            self.client.subscribe(self._stream(symbol))
+
+    def unfollow(self, symbol: str) -> None:
+        """
+        Unsubscribes from a symbol's mark price.
+
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :return: None
+        """
+        if symbol in self._followed:
+            self._followed.discard(symbol)
+            self._prices.pop(symbol, None)
+            self.client.unsubscribe(self._stream(symbol))
+
+    def sync(self) -> None:
+        """
+        Follows exactly the symbols of the trade book, e.g. after it was restored from a
+        journal or exited by other means.
+
+        :return: None
+        """
+        symbols = set(self.trade_book.symbols())
+        for symbol in symbols - self._followed:
+            self.follow(symbol)
+        for symbol in self._followed - symbols:
+            self.unfollow(symbol)
+
+    def prices(self) -> dict:
+        """
+        :return: Dictionary of symbol to its fresh scaled mark price.
+        """
+        cutoff = time.monotonic() - self.max_age
+        return {symbol: price for symbol, (price, updated) in self._prices.items() if updated >= cutoff}
+
+    def take_exits(self) -> list:
+        """
+        :return: List of tradebook.Exit taken since the last call, oldest first.
+        """
+        exits, self._exits = self._exits, []
+        return exits
+
+    async def run(self) -> None:
+        """
+        Runs the stream connection until cancelled.
+        """
+        await self.client.run()
+
+    @staticmethod
+    def _stream(symbol: str) -> str:
+        return f"{symbol.lower()}@markPrice@1s"
+
+    def _prices_clear(self) -> None:
+        self._prices.clear()
+
+    def _on_message(self, stream: str, data: dict) -> list:
+        """
+        Applies a mark price to the symbol's entries and stops following it once none are left.
+
+        :param stream: Stream name.
+        :param data: markPriceUpdate payload.
+        :return: List of tradebook.Exit for the entries closed.
+        """
+        symbol = data["s"]
+        if symbol not in self._followed:
+            return []  # An update sent before the unsubscribe took effect.
+        price = float(data["p"])
+        scaled = price / acme.get_scale(price)
+        self._prices[symbol] = (scaled, time.monotonic())
+        exits = self.trade_book.update(symbol, scaled)
+        self._exits.extend(exits)
+        # Clock skew can put the event time slightly ahead of the local time.
+        metrics.STAGE_SECONDS.observe(max(0.0, time.time() - data["E"] / 1000), "mark_price")
+        if symbol not in self.trade_book:
+            self.unfollow(symbol)
+        return exits
@@ -0,0 +1,260 @@
+import asyncio
+from bisect import bisect_left
+
+# Upper bounds in seconds of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter, optionally split by label values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()) -> None:
+        """
+        Initialize the Counter object.
+
+        :param name: Metric name.
+        :param help_text: Description shown in the exposition.
+        :param labels: Label names; inc() takes one value per name.
+        """
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        """
+        :param label_values: One value per label name.
+        :param amount: Amount to add.
+        :return: None
+        """
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield f"{self.name}{_label_text(self.labels, label_values)} {value:g}"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, optionally split by label values.
+
+    observe() is one bisect over the bucket bounds and a few additions, cheap enough for every
+    event. Bucket counts are kept per bucket and only made cumulative when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> None:
+        """
+        Initialize the Histogram object.
+
+        :param name: Metric name.
+        :param help_text: Description shown in the exposition.
+        :param labels: Label names; observe() takes one value per name.
+        :param buckets: Sorted bucket upper bounds; a +Inf bucket is added.
+        """
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        :param value: The observed value, e.g. a duration in seconds.
+        :param label_values: One value per label name.
+        :return: None
+        """
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self):
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, label_values)} {total:g}"
+            yield f"{self.name}_count{_label_text(self.labels, label_values)} {count}"
+
+
+class Gauge:
+    """
+    Gauge read from a callable when the metrics are rendered, so it costs nothing in between.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read) -> None:
+        """
+        Initialize the Gauge object.
+
+        :param name: Metric name.
+        :param help_text: Description shown in the exposition.
+        :param read: Callable returning the current value.
+        """
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def samples(self):
+        yield f"{self.name} {self.read():g}"
+
+
+def counter(name: str, help_text: str, labels: tuple = ()) -> Counter:
+    """
+    Creates and registers a counter.
+    """
+    metric = Counter(name, help_text, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    """
+    Creates and registers a histogram.
+    """
+    metric = Histogram(name, help_text, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name: str, help_text: str, read) -> Gauge:
+    """
+    Creates and registers a gauge read from a callable.
+    """
+    metric = Gauge(name, help_text, read)
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    """
+    :return: Every registered metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Answers one HTTP request: GET /metrics with the exposition, anything else with 404.
+    """
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass  # Headers are not needed.
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+            status, content_type, body = "200 OK", CONTENT_TYPE, render().encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 9108) -> None:
+    """
+    Serves the metrics over HTTP until cancelled.
+
+    :param host: Interface to listen on.
+    :param port: Port to listen on.
+    :return: None
+    """
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+# Latency of each step between a liquidation happening and its alert reaching Discord.
+STAGE_SECONDS = histogram(
+    "acme_stage_seconds",
+    "Seconds spent per processing stage: stream (exchange trade time to receipt), coalesce, queue, "
+    "price, pnz, discord_post and mark_price (exchange mark price time to exits evaluated).",
+    ("stage",))
+VOLUME_FILTER_SECONDS = histogram(
+    "acme_volume_filter_seconds",
+    "Seconds to get the volume Z-Scores, by whether the symbol's engine was current (hit), seeded by this "
+    "call (miss) or being seeded by another call (coalesced).",
+    ("cache",))
+LIQUIDATIONS_RECEIVED = counter(
+    "acme_liquidations_received_total",
+    "Liquidation events received from the websocket.")
+LIQUIDATIONS_COALESCED = counter(
+    "acme_liquidations_coalesced_total",
+    "Liquidation events merged into an earlier event of the same symbol and side.")
+LIQUIDATIONS_PROCESSED = counter(
+    "acme_liquidations_processed_total",
+    "Liquidation events processed, by outcome: excluded, filtered, no_data, no_zone, no_signal or entry.",
+    ("outcome",))
+REST_REQUESTS = counter(
+    "acme_rest_requests_total",
+    "Exchange REST request attempts, by endpoint and HTTP status (error for timeouts and connection errors).",
+    ("endpoint", "status"))
+REST_WEIGHT_WAIT_SECONDS = histogram(
+    "acme_rest_weight_wait_seconds",
+    "Seconds a REST request attempt waited for request weight, by priority lane: entry or background.",
+    ("lane",))
+CACHE_REQUESTS = counter(
+    "acme_cache_requests_total",
+    "Cache lookups, by cache and result: hit, miss (a load was started) or coalesced (joined a load in flight).",
+    ("cache", "result"))
+CACHE_EVICTIONS = counter(
+    "acme_cache_evictions_total",
+    "Entries evicted to keep a cache within its size bound, by cache.",
+    ("cache",))
+SINK_RECORDS = counter(
+    "acme_sink_records_total",
+    "Alerts handled by each output sink, by result: written, dropped (queue full) or failed.",
+    ("sink", "result"))
+STREAM_CONNECTIONS = counter(
+    "acme_stream_connections_total",
+    "Redundant stream connection events: opened, rotated (replaced at the end of its lifetime), dropped or "
+    "failed (could not connect).",
+    ("event",))
+STREAM_DUPLICATES = counter(
+    "acme_stream_duplicates_total",
+    "Stream messages dropped because another connection of a redundant stream delivered them first.")
+STREAM_MESSAGE_ERRORS = counter(
+    "acme_stream_message_errors_total",
+    "Stream messages that could not be decoded or whose handler failed; the stream carries on.")
+JOURNAL_WRITE_ERRORS = counter(
+    "acme_journal_write_errors_total",
+    "Trade journal log appends or snapshots that failed; unwritten records are retried on the next flush.",
+    ("write",))
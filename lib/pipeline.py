@@ -0,0 +1,312 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+from . import metrics
+
+# Overflow policies for a full LiquidationQueue.
+BLOCK = "block"
+DROP_SMALLEST = "drop_smallest"
+DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (BLOCK, DROP_SMALLEST, DROP_OLDEST)
+
+
+def _symbol(item):
+    """
+    :return: Symbol of a queued event, None for items without one.
+    """
+    return getattr(item, "symbol", None)
+
+
+class LiquidationQueue:
+    """
+    Bounded asyncio priority queue of liquidation events.
+
+    Events are handed out largest liquidation value first, so under a backlog the biggest
+    liquidations are processed before the small ones. Events of equal value come out in
+    arrival order. The time each event spends queued is recorded as the "queue" stage.
+
+    When the queue is full the overflow policy decides what happens to a new event:
+
+    - block: the producer waits until a consumer frees a slot (backpressure).
+    - drop_smallest: the smallest queued event is discarded, or the new event itself if it is
+      no larger than everything already queued.
+    - drop_oldest: the event that has been queued the longest is discarded.
+
+    Consumers that must handle one symbol at a time use claim() and release() instead of
+    get(): a claimed symbol's other events stay queued, counted in the depth and subject to
+    the overflow policy, until its consumer releases it.
+    """
+
+    def __init__(self, maxsize: int = 10000, overflow: str = BLOCK) -> None:
+        """
+        Initialize the LiquidationQueue object.
+
+        :param maxsize: Maximum number of queued events.
+        :param overflow: One of OVERFLOW_POLICIES.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}.")
+        if maxsize < 1:
+            raise ValueError("Queue maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.high_water = 0
+        self.total_put = 0
+        self._heap = []
+        self._sequence = itertools.count()
+        self._queued = {}  # symbol -> events of it queued
+        self._held = set()  # symbols claimed and not yet released
+        lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(lock)
+        self._not_full = asyncio.Condition(lock)
+
+    def qsize(self) -> int:
+        """
+        :return: Number of events currently queued.
+        """
+        return len(self._heap)
+
+    def full(self) -> bool:
+        """
+        :return: True if the queue holds maxsize events.
+        """
+        return len(self._heap) >= self.maxsize
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the queue counters, used to see when load is being shed.
+
+        :return: Dictionary with the current depth, high water mark, events accepted and dropped.
+        """
+        return {
+            "depth": len(self._heap),
+            "high_water": self.high_water,
+            "put": self.total_put,
+            "dropped": self.dropped,
+        }
+
+    async def put(self, item, value: float = None) -> bool:
+        """
+        Queues an event with its liquidation value as its priority.
+
+        :param item: The event to queue.
+        :param value: Liquidation value (quantity * price) used for ordering and shedding, by
+        default the event's `value` read once it gets its slot, so an aggregate that grew
+        while waiting is ranked by its final size.
+        :return: True if the event was queued, False if it was dropped.
+        """
+        async with self._not_full:
+            if self.full() and self.overflow == BLOCK:
+                await self._not_full.wait_for(lambda: not self.full())
+            if value is None:
+                value = item.value
+            if self.full() and not self._shed(value):
+                self.dropped += 1
+                return False
+            heapq.heappush(self._heap, (-value, next(self._sequence), time.monotonic(), item))
+            symbol = _symbol(item)
+            self._queued[symbol] = self._queued.get(symbol, 0) + 1
+            self.total_put += 1
+            self.high_water = max(self.high_water, len(self._heap))
+            self._not_empty.notify()
+        return True
+
+    async def wait_not_full(self) -> None:
+        """
+        Waits until the queue has a free slot, without taking it.
+
+        :return: None
+        """
+        async with self._not_full:
+            await self._not_full.wait_for(lambda: not self.full())
+            # Pass the wakeup on, in case a producer blocked in put() can use the slot too.
+            self._not_full.notify()
+
+    async def get(self):
+        """
+        Removes and returns the largest queued event, waiting until one is available.
+
+        :return: The queued event.
+        """
+        async with self._not_empty:
+            await self._not_empty.wait_for(lambda: self._heap)
+            queued_at, item = self._remove(0)
+            self._not_full.notify()
+        metrics.STAGE_SECONDS.observe(time.monotonic() - queued_at, "queue")
+        return item
+
+    async def claim(self):
+        """
+        Removes and returns an event of the symbol with the largest queued event that is not
+        claimed, and claims that symbol until release(). A symbol's events are handed out in
+        the order they were queued, so the oldest one is returned.
+
+        :return: The queued event.
+        """
+        async with self._not_empty:
+            while (index := self._claimable()) is None:
+                await self._not_empty.wait()
+            queued_at, item = self._remove(index)
+            self._held.add(item.symbol)
+            self._not_full.notify()
+        metrics.STAGE_SECONDS.observe(time.monotonic() - queued_at, "queue")
+        return item
+
+    async def release(self, item) -> None:
+        """
+        Releases the symbol of a claimed event, so its next event can be claimed.
+
+        :param item: The event returned by claim().
+        :return: None
+        """
+        async with self._not_empty:
+            self._held.discard(item.symbol)
+            self._not_empty.notify()
+
+    def _claimable(self):
+        """
+        :return: Heap index of the event claim() should return, None if every queued event
+        belongs to a claimed symbol.
+        """
+        heap = self._heap
+        if not heap:
+            return None
+        held = self._held
+        symbol = heap[0][3].symbol
+        if symbol not in held and self._queued[symbol] == 1:
+            return 0
+        best = None
+        for index, entry in enumerate(heap):
+            if entry[3].symbol not in held and (best is None or entry[:2] < heap[best][:2]):
+                best = index
+        if best is None:
+            return None
+        symbol = heap[best][3].symbol
+        return min((index for index, entry in enumerate(heap) if entry[3].symbol == symbol),
+                   key=lambda index: heap[index][1])
+
+    def _remove(self, index: int) -> tuple:
+        """
+        Takes an entry out of the heap.
+
+        :param index: Heap index of the entry.
+        :return: Tuple of the time the event was queued and the event.
+        """
+        heap = self._heap
+        if index == 0:
+            _, _, queued_at, item = heapq.heappop(heap)
+        else:
+            _, _, queued_at, item = heap[index]
+            heap[index] = heap[-1]
+            heap.pop()
+            heapq.heapify(heap)
+        symbol = _symbol(item)
+        self._queued[symbol] -= 1
+        if not self._queued[symbol]:
+            del self._queued[symbol]
+        return queued_at, item
+
+    def _shed(self, value: float) -> bool:
+        """
+        Frees one slot according to the overflow policy.
+
+        :param value: Liquidation value of the event waiting to be queued.
+        :return: True if a queued event was discarded, False if the new event should be dropped.
+        """
+        if self.overflow == DROP_SMALLEST:
+            # Heap keys are negated values, so the largest key is the smallest liquidation.
+            victim = max(range(len(self._heap)), key=self._heap.__getitem__)
+            if -self._heap[victim][0] >= value:
+                return False
+        else:
+            victim = min(range(len(self._heap)), key=lambda i: self._heap[i][1])
+        self._remove(victim)
+        self.dropped += 1
+        return True
+
+
+class CascadeCoalescer:
+    """
+    Merges the liquidations of one symbol and side that arrive within a short window.
+
+    A cascade on one symbol sends dozens of orders within milliseconds. The first order of a
+    symbol and side opens a window of `window` seconds; the orders that follow in it are
+    absorbed into the first one, and the aggregate is queued once the window closes. The
+    aggregate is evaluated, priced and alerted once, and it is queued with its total value.
+
+    While the queue blocks, aggregates keep absorbing new orders, so at most one aggregate per
+    symbol and side is waiting. An order that would open a new aggregate waits for the queue
+    to have room when its overflow policy is block, so a full queue still stops the reading of
+    the websocket. A window of 0 queues every order on its own.
+    """
+
+    def __init__(self, queue: LiquidationQueue, window: float = 0.25) -> None:
+        """
+        Initialize the CascadeCoalescer object.
+
+        :param queue: Queue the aggregates are put into.
+        :param window: Seconds orders are collected for after the first one.
+        """
+        self.queue = queue
+        self.window = window
+        self.merged = 0
+        # (symbol, side) -> (window close as monotonic time, window open, aggregate), in closing order.
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+
+    def pending(self) -> int:
+        """
+        :return: Number of aggregates whose window is still open or that wait for the queue.
+        """
+        return len(self._pending)
+
+    async def put(self, event) -> None:
+        """
+        Adds an order, merging it into the open window of its symbol and side.
+
+        :param event: The liquidation event.
+        :return: None
+        """
+        if self.window <= 0:
+            await self.queue.put(event)
+            return
+        key = (event.symbol, event.side)
+        while True:
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending[2].absorb(event)
+                self.merged += 1
+                metrics.LIQUIDATIONS_COALESCED.inc()
+                return
+            if self.queue.overflow != BLOCK or not self.queue.full():
+                break
+            # A new aggregate has to wait for room, which backpressures the stream reader.
+            # Another order may open the window meanwhile, so look for it again after.
+            await self.queue.wait_not_full()
+        opened = time.monotonic()
+        self._pending[key] = (opened + self.window, opened, event)
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        """
+        Queues each aggregate when its window closes, until cancelled.
+
+        Every window has the same length, so they close in the order they were opened and
+        only the oldest one needs watching.
+        """
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            key, (closes, opened, event) = next(iter(self._pending.items()))
+            delay = closes - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            await self.queue.put(event)
+            del self._pending[key]
+            metrics.STAGE_SECONDS.observe(time.monotonic() - opened, "coalesce")
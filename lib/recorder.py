@@ -0,0 +1,243 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Fixed-width columns of the log, one file per column, in record order.
+COLUMNS = (
+    ("event_time", "<i8"),     # E: event time, ms
+    ("trade_time", "<i8"),     # T: order trade time, ms
+    ("symbol", "<u4"),         # index into the day's symbol dictionary
+    ("side", "u1"),            # S: index into SIDES
+    ("order_type", "u1"),      # o: index into ORDER_TYPES
+    ("status", "u1"),          # X: index into STATUSES
+    ("quantity", "<f8"),       # q: original quantity
+    ("price", "<f8"),          # p: price
+    ("average_price", "<f8"),  # ap: average price
+    ("last_filled", "<f8"),    # l: last filled quantity
+    ("filled", "<f8"),         # z: accumulated filled quantity
+)
+RECORD_DTYPE = np.dtype(list(COLUMNS))
+SIDES = ("BUY", "SELL")
+ORDER_TYPES = ("LIMIT", "MARKET")
+STATUSES = ("NEW", "PARTIALLY_FILLED", "FILLED", "CANCELED", "EXPIRED")
+UNKNOWN = 255
+SYMBOLS_FILE = "symbols.txt"
+
+
+def _code(values: tuple, value: str) -> int:
+    try:
+        return values.index(value)
+    except ValueError:
+        return UNKNOWN
+
+
+def day_of(timestamp_ms: int) -> str:
+    """
+    :param timestamp_ms: Time in milliseconds.
+    :return: The UTC day the timestamp falls on, as YYYYMMDD.
+    """
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+class Recorder:
+    """
+    Append-only columnar recorder of raw liquidation events.
+
+    Each UTC day gets its own directory, liquidations-YYYYMMDD, holding one binary file per
+    column of COLUMNS and a symbol dictionary, symbols.txt, with one symbol per line; records
+    store the symbol's line number. Records are buffered in memory and written in batches from
+    a worker thread, so the event loop never waits on disk.
+    """
+
+    def __init__(self, directory: str, batch_size: int = 1024, flush_interval: float = 1.0) -> None:
+        """
+        Initialize the Recorder object.
+
+        :param directory: Directory for the daily logs, created if missing.
+        :param batch_size: Buffered records that trigger a write.
+        :param flush_interval: Longest time in seconds a record stays buffered.
+        """
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._buffer = []
+        self._day = None
+        self._symbols = {}
+        self._new_symbols = []
+        self._write_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, event: dict) -> None:
+        """
+        Buffers one forceOrder event for writing. Does no I/O, except reading the day's symbol
+        dictionary once when the day changes.
+
+        :param event: The decoded forceOrder message, with its "E" event time and "o" order.
+        :return: None
+        """
+        order = event["o"]
+        event_time = int(event.get("E", order["T"]))
+        day = day_of(event_time)
+        if day != self._day:
+            self._rotate(day)
+        symbol = order["s"]
+        index = self._symbols.get(symbol)
+        if index is None:
+            index = self._symbols[symbol] = len(self._symbols)
+            self._new_symbols.append((day, symbol))
+        self._buffer.append((day, (
+            event_time, int(order["T"]), index,
+            _code(SIDES, order["S"]), _code(ORDER_TYPES, order.get("o")), _code(STATUSES, order.get("X")),
+            float(order["q"]), float(order["p"]), float(order.get("ap", 0)),
+            float(order.get("l", 0)), float(order.get("z", 0)),
+        )))
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def run(self) -> None:
+        """
+        Writes buffered records every `flush_interval` seconds, or sooner once `batch_size`
+        records are waiting, until cancelled. Remaining records are written on the way out.
+        """
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._batch_ready.clear()
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Writes all buffered records and new symbols from a worker thread.
+        """
+        if not self._buffer and not self._new_symbols:
+            return
+        records, self._buffer = self._buffer, []
+        symbols, self._new_symbols = self._new_symbols, []
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, records, symbols)
+        self.recorded += len(records)
+
+    def _rotate(self, day: str) -> None:
+        """
+        Switches to another day, continuing its symbol dictionary if the day already exists.
+
+        :param day: Day as YYYYMMDD.
+        :return: None
+        """
+        self._day = day
+        self._symbols = {symbol: index for index, symbol in enumerate(read_symbols(self._path(day)))}
+        # Symbols queued for the dictionary but not written yet belong to it too.
+        for pending_day, symbol in self._new_symbols:
+            if pending_day == day and symbol not in self._symbols:
+                self._symbols[symbol] = len(self._symbols)
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"liquidations-{day}")
+
+    def _write(self, records: list, symbols: list) -> None:
+        """
+        Appends records and symbols to their day's files. Runs in a worker thread.
+
+        The dictionary is written before the records, so every stored symbol index resolves.
+
+        :param records: List of (day, record tuple).
+        :param symbols: List of (day, symbol) to add to the dictionaries.
+        :return: None
+        """
+        for day, symbol in symbols:
+            os.makedirs(self._path(day), exist_ok=True)
+            with open(os.path.join(self._path(day), SYMBOLS_FILE), "a", encoding="utf-8") as symbols_file:
+                symbols_file.write(symbol + "\n")
+        by_day = {}
+        for day, record in records:
+            by_day.setdefault(day, []).append(record)
+        for day, day_records in by_day.items():
+            path = self._path(day)
+            os.makedirs(path, exist_ok=True)
+            batch = np.array(day_records, dtype=RECORD_DTYPE)
+            for name, _ in COLUMNS:
+                with open(os.path.join(path, f"{name}.bin"), "ab") as column_file:
+                    column_file.write(batch[name].tobytes())
+
+
+def read_symbols(path: str) -> list:
+    """
+    :param path: Directory of one day's log.
+    :return: List of symbols, the position being the index stored in records. Empty if missing.
+    """
+    try:
+        with open(os.path.join(path, SYMBOLS_FILE), encoding="utf-8") as symbols_file:
+            return symbols_file.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def read(path: str) -> tuple:
+    """
+    Memory-maps the columns of one day's log without copying them.
+
+    Every column is cut to the length of the shortest one, so a log that is still being
+    appended to, or that was cut short by a crash, reads as whole records only.
+
+    :param path: Directory of one day's log, liquidations-YYYYMMDD.
+    :return: Tuple of (dictionary of column name to NumPy array backed by the file, list of symbols).
+    """
+    lengths = []
+    for name, dtype in COLUMNS:
+        column_path = os.path.join(path, f"{name}.bin")
+        size = os.path.getsize(column_path) if os.path.exists(column_path) else 0
+        lengths.append(size // np.dtype(dtype).itemsize)
+    count = min(lengths)
+    columns = {}
+    for name, dtype in COLUMNS:
+        if count == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(count,))
+    return columns, read_symbols(path)
+
+
+def iterate(directory: str, start: str = None, end: str = None):
+    """
+    Iterates the daily logs of a directory in date order.
+
+    :param directory: Directory written by a Recorder.
+    :param start: First day to include, YYYYMMDD, inclusive.
+    :param end: Last day to include, YYYYMMDD, inclusive.
+    :return: Generator of (day, columns, symbols) as returned by read().
+    """
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("liquidations-"):
+            continue
+        day = name[len("liquidations-"):]
+        if (start and day < start) or (end and day > end):
+            continue
+        columns, symbols = read(os.path.join(directory, name))
+        yield day, columns, symbols
+
+
+def to_events(columns: dict, symbols: list) -> dict:
+    """
+    Converts recorded columns into the event arrays taken by backtest.run.
+
+    :param columns: Columns as returned by read().
+    :param symbols: The matching symbol dictionary.
+    :return: Dictionary of 'time', 'symbol', 'side', 'quantity' and 'price' arrays.
+    """
+    side_names = np.array(SIDES + ("",) * (UNKNOWN + 1 - len(SIDES)))
+    return {
+        "time": columns["trade_time"],
+        "symbol": np.asarray(symbols + [""])[np.minimum(columns["symbol"], len(symbols))],
+        "side": side_names[columns["side"]],
+        "quantity": columns["quantity"],
+        "price": columns["price"],
+    }
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import zlib
+from bisect import bisect_right
+
+# Points each shard gets on the hash ring; more points spread symbols more evenly.
+RING_REPLICAS = 64
+
+
+class HashRing:
+    """
+    Consistent hash ring assigning symbols to shard processes.
+
+    Every shard owns RING_REPLICAS points on a 32-bit ring and a symbol belongs to the first
+    point at or after its own hash. Changing the number of shards only moves the symbols of
+    the points added or removed, about 1/N of them, so most symbols keep their shard and the
+    trade book entries that shard already holds.
+    """
+
+    def __init__(self, shards: int, replicas: int = RING_REPLICAS) -> None:
+        """
+        Initialize the HashRing object.
+
+        :param shards: Number of shards.
+        :param replicas: Points per shard.
+        """
+        if shards < 1:
+            raise ValueError("A hash ring needs at least one shard.")
+        self.shards = shards
+        points = sorted((zlib.crc32(f"shard-{shard}-{replica}".encode()), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+        self._assigned = {}
+
+    def shard_for(self, symbol: str) -> int:
+        """
+        :param symbol: Symbol, e.g. 'BTCUSDT'.
+        :return: Index of the shard owning the symbol.
+        """
+        shard = self._assigned.get(symbol)
+        if shard is None:
+            i = bisect_right(self._hashes, zlib.crc32(symbol.encode()))
+            shard = self._assigned[symbol] = self._owners[i % len(self._owners)]
+        return shard
+
+
+class ShardBoard:
+    """
+    Latest trade book report of every shard, combined for the overall summary.
+    """
+
+    def __init__(self, shards: int) -> None:
+        """
+        Initialize the ShardBoard object.
+
+        :param shards: Number of shards.
+        """
+        self.shards = shards
+        self._reports = {}  # shard -> (performance, total profit)
+
+    def update(self, shard: int, performance: dict, total_profit: float) -> None:
+        """
+        Stores a shard's report, replacing its previous one.
+
+        :param shard: Index of the shard.
+        :param performance: The shard's TradeBook.performance() result.
+        :param total_profit: The shard's total profit.
+        :return: None
+        """
+        self._reports[shard] = (performance, total_profit)
+
+    def reported(self) -> int:
+        """
+        :return: Number of shards that have reported.
+        """
+        return len(self._reports)
+
+    def combined(self) -> tuple:
+        """
+        :return: Tuple of the performance of every open entry across shards, in the
+        TradeBook.performance() format, and the summed total profit.
+        """
+        performance = {}
+        total_profit = 0.0
+        for shard in sorted(self._reports):
+            shard_performance, shard_profit = self._reports[shard]
+            for symbol, rows in shard_performance.items():
+                # After a change of shard count an old shard may still hold a moved symbol.
+                performance.setdefault(symbol, []).extend(rows)
+            total_profit += shard_profit
+        return performance, total_profit
+
+
+def relay(source) -> asyncio.Queue:
+    """
+    Moves items from a multiprocessing queue into an asyncio queue of the running loop.
+
+    A daemon thread blocks on the multiprocessing queue, so the event loop never does, and
+    the thread does not hold up the process when it exits.
+
+    :param source: A multiprocessing.Queue.
+    :return: Unbounded asyncio.Queue receiving every item put into `source`.
+    """
+    loop = asyncio.get_running_loop()
+    target = asyncio.Queue()
+
+    def pump() -> None:
+        while True:
+            item = source.get()
+            try:
+                loop.call_soon_threadsafe(target.put_nowait, item)
+            except RuntimeError:
+                return  # The loop has closed.
+            if item is None:
+                return
+
+    threading.Thread(target=pump, name="relay", daemon=True).start()
+    return target
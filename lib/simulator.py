@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+from . import recorder
+from .exchange import USED_WEIGHT_HEADER, request_weight
+from .zscore import TIMEFRAME_MS, MINUTE_MS
+
+
+class Market:
+    """
+    Synthetic futures market: a random-walk price and per-minute volume for each symbol.
+
+    Prices and volumes are derived from the seed, so a run can be repeated exactly.
+    """
+
+    def __init__(self, symbols: list, seed: int = 1) -> None:
+        """
+        Initialize the Market object.
+
+        :param symbols: Symbols to simulate.
+        :param seed: Random seed.
+        """
+        self.random = random.Random(seed)
+        self.prices = {symbol: 10 ** self.random.uniform(-3, 4) for symbol in symbols}
+        self.minute_volume = {symbol: 0.0 for symbol in symbols}
+        self.minute = int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+        self.minute_open = dict(self.prices)
+
+    @property
+    def symbols(self) -> list:
+        return list(self.prices)
+
+    def step(self, symbol: str, volatility: float = 0.001) -> float:
+        """
+        Moves a symbol's price one random step and adds some traded volume.
+
+        :param symbol: Symbol to move.
+        :param volatility: Standard deviation of the relative move.
+        :return: The new price.
+        """
+        self._roll_minute()
+        self.prices[symbol] *= 1 + self.random.gauss(0, volatility)
+        self.minute_volume[symbol] += self.random.expovariate(1 / 50)
+        return self.prices[symbol]
+
+    def klines(self, symbol: str, interval: str, limit: int) -> list:
+        """
+        Klines in exchange format, ending with the bar that is forming now.
+
+        :param symbol: Symbol.
+        :param interval: A key of zscore.TIMEFRAME_MS.
+        :param limit: Number of bars.
+        :return: List of klines.
+        """
+        self._roll_minute()
+        interval_ms = TIMEFRAME_MS[interval]
+        now = int(time.time() * 1000)
+        last_open = now - now % interval_ms
+        bar_random = random.Random(zlib.crc32(f"{symbol}{interval}".encode()))
+        price = self.prices[symbol]
+        bars = []
+        for i in range(limit - 1, -1, -1):
+            open_time = last_open - i * interval_ms
+            if i == 0:
+                candle_open = self.minute_open[symbol] if interval == "1m" else price * (1 + bar_random.gauss(0, 0.002))
+                volume = self.minute_volume[symbol] * (interval_ms // MINUTE_MS if interval != "1m" else 1)
+                close = price
+            else:
+                candle_open = price * (1 + bar_random.gauss(0, 0.01))
+                close = price * (1 + bar_random.gauss(0, 0.01))
+                volume = bar_random.expovariate(1 / (3000 * interval_ms / MINUTE_MS))
+            bars.append([open_time, f"{candle_open:.8f}", f"{max(candle_open, close):.8f}",
+                         f"{min(candle_open, close):.8f}", f"{close:.8f}", f"{volume:.3f}",
+                         open_time + interval_ms - 1, "0", 0, "0", "0", "0"])
+        return bars
+
+    def kline_event(self, symbol: str) -> dict:
+        """
+        :param symbol: Symbol.
+        :return: A kline_1m stream payload for the forming minute.
+        """
+        self._roll_minute()
+        price = self.prices[symbol]
+        return {"e": "kline", "E": int(time.time() * 1000), "s": symbol, "k": {
+            "t": self.minute, "T": self.minute + MINUTE_MS - 1, "s": symbol, "i": "1m",
+            "o": f"{self.minute_open[symbol]:.8f}", "c": f"{price:.8f}", "h": f"{price:.8f}",
+            "l": f"{price:.8f}", "v": f"{self.minute_volume[symbol]:.3f}", "x": False}}
+
+    def mark_price_event(self, symbol: str) -> dict:
+        """
+        :param symbol: Symbol.
+        :return: A markPrice stream payload at the current price.
+        """
+        price = self.prices[symbol]
+        return {"e": "markPriceUpdate", "E": int(time.time() * 1000), "s": symbol, "p": f"{price:.8f}",
+                "i": f"{price:.8f}", "P": f"{price:.8f}", "r": "0.00010000", "T": 0}
+
+    def _roll_minute(self) -> None:
+        minute = int(time.time() * 1000) // MINUTE_MS * MINUTE_MS
+        if minute != self.minute:
+            self.minute = minute
+            self.minute_open = dict(self.prices)
+            self.minute_volume = {symbol: 0.0 for symbol in self.prices}
+
+
+def force_order(symbol: str, side: str, quantity: float, price: float, event_time: int) -> dict:
+    """
+    :return: A forceOrder stream message in exchange format.
+    """
+    return {"e": "forceOrder", "E": event_time, "o": {
+        "s": symbol, "S": side, "o": "LIMIT", "f": "IOC", "q": f"{quantity:.3f}", "p": f"{price:.8f}",
+        "ap": f"{price:.8f}", "X": "FILLED", "l": f"{quantity:.3f}", "z": f"{quantity:.3f}", "T": event_time}}
+
+
+async def synthetic_events(market: Market, rate: float, ramp: float, ramp_every: float, cascade: int):
+    """
+    Generates liquidation cascades: bursts of `cascade` same-side events on one symbol.
+
+    :param market: The simulated market.
+    :param rate: Events per second at the start.
+    :param ramp: Factor the rate is multiplied by every `ramp_every` seconds (1 keeps it flat).
+    :param ramp_every: Seconds between rate increases.
+    :param cascade: Events per burst.
+    :return: Async generator of forceOrder messages.
+    """
+    started = time.monotonic()
+    sent = 0
+    while True:
+        current_rate = rate * ramp ** int((time.monotonic() - started) / ramp_every)
+        symbol = market.random.choice(market.symbols)
+        side = market.random.choice(("BUY", "SELL"))
+        for _ in range(cascade):
+            price = market.step(symbol, 0.003)
+            quantity = market.random.expovariate(1 / 5000) / price
+            yield force_order(symbol, side, quantity, price, int(time.time() * 1000))
+            sent += 1
+        # Sleep to the schedule rather than per event, so high rates are reachable.
+        ahead = sent / current_rate - (time.monotonic() - started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+async def replayed_events(directory: str, speed: float, start: str = None, end: str = None):
+    """
+    Replays a recorded liquidation log with its original timing divided by `speed`.
+
+    :param directory: Directory written by recorder.Recorder.
+    :param speed: Speed multiplier, 10 plays ten times faster than real time.
+    :param start: First day, YYYYMMDD.
+    :param end: Last day, YYYYMMDD.
+    :return: Async generator of forceOrder messages.
+    """
+    first_time = None
+    started = time.monotonic()
+    for _, columns, symbols in recorder.iterate(directory, start, end):
+        for i in range(len(columns["event_time"])):
+            event_time = int(columns["event_time"][i])
+            if first_time is None:
+                first_time = event_time
+            ahead = (event_time - first_time) / 1000 / speed - (time.monotonic() - started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+            side = recorder.SIDES[columns["side"][i]] if columns["side"][i] < len(recorder.SIDES) else "BUY"
+            yield force_order(symbols[columns["symbol"][i]], side, float(columns["quantity"][i]),
+                              float(columns["price"][i]), int(time.time() * 1000))
+
+
+class Simulator:
+    """
+    Local stand-in for the futures REST API and websocket streams.
+
+    Serves /fapi/v1/klines, /fapi/v1/ticker/price, the /ws/!forceOrder@arr stream and the
+    combined /stream endpoint with SUBSCRIBE/UNSUBSCRIBE for kline_1m and markPrice@1s streams. REST responses
+    can be delayed and failed at random to exercise timeouts and retries, and carry the weight
+    used in the current minute like the real API.
+    """
+
+    def __init__(self, market: Market, events, latency: float = 0.0, error_rate: float = 0.0) -> None:
+        """
+        Initialize the Simulator object.
+
+        :param market: The simulated market.
+        :param events: Async generator of forceOrder messages to broadcast.
+        :param latency: Mean added REST latency in seconds (exponentially distributed).
+        :param error_rate: Fraction of REST requests answered with 503 or 429.
+        """
+        self.market = market
+        self.events = events
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sent = 0
+        self.rest_requests = 0
+        self.used_weight = 0
+        self._weight_minute = 0
+        self._liquidation_clients = set()
+        self.app = web.Application()
+        self.app.router.add_get("/fapi/v1/klines", self.klines)
+        self.app.router.add_get("/fapi/v1/ticker/price", self.ticker_price)
+        self.app.router.add_get("/ws/!forceOrder@arr", self.force_orders)
+        self.app.router.add_get("/stream", self.combined_stream)
+        self.app.on_startup.append(self._start_background)
+        self.app.on_response_prepare.append(self._add_used_weight)
+
+    async def _start_background(self, app: web.Application) -> None:
+        app["broadcast"] = asyncio.create_task(self._broadcast())
+        app["report"] = asyncio.create_task(self._report())
+
+    async def _add_used_weight(self, request: web.Request, response: web.StreamResponse) -> None:
+        if not request.path.startswith("/fapi/"):
+            return
+        minute = int(time.time() // 60)
+        if minute != self._weight_minute:
+            self._weight_minute, self.used_weight = minute, 0
+        self.used_weight += request_weight(request.path, dict(request.query))
+        response.headers[USED_WEIGHT_HEADER] = str(self.used_weight)
+
+    async def _inject_faults(self):
+        """
+        :return: An error response to send instead of the real one, or None.
+        """
+        self.rest_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.market.random.expovariate(1 / self.latency))
+        if self.market.random.random() < self.error_rate:
+            if self.market.random.random() < 0.5:
+                return web.json_response({"code": -1003, "msg": "Too many requests."}, status=429,
+                                         headers={"Retry-After": "1"})
+            return web.Response(status=503, text="Service unavailable")
+        return None
+
+    async def klines(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults()
+        if error is not None:
+            return error
+        symbol = request.query.get("symbol")
+        if symbol not in self.market.prices:
+            return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+        limit = min(int(request.query.get("limit", 500)), 1500)
+        return web.json_response(self.market.klines(symbol, request.query.get("interval", "1m"), limit))
+
+    async def ticker_price(self, request: web.Request) -> web.Response:
+        error = await self._inject_faults()
+        if error is not None:
+            return error
+        now = int(time.time() * 1000)
+        return web.json_response([{"symbol": symbol, "price": f"{price:.8f}", "time": now}
+                                  for symbol, price in self.market.prices.items()])
+
+    async def force_orders(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        self._liquidation_clients.add(websocket)
+        try:
+            async for _ in websocket:
+                pass
+        finally:
+            self._liquidation_clients.discard(websocket)
+        return websocket
+
+    async def combined_stream(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        streams = set()
+        pusher = asyncio.create_task(self._push_streams(websocket, streams))
+        try:
+            async for message in websocket:
+                data = json.loads(message.data)
+                params = set(data.get("params", []))
+                if data.get("method") == "SUBSCRIBE":
+                    streams |= params
+                elif data.get("method") == "UNSUBSCRIBE":
+                    streams -= params
+                await websocket.send_json({"result": None, "id": data.get("id")})
+        finally:
+            pusher.cancel()
+        return websocket
+
+    async def _push_streams(self, websocket: web.WebSocketResponse, streams: set) -> None:
+        tick = 0
+        while not websocket.closed:
+            for stream in list(streams):
+                symbol = stream.split("@")[0].upper()
+                if symbol not in self.market.prices:
+                    continue
+                if stream.endswith("@kline_1m"):
+                    self.market.step(symbol, 0.0005)
+                    await websocket.send_json({"stream": stream, "data": self.market.kline_event(symbol)})
+                elif stream.endswith("@markPrice@1s") and tick % 4 == 0:
+                    self.market.step(symbol, 0.001)
+                    await websocket.send_json({"stream": stream, "data": self.market.mark_price_event(symbol)})
+            tick += 1
+            await asyncio.sleep(0.25)
+
+    async def _broadcast(self) -> None:
+        async for event in self.events:
+            message = json.dumps(event)
+            for websocket in list(self._liquidation_clients):
+                if websocket.closed:
+                    continue
+                try:
+                    await websocket.send_str(message)
+                except ConnectionResetError:
+                    # A client going away between the check and the send; the others still get it.
+                    self._liquidation_clients.discard(websocket)
+            self.sent += 1
+
+    async def _report(self) -> None:
+        last_sent, last_rest = 0, 0
+        while True:
+            await asyncio.sleep(10)
+            print(f"Simulator: {(self.sent - last_sent) / 10:.1f} events/s, "
+                  f"{(self.rest_requests - last_rest) / 10:.1f} REST requests/s, "
+                  f"{len(self._liquidation_clients)} liquidation clients")
+            last_sent, last_rest = self.sent, self.rest_requests
+
+
+def main() -> None:
+    """
+    Command line entry point: python -m lib.simulator [options]
+
+    Point the application at it by setting exchange.rest_url to http://HOST:PORT and
+    exchange.stream_url to ws://HOST:PORT in config.yaml.
+    """
+    parser = argparse.ArgumentParser(description="Local Binance futures simulator for replay and load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--symbols", type=int, default=50, help="synthetic symbols to simulate")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=20.0, help="synthetic events per second")
+    parser.add_argument("--ramp", type=float, default=1.0,
+                        help="multiply the synthetic rate by this factor every --ramp-every seconds")
+    parser.add_argument("--ramp-every", type=float, default=30.0)
+    parser.add_argument("--cascade", type=int, default=5, help="events per synthetic cascade")
+    parser.add_argument("--replay", help="replay a recorded liquidation log directory instead")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--start", help="first replay day, YYYYMMDD")
+    parser.add_argument("--end", help="last replay day, YYYYMMDD")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean added REST latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of failed REST requests")
+    args = parser.parse_args()
+
+    symbols = [f"SIM{i}USDT" for i in range(args.symbols)]
+    if args.replay:
+        for _, _, day_symbols in recorder.iterate(args.replay, args.start, args.end):
+            symbols.extend(symbol for symbol in day_symbols if symbol not in symbols)
+    market = Market(symbols, args.seed)
+    if args.replay:
+        events = replayed_events(args.replay, args.speed, args.start, args.end)
+    else:
+        events = synthetic_events(market, args.rate, args.ramp, args.ramp_every, args.cascade)
+    simulator = Simulator(market, events, args.latency, args.error_rate)
+    web.run_app(simulator.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+import abc
+import asyncio
+import json
+import locale
+import os
+import sys
+import time
+from datetime import datetime
+
+from tabulate import tabulate
+
+from . import discord, metrics
+
+# Records a sink takes from its queue for one write.
+BATCH_SIZE = 64
+# Bytes a socket client may fall behind by before it is disconnected.
+SOCKET_CLIENT_BUFFER = 1 << 20
+SEPARATOR = '-' * 65
+
+
+class Alert:
+    """
+    Structured result of evaluating a liquidation inside an ACME zone, handed to the sinks.
+
+    The record only holds the values; every sink formats it when it consumes it, so the
+    processor never renders text. The console and Discord tables are built at most once
+    per record by tables().
+    """
+
+    __slots__ = ("event", "zscores", "zone_rows", "scaled_price", "signal", "time", "_tables")
+
+    def __init__(self, event, zscores: dict, zone_rows: list, scaled_price: float, signal=None) -> None:
+        """
+        Initialize the Alert object.
+
+        :param event: The liquidation event, possibly the aggregate of a cascade.
+        :param zscores: Dictionary of timeframe to volume Z-Score.
+        :param zone_rows: ACME zone rows from get_pnz.
+        :param scaled_price: Scaled close price.
+        :param signal: tradebook.Side of the entry taken, None if the Z-Scores were too low.
+        """
+        self.event = event
+        self.zscores = zscores
+        self.zone_rows = zone_rows
+        self.scaled_price = scaled_price
+        self.signal = signal
+        self.time = time.time()
+        self._tables = None
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "_tables"}
+
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._tables = None
+
+    def tables(self) -> tuple:
+        """
+        :return: Tuple of the Z-Score table and the liquidation table, as plain text.
+        """
+        if self._tables is None:
+            event = self.event
+            zs_table = tabulate([['Z-Score'] + list(self.zscores.values())],
+                                headers=['Timeframe'] + list(self.zscores.keys()),
+                                tablefmt="simple",
+                                floatfmt=".2f")
+            output_table = [
+                ["Symbol", event.symbol],
+                ["Side", "Buyer Liquidated" if event.side == "SELL" else "Seller Liquidated"],
+                ["Quantity", event.quantity_text],
+                ["Price", event.price_text],
+                ["Liquidation Value", locale.currency(round(event.value, 2), grouping=True)],
+            ]
+            if event.count > 1:
+                output_table += [
+                    ["Orders", event.count],
+                    ["Largest Order", locale.currency(round(event.max_value, 2), grouping=True)],
+                ]
+            output_table += [
+                ["Timestamp", datetime.fromtimestamp(self.time).strftime('%Y-%m-%d %H:%M:%S')],
+                ["Scaled Price", self.scaled_price],
+            ] + self.zone_rows
+            self._tables = (zs_table, tabulate(output_table, tablefmt="plain"))
+        return self._tables
+
+    def to_dict(self) -> dict:
+        """
+        :return: The record as JSON-serializable values.
+        """
+        event = self.event
+        return {
+            "time": self.time,
+            "symbol": event.symbol,
+            "side": event.side,
+            "quantity": event.quantity,
+            "price": event.price,
+            "value": event.value,
+            "orders": event.count,
+            "largest_order": event.max_value,
+            "trade_time": event.trade_time,
+            "scaled_price": self.scaled_price,
+            "zscores": self.zscores,
+            "zones": [[label.strip(), list(zone)] for label, zone in self.zone_rows],
+            "signal": None if self.signal is None else self.signal.name,
+        }
+
+
+class Sink(abc.ABC):
+    """
+    Output of alerts with its own bounded queue and consumer task.
+
+    submit() only queues the record, so the processor never waits on a slow terminal, disk,
+    network or reader. When the queue is full the record is dropped for this sink alone.
+    run() takes records in batches and passes them to write(), which subclasses implement.
+    """
+
+    name = "sink"
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        """
+        Initialize the Sink object.
+
+        :param maxsize: Most records waiting in the queue.
+        """
+        self._queue = asyncio.Queue(maxsize)
+        self.written = 0
+        self.dropped = 0
+
+    def wants(self, alert: Alert) -> bool:
+        """
+        :return: Whether the sink outputs the alert; all of them by default.
+        """
+        return True
+
+    def submit(self, alert: Alert) -> None:
+        """
+        Queues an alert without waiting.
+
+        :param alert: The alert.
+        :return: None
+        """
+        if not self.wants(alert):
+            return
+        try:
+            self._queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.SINK_RECORDS.inc(self.name, "dropped")
+
+    async def run(self) -> None:
+        """
+        Writes queued alerts until cancelled. A failed write is reported and its batch lost.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.write(batch)
+            except Exception as e:
+                metrics.SINK_RECORDS.inc(self.name, "failed", amount=len(batch))
+                print(f"{self.name} sink failed to write {len(batch)} alerts: {e!r}")
+                continue
+            self.written += len(batch)
+            metrics.SINK_RECORDS.inc(self.name, "written", amount=len(batch))
+
+    @abc.abstractmethod
+    async def write(self, batch: list) -> None:
+        """
+        Outputs a batch of alerts.
+
+        :param batch: The alerts, oldest first.
+        :return: None
+        """
+
+
+class ConsoleSink(Sink):
+    """
+    Prints alerts as the tables the bot has always shown, writing from a worker thread.
+    """
+
+    name = "console"
+
+    async def write(self, batch: list) -> None:
+        blocks = []
+        for alert in batch:
+            zs_table, table = alert.tables()
+            lines = [SEPARATOR, zs_table, SEPARATOR, table, SEPARATOR]
+            if alert.signal is not None:
+                lines.append(f"{alert.signal.label} conditions are met")
+            blocks.append("\n".join(lines) + "\n")
+        await asyncio.to_thread(self._print, "".join(blocks))
+
+    @staticmethod
+    def _print(text: str) -> None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+class DiscordSink(Sink):
+    """
+    Queues entry alerts for the Discord dispatcher.
+    """
+
+    name = "discord"
+
+    def wants(self, alert: Alert) -> bool:
+        return alert.signal is not None
+
+    async def write(self, batch: list) -> None:
+        for alert in batch:
+            zs_table, table = alert.tables()
+            discord.send_to_channel(zs_table, table, alert.signal.label)
+
+
+class JsonLinesSink(Sink):
+    """
+    Appends every alert to a file as one JSON object per line, from a worker thread.
+    """
+
+    name = "jsonl"
+
+    def __init__(self, path: str, maxsize: int = 1000) -> None:
+        """
+        Initialize the JsonLinesSink object.
+
+        :param path: File to append to; its directory is created if missing.
+        :param maxsize: Most records waiting in the queue.
+        """
+        super().__init__(maxsize)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    async def write(self, batch: list) -> None:
+        text = "".join(json.dumps(alert.to_dict()) + "\n" for alert in batch)
+        await asyncio.to_thread(self._append, text)
+
+    def _append(self, text: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as alerts_file:
+            alerts_file.write(text)
+
+
+class SocketSink(Sink):
+    """
+    Streams every alert as a JSON line to the clients connected to a local TCP port, e.g.
+    `nc 127.0.0.1 9110`. A client that falls more than SOCKET_CLIENT_BUFFER bytes behind is
+    disconnected rather than slowing the others down.
+    """
+
+    name = "socket"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9110, maxsize: int = 1000) -> None:
+        """
+        Initialize the SocketSink object.
+
+        :param host: Interface to listen on.
+        :param port: Port to listen on.
+        :param maxsize: Most records waiting in the queue.
+        """
+        super().__init__(maxsize)
+        self.host = host
+        self.port = port
+        self._clients = set()
+
+    async def run(self) -> None:
+        server = await asyncio.start_server(self._connected, self.host, self.port)
+        print(f"Alerts streamed to clients of {self.host}:{self.port}")
+        async with server:
+            try:
+                await super().run()
+            finally:
+                # Closing the server waits for its connections, so the clients are closed first.
+                for writer in list(self._clients):
+                    writer.close()
+
+    async def _connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._clients.add(writer)
+        try:
+            # Clients only listen; anything they send is discarded until they disconnect.
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def write(self, batch: list) -> None:
+        if not self._clients:
+            return
+        data = "".join(json.dumps(alert.to_dict()) + "\n" for alert in batch).encode()
+        for writer in list(self._clients):
+            if writer.transport.get_write_buffer_size() > SOCKET_CLIENT_BUFFER:
+                self._clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+
+class Fanout:
+    """
+    Hands every alert to each sink's queue, or to a forwarding callable instead.
+    """
+
+    def __init__(self, sinks: list) -> None:
+        """
+        Initialize the Fanout object.
+
+        :param sinks: The sinks.
+        """
+        self.sinks = sinks
+        self._forward = None
+
+    def forward_to(self, callback) -> None:
+        """
+        Hands alerts to `callback` instead of the sinks, as a shard process does to pass them
+        to the coordinator.
+
+        :param callback: Callable taking the alert, or None to use the sinks again.
+        :return: None
+        """
+        self._forward = callback
+
+    def publish(self, alert: Alert) -> None:
+        """
+        :param alert: The alert.
+        :return: None
+        """
+        if self._forward is not None:
+            self._forward(alert)
+            return
+        for sink in self.sinks:
+            sink.submit(alert)
+
+    async def run(self) -> None:
+        """
+        Runs every sink until cancelled.
+        """
+        await asyncio.gather(*(sink.run() for sink in self.sinks))
+
+
+def from_config(settings: dict, discord_enabled: bool = False) -> Fanout:
+    """
+    :param settings: The sinks config section.
+    :param discord_enabled: Whether entry alerts are posted to Discord.
+    :return: Fanout over the enabled sinks.
+    """
+    size = settings["queue_size"]
+    sinks = []
+    if settings["console"]:
+        sinks.append(ConsoleSink(size))
+    if discord_enabled:
+        sinks.append(DiscordSink(size))
+    if settings["jsonl_path"]:
+        sinks.append(JsonLinesSink(settings["jsonl_path"], size))
+    if settings["socket_port"]:
+        sinks.append(SocketSink(settings["socket_host"], settings["socket_port"], size))
+    return Fanout(sinks)
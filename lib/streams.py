@@ -0,0 +1,277 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import websockets
+
+from . import events, metrics
+
+# Streams per SUBSCRIBE/UNSUBSCRIBE request.
+SUBSCRIBE_CHUNK = 200
+# Seconds between control messages; Binance allows 10 incoming messages per second.
+CONTROL_INTERVAL = 0.25
+# Longest wait between reconnection attempts, in seconds.
+MAX_RECONNECT_DELAY = 30
+# Seconds a redundant connection must stay open for its reconnection backoff to reset.
+HEALTHY_CONNECTION = 30
+
+
+class StreamClient:
+    """
+    Combined-stream websocket client with dynamic subscriptions.
+
+    Streams can be added and removed at any time with subscribe() and unsubscribe(); the client
+    sends the matching SUBSCRIBE/UNSUBSCRIBE requests over a single connection. If the connection
+    drops it reconnects with exponential backoff and subscribes to everything again.
+
+    Every stream payload is passed to the handler as handler(stream_name, data).
+    """
+
+    def __init__(self, url: str, handler, on_disconnect=None) -> None:
+        """
+        Initialize the StreamClient object.
+
+        :param url: Base websocket URL, e.g. 'wss://fstream.binance.com'.
+        :param handler: Callable receiving the stream name and the decoded payload.
+        :param on_disconnect: Optional callable run whenever the connection is lost.
+        """
+        self.url = url.rstrip("/") + "/stream"
+        self.handler = handler
+        self.on_disconnect = on_disconnect
+        self.connected = False
+        self._desired = set()
+        self._active = set()
+        self._changed = asyncio.Event()
+        self._request_id = 0
+
+    @property
+    def streams(self) -> set:
+        """
+        :return: The streams the client is, or will be, subscribed to.
+        """
+        return set(self._desired)
+
+    def subscribe(self, *streams: str) -> None:
+        """
+        Adds streams to the subscription set.
+
+        :param streams: Stream names, e.g. 'btcusdt@kline_1m'.
+        :return: None
+        """
+        self._desired.update(streams)
+        self._changed.set()
+
+    def unsubscribe(self, *streams: str) -> None:
+        """
+        Removes streams from the subscription set.
+
+        :param streams: Stream names.
+        :return: None
+        """
+        self._desired.difference_update(streams)
+        self._changed.set()
+
+    async def run(self) -> None:
+        """
+        Keeps the connection open for as long as the task runs, reconnecting when it drops.
+        """
+        delay = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=10) as websocket:
+                    self.connected = True
+                    delay = 1
+                    self._active.clear()
+                    self._changed.set()
+                    sync = asyncio.create_task(self._sync_subscriptions(websocket))
+                    try:
+                        async for message in websocket:
+                            try:
+                                self._dispatch(message)
+                            except Exception as e:
+                                # One bad payload or handler error must not end the stream.
+                                metrics.STREAM_MESSAGE_ERRORS.inc()
+                                print(f"Stream message from {self.url} failed: {e!r}")
+                    finally:
+                        sync.cancel()
+            except (websockets.exceptions.WebSocketException, OSError) as e:
+                print(f"Stream connection to {self.url} lost: {e}. Retrying connection...")
+            finally:
+                self.connected = False
+                if self.on_disconnect is not None:
+                    self.on_disconnect()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _dispatch(self, message: str) -> None:
+        """
+        Routes a received message to the handler, or reports a failed control request.
+
+        :param message: Raw websocket message.
+        :return: None
+        """
+        data = json.loads(message)
+        if "stream" in data:
+            self.handler(data["stream"], data["data"])
+        elif data.get("error"):
+            print(f"Stream request {data.get('id')} failed: {data['error']}")
+
+    async def _sync_subscriptions(self, websocket) -> None:
+        """
+        Sends SUBSCRIBE/UNSUBSCRIBE requests whenever the subscription set changes.
+
+        :param websocket: The open connection.
+        :return: None
+        """
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            for method, streams in (("UNSUBSCRIBE", self._active - self._desired),
+                                    ("SUBSCRIBE", self._desired - self._active)):
+                streams = sorted(streams)
+                for i in range(0, len(streams), SUBSCRIBE_CHUNK):
+                    chunk = streams[i:i + SUBSCRIBE_CHUNK]
+                    self._request_id += 1
+                    await websocket.send(json.dumps({"method": method, "params": chunk, "id": self._request_id}))
+                    if method == "SUBSCRIBE":
+                        self._active.update(chunk)
+                    else:
+                        self._active.difference_update(chunk)
+                    await asyncio.sleep(CONTROL_INTERVAL)
+
+
+class RedundantStream:
+    """
+    Several connections to one raw websocket stream, merged into a single de-duplicated feed.
+
+    Every connection receives every message. A message is handed to the handler by the first
+    connection to deliver it and dropped when the others deliver it again, so the feed is as
+    fast as the fastest connection and a connection dropping or reconnecting costs no
+    messages while another one is open.
+
+    The exchange closes connections after 24 hours, so each one is replaced after `lifetime`
+    seconds. The first lifetimes are staggered over the connections, so they are never
+    replaced together, and a replacement is opened before the connection it replaces is
+    closed, which keeps even a single connection gap-free.
+    """
+
+    def __init__(self, url: str, handler, key, connections: int = 2, lifetime: float = 82800.0,
+                 dedup_size: int = 10000) -> None:
+        """
+        Initialize the RedundantStream object.
+
+        :param url: Full websocket URL of the stream, e.g. 'wss://fstream.binance.com/ws/!forceOrder@arr'.
+        :param handler: Coroutine function receiving each decoded message once.
+        :param key: Callable returning the identity of a decoded message, equal for its copies.
+        :param connections: Connections held open at once.
+        :param lifetime: Seconds a connection is kept before it is replaced.
+        :param dedup_size: Recent message keys remembered to recognise a duplicate.
+        """
+        self.url = url
+        self.handler = handler
+        self.key = key
+        self.connections = connections
+        self.lifetime = lifetime
+        self.open = 0
+        self._seen = set()
+        self._order = deque(maxlen=dedup_size)
+
+    async def run(self) -> None:
+        """
+        Holds the connections open until cancelled.
+        """
+        await asyncio.gather(*(self._hold(index) for index in range(self.connections)))
+
+    async def _hold(self, index: int) -> None:
+        """
+        Keeps one connection slot open: reconnects when the connection drops, with backoff
+        when it keeps failing, and replaces it when its lifetime is over.
+
+        :param index: Index of the slot, which staggers its first lifetime.
+        """
+        deadline = time.monotonic() + self.lifetime * (index + 1) / self.connections
+        delay = 0
+        current = None  # Connection kept reading until its replacement is open.
+        connection = None
+        try:
+            while True:
+                if delay:
+                    await asyncio.sleep(delay)
+                ready = asyncio.Event()
+                connection = asyncio.create_task(self._connection(ready))
+                opened = asyncio.create_task(ready.wait())
+                await asyncio.wait((connection, opened), return_when=asyncio.FIRST_COMPLETED)
+                opened.cancel()
+                if not ready.is_set():
+                    metrics.STREAM_CONNECTIONS.inc("failed")
+                    print(f"Stream connection {index} to {self.url} failed: {connection.exception()!r}. "
+                          f"Retrying connection...")
+                    delay = min(max(delay * 2, 1), MAX_RECONNECT_DELAY)
+                    continue
+                metrics.STREAM_CONNECTIONS.inc("opened")
+                if current is not None:
+                    current.cancel()
+                    current = None
+                started = time.monotonic()
+                done, _ = await asyncio.wait((connection,), timeout=max(0.0, deadline - started))
+                if not done:
+                    # Lifetime over: the connection keeps reading until its replacement opens.
+                    metrics.STREAM_CONNECTIONS.inc("rotated")
+                    current, connection = connection, None
+                    # Even after a reconnection that ran past the deadline, the next rotation
+                    # is at least half a lifetime away.
+                    deadline = max(deadline + self.lifetime, time.monotonic() + self.lifetime / 2)
+                    delay = 0
+                    continue
+                # A reconnection keeps the slot's deadline, so the lifetimes stay staggered.
+                metrics.STREAM_CONNECTIONS.inc("dropped")
+                error = connection.exception()
+                print(f"Stream connection {index} to {self.url} closed"
+                      f"{f': {error!r}' if error is not None else ''}. Reconnecting...")
+                if time.monotonic() - started >= HEALTHY_CONNECTION:
+                    delay = 0
+                else:
+                    delay = min(max(delay * 2, 1), MAX_RECONNECT_DELAY)
+        finally:
+            for task in (current, connection):
+                if task is not None:
+                    task.cancel()
+
+    async def _connection(self, ready: asyncio.Event) -> None:
+        """
+        Reads one connection until it closes.
+
+        :param ready: Event set once the connection is open.
+        """
+        async with websockets.connect(self.url, ping_interval=20, ping_timeout=10) as websocket:
+            ready.set()
+            self.open += 1
+            try:
+                async for message in websocket:
+                    try:
+                        await self._receive(message)
+                    except Exception as e:
+                        # Every connection gets the same bad message; none of them may end over it.
+                        metrics.STREAM_MESSAGE_ERRORS.inc()
+                        print(f"Stream message from {self.url} failed: {e!r}")
+            finally:
+                self.open -= 1
+
+    async def _receive(self, message) -> None:
+        """
+        Hands a message to the handler unless another connection already delivered it.
+
+        :param message: Raw websocket message.
+        :return: None
+        """
+        decoded = events.loads(message)
+        key = self.key(decoded)
+        if key in self._seen:
+            metrics.STREAM_DUPLICATES.inc()
+            return
+        if len(self._order) == self._order.maxlen:
+            self._seen.discard(self._order[0])
+        self._order.append(key)
+        self._seen.add(key)
+        await self.handler(decoded)
@@ -0,0 +1,354 @@
+import heapq
+import itertools
+from array import array
+from enum import IntEnum
+
+import numpy as np
+
+# Exit levels in percent, as market_exits has always applied them.
+TAKE_PROFIT = 0.6
+STOP_LOSS = -0.5
+# Relative slack when reading triggers from the heaps. Candidates are confirmed with the exact
+# gain formula, so rounding in the precomputed trigger prices never changes an exit decision.
+TRIGGER_TOLERANCE = 1e-9
+# Exited entries a symbol may hold before its arrays are compacted.
+COMPACT_MIN_DEAD = 32
+
+
+class Side(IntEnum):
+    """
+    Side of an open entry. The value is the sign of the P&L of a price rise.
+    """
+
+    BUY = 1
+    SELL = -1
+
+    @property
+    def label(self) -> str:
+        """
+        :return: The side as shown in alerts and the trade summary.
+        """
+        return SIDE_LABELS[self]
+
+
+SIDE_LABELS = {
+    Side.BUY: "🟩 🟩 🟩 BUY 🟩 🟩 🟩",
+    Side.SELL: "🟥 🟥 🟥 SELL 🟥 🟥 🟥",
+}
+# Side by stored value, faster than calling Side() per entry.
+_SIDES = {side.value: side for side in Side}
+
+
+class Exit:
+    """
+    An entry closed by a price update.
+    """
+
+    __slots__ = ("entry_id", "symbol", "side", "entry_price", "exit_price", "gain")
+
+    def __init__(self, entry_id: int, symbol: str, side: Side, entry_price: float, exit_price: float,
+                 gain: float) -> None:
+        self.entry_id = entry_id
+        self.symbol = symbol
+        self.side = side
+        self.entry_price = entry_price
+        self.exit_price = exit_price
+        self.gain = gain
+
+    def __repr__(self) -> str:
+        return f"Exit({self.symbol} #{self.entry_id} {self.side.name} {self.entry_price} -> {self.exit_price}, {self.gain:.3f}%)"
+
+
+class _SymbolEntries:
+    """
+    Open entries of one symbol: parallel arrays in entry order plus two trigger heaps.
+
+    The upper min-heap holds the price at or above which each entry exits (a long's take
+    profit, a short's stop loss), the lower heap, negated into a min-heap, the price at or below
+    which it exits. An entry closed through one heap stays in the other until it surfaces there
+    and is skipped (lazy deletion).
+    """
+
+    __slots__ = ("ids", "prices", "sides", "open", "slots", "upper", "lower", "dead")
+
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.prices = array("d")
+        self.sides = array("b")
+        self.open = array("b")
+        self.slots = {}  # entry id -> index into the arrays
+        self.upper = []  # (trigger price, entry id)
+        self.lower = []  # (-trigger price, entry id)
+        self.dead = 0
+
+    def __len__(self) -> int:
+        return len(self.ids) - self.dead
+
+
+class TradeBook:
+    """
+    Open entries per symbol with precomputed exit triggers.
+
+    Every entry exits once its percentage gain reaches `take_profit` or falls to `stop_loss`.
+    Those levels are turned into two trigger prices when the entry is added and kept in
+    per-symbol heaps, so a price update only looks at the entries whose triggers it crossed,
+    O(k log n) for k exits among n entries, instead of rescanning every entry.
+
+    Entries are stored in arrays per symbol, so the open P&L of a symbol is computed for all of
+    its entries at once with NumPy.
+
+    When a journal is attached (see journal.TradeJournal) every opened and closed entry is
+    reported to it.
+    """
+
+    def __init__(self, take_profit: float = TAKE_PROFIT, stop_loss: float = STOP_LOSS) -> None:
+        """
+        Initialize the TradeBook object.
+
+        :param take_profit: Gain in percent at which an entry is closed, e.g. 0.6.
+        :param stop_loss: Gain in percent at or below which an entry is closed, e.g. -0.5.
+        """
+        if take_profit <= 0 or stop_loss >= 0:
+            raise ValueError("Take profit must be positive and stop loss negative.")
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.total_profit = 0.0
+        self.journal = None
+        self._symbols = {}
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        """
+        :return: Number of open entries over all symbols.
+        """
+        return sum(len(entries) for entries in self._symbols.values())
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._symbols
+
+    @property
+    def next_id(self) -> int:
+        """
+        :return: The id the next new entry will get.
+        """
+        return self._next_id
+
+    def restore_id(self, next_id: int) -> None:
+        """
+        Makes new entries continue from a saved id, so ids are never reused after a restart.
+
+        :param next_id: The saved next_id.
+        :return: None
+        """
+        self._next_id = max(self._next_id, next_id)
+
+    def symbols(self) -> list:
+        """
+        :return: Symbols with at least one open entry.
+        """
+        return list(self._symbols)
+
+    def entries(self, symbol: str) -> list:
+        """
+        :param symbol: Symbol.
+        :return: List of (entry id, entry price, side) of the symbol's open entries, oldest first.
+        """
+        book = self._symbols.get(symbol)
+        if book is None:
+            return []
+        return [(book.ids[i], book.prices[i], _SIDES[book.sides[i]])
+                for i in range(len(book.ids)) if book.open[i]]
+
+    def triggers(self, price: float, side: Side) -> tuple:
+        """
+        :param price: Entry price.
+        :param side: Entry side.
+        :return: Tuple of (upper, lower) exit trigger prices of an entry.
+        """
+        if side == Side.BUY:
+            return price * (1 + self.take_profit / 100), price * (1 + self.stop_loss / 100)
+        return price * (1 - self.stop_loss / 100), price * (1 - self.take_profit / 100)
+
+    def gain(self, entry_price: float, price: float, side: Side) -> float:
+        """
+        :return: Percentage gain of an entry at the given price, computed as market_exits always has.
+        """
+        if side == Side.BUY:
+            return ((price - entry_price) / entry_price) * 100
+        return ((entry_price - price) / entry_price) * 100
+
+    def add(self, symbol: str, price: float, side: Side, entry_id: int = None) -> int:
+        """
+        Opens an entry.
+
+        :param symbol: Symbol.
+        :param price: Entry price (scaled).
+        :param side: Entry side.
+        :param entry_id: Identifier to use, for restoring a saved book; a new one by default.
+        :return: The entry id.
+        """
+        if entry_id is None:
+            entry_id = self._next_id
+        self._next_id = max(self._next_id, entry_id + 1)
+        book = self._symbols.get(symbol)
+        if book is None:
+            book = self._symbols[symbol] = _SymbolEntries()
+        book.slots[entry_id] = len(book.ids)
+        book.ids.append(entry_id)
+        book.prices.append(price)
+        book.sides.append(side)
+        book.open.append(1)
+        upper, lower = self.triggers(price, side)
+        heapq.heappush(book.upper, (upper, entry_id))
+        heapq.heappush(book.lower, (-lower, entry_id))
+        if self.journal is not None:
+            self.journal.opened(entry_id, symbol, price, side)
+        return entry_id
+
+    def add_many(self, symbol: str, entry_ids: list, prices: list, sides: list) -> None:
+        """
+        Opens many entries of one symbol at once, heapifying the triggers instead of pushing
+        them one by one. Used to restore a saved book; the journal is not told.
+
+        :param symbol: Symbol.
+        :param entry_ids: Entry ids, oldest first.
+        :param prices: Entry prices (scaled).
+        :param sides: Entry sides, as Side or its int value.
+        :return: None
+        """
+        if not entry_ids:
+            return
+        book = self._symbols.get(symbol)
+        if book is None:
+            book = self._symbols[symbol] = _SymbolEntries()
+        book.slots.update(zip(entry_ids, range(len(book.ids), len(book.ids) + len(entry_ids))))
+        book.ids.extend(entry_ids)
+        # The factors of triggers(), applied to the whole batch.
+        buy_upper, buy_lower = 1 + self.take_profit / 100, 1 + self.stop_loss / 100
+        sell_upper, sell_lower = 1 - self.stop_loss / 100, 1 - self.take_profit / 100
+        book.upper.extend(zip([price * (buy_upper if side == Side.BUY else sell_upper)
+                               for price, side in zip(prices, sides)], entry_ids))
+        book.lower.extend(zip([-price * (buy_lower if side == Side.BUY else sell_lower)
+                               for price, side in zip(prices, sides)], entry_ids))
+        book.prices.extend(prices)
+        book.sides.extend(sides)
+        book.open.extend([1] * len(entry_ids))
+        heapq.heapify(book.upper)
+        heapq.heapify(book.lower)
+        self._next_id = max(self._next_id, max(entry_ids) + 1)
+
+    def close(self, symbol: str, entry_id: int, gain: float) -> bool:
+        """
+        Closes an entry with a known gain, as when replaying a journal.
+
+        :param symbol: Symbol of the entry.
+        :param entry_id: The entry id.
+        :param gain: Gain in percent added to total_profit.
+        :return: True if the entry was open.
+        """
+        book = self._symbols.get(symbol)
+        slot = book.slots.get(entry_id) if book is not None else None
+        if slot is None or not book.open[slot]:
+            return False
+        book.open[slot] = 0
+        book.dead += 1
+        self.total_profit += gain
+        if not len(book):
+            del self._symbols[symbol]
+        elif book.dead >= COMPACT_MIN_DEAD and book.dead * 2 >= len(book.ids):
+            self._compact(book)
+        return True
+
+    def update(self, symbol: str, price: float) -> list:
+        """
+        Applies a price to a symbol and closes the entries whose exit levels it reached.
+
+        The gain of each closed entry is added to total_profit, and the symbol is removed once
+        it has no open entries left.
+
+        :param symbol: Symbol.
+        :param price: Live price (scaled).
+        :return: List of Exit, in the order the entries were closed.
+        """
+        book = self._symbols.get(symbol)
+        if book is None:
+            return []
+        exits = []
+        self._drain(book, symbol, price, book.upper, 1, exits)
+        self._drain(book, symbol, price, book.lower, -1, exits)
+        if not len(book):
+            del self._symbols[symbol]
+        elif book.dead >= COMPACT_MIN_DEAD and book.dead * 2 >= len(book.ids):
+            self._compact(book)
+        return exits
+
+    def performance(self, prices: dict) -> dict:
+        """
+        Open P&L of every entry of the symbols that have a price.
+
+        The gains of all entries are computed in one vectorized pass over the concatenated
+        entry arrays.
+
+        :param prices: Dictionary of symbol to live price (scaled).
+        :return: Dictionary of symbol to a list of (entry price, live price, percentage gain, side)
+        tuples, one per open entry in the order the entries were opened.
+        """
+        priced = [(symbol, book, prices[symbol]) for symbol, book in self._symbols.items() if symbol in prices]
+        if not priced:
+            return {}
+        lengths = [len(book.ids) for _, book, _ in priced]
+        is_open = np.concatenate([np.frombuffer(book.open, dtype=np.int8) for _, book, _ in priced]) != 0
+        entry_prices = np.concatenate([np.frombuffer(book.prices, dtype=np.float64) for _, book, _ in priced])
+        sides = np.concatenate([np.frombuffer(book.sides, dtype=np.int8) for _, book, _ in priced])
+        live_prices = np.repeat(np.array([price for _, _, price in priced], dtype=np.float64), lengths)
+        gains = np.where(sides == Side.BUY, (live_prices - entry_prices) / entry_prices,
+                         (entry_prices - live_prices) / entry_prices) * 100
+
+        rows = zip(entry_prices.tolist(), gains.tolist(), sides.tolist(), is_open.tolist())
+        performance = {}
+        for (symbol, _, price), length in zip(priced, lengths):
+            performance[symbol] = [(entry_price, price, gain, _SIDES[side])
+                                   for entry_price, gain, side, open_ in itertools.islice(rows, length) if open_]
+        return performance
+
+    def _drain(self, book: _SymbolEntries, symbol: str, price: float, heap: list, sign: int, exits: list) -> None:
+        """
+        Closes the entries of one heap whose trigger the price has reached.
+
+        :param sign: 1 for the upper heap, -1 for the negated lower heap.
+        """
+        limit = sign * price * (1 + sign * TRIGGER_TOLERANCE)
+        while heap and heap[0][0] <= limit:
+            trigger, entry_id = heapq.heappop(heap)
+            slot = book.slots.get(entry_id)
+            if slot is None or not book.open[slot]:
+                continue  # Closed through the other heap.
+            side = _SIDES[book.sides[slot]]
+            entry_price = book.prices[slot]
+            gain = self.gain(entry_price, price, side)
+            if not (gain >= self.take_profit or gain <= self.stop_loss):
+                # Within rounding of the trigger but not an exit by the exact formula.
+                heapq.heappush(heap, (trigger, entry_id))
+                break
+            book.open[slot] = 0
+            book.dead += 1
+            self.total_profit += gain
+            exits.append(Exit(entry_id, symbol, side, entry_price, price, gain))
+            if self.journal is not None:
+                self.journal.closed(entry_id, symbol, gain)
+
+    def _compact(self, book: _SymbolEntries) -> None:
+        """
+        Drops closed entries from a symbol's arrays and heaps.
+        """
+        keep = [i for i in range(len(book.ids)) if book.open[i]]
+        book.ids = array("q", (book.ids[i] for i in keep))
+        book.prices = array("d", (book.prices[i] for i in keep))
+        book.sides = array("b", (book.sides[i] for i in keep))
+        book.open = array("b", [1]) * len(keep)
+        book.slots = {entry_id: i for i, entry_id in enumerate(book.ids)}
+        book.upper = [item for item in book.upper if item[1] in book.slots]
+        book.lower = [item for item in book.lower if item[1] in book.slots]
+        heapq.heapify(book.upper)
+        heapq.heapify(book.lower)
+        book.dead = 0
@@ -0,0 +1,219 @@
+import time
+from collections import deque
+from math import sqrt
+
+# Supported Z-Score timeframes and their length in milliseconds.
+TIMEFRAME_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "2h": 120 * 60_000,
+    "4h": 240 * 60_000,
+}
+MINUTE_MS = TIMEFRAME_MS["1m"]
+# Placeholder returned when there is not enough data for a Z-Score.
+NEW_MARKET = "new market"
+
+
+class RollingWindow:
+    """
+    Rolling volume statistics for one timeframe.
+
+    The window mirrors a REST kline request with limit `lookback`: `lookback - 1` closed bars
+    followed by the bar currently forming. Mean and sum of squared deviations of the closed bars
+    are maintained incrementally (Welford), so a Z-Score query is O(1).
+    """
+
+    def __init__(self, interval_ms: int, lookback: int) -> None:
+        """
+        Initialize the RollingWindow object.
+
+        :param interval_ms: Bar length in milliseconds.
+        :param lookback: Number of bars in the window, including the forming bar.
+        """
+        self.interval_ms = interval_ms
+        self.closed = deque(maxlen=lookback - 1)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.open_time = None
+        self.volume = 0.0
+        self._pushes = 0
+
+    def seed(self, bars: list) -> None:
+        """
+        Resets the window from REST klines, oldest first, the last one being the forming bar.
+
+        :param bars: Klines as returned by the exchange.
+        :return: None
+        """
+        self.closed.clear()
+        self.mean = self.m2 = 0.0
+        for bar in bars[:-1]:
+            self._push(float(bar[5]))
+        if bars:
+            self.open_time = int(bars[-1][0])
+            self.volume = float(bars[-1][5])
+
+    def add(self, minute_open: int, delta: float) -> None:
+        """
+        Adds traded volume from a 1m candle to the bar it belongs to, closing bars as time moves on.
+
+        :param minute_open: Open time of the 1m candle in milliseconds.
+        :param delta: Volume traded since the last update.
+        :return: None
+        """
+        bar_open = minute_open - minute_open % self.interval_ms
+        if self.open_time is None:
+            self.open_time = bar_open
+        elif bar_open > self.open_time:
+            self._push(self.volume)
+            # Bars without any updates traded nothing.
+            skipped = min((bar_open - self.open_time) // self.interval_ms - 1, self.closed.maxlen)
+            for _ in range(skipped):
+                self._push(0.0)
+            self.open_time = bar_open
+            self.volume = 0.0
+        elif bar_open < self.open_time:
+            return
+        self.volume += delta
+
+    def zscore(self):
+        """
+        Z-Score of the last closed bar against the mean and sample standard deviation of the
+        whole window, forming bar included.
+
+        :return: The Z-Score, or NEW_MARKET if there is not enough data.
+        """
+        count = len(self.closed)
+        if count < 1:
+            return NEW_MARKET
+        # Fold the forming bar into the closed bar statistics.
+        delta = self.volume - self.mean
+        mean = self.mean + delta / (count + 1)
+        m2 = self.m2 + delta * (self.volume - mean)
+        if m2 <= 0:
+            return NEW_MARKET
+        return (self.closed[-1] - mean) / sqrt(m2 / count)
+
+    def _push(self, value: float) -> None:
+        """
+        Appends a closed bar volume, evicting the oldest one when the window is full.
+
+        :param value: Volume of the closed bar.
+        :return: None
+        """
+        closed = self.closed
+        if len(closed) == closed.maxlen:
+            if closed.maxlen == 0:
+                return
+            old = closed[0]
+            closed.append(value)
+            old_mean = self.mean
+            self.mean += (value - old) / len(closed)
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+            self._pushes += 1
+            if self._pushes >= len(closed):
+                # Recompute exactly once per full turnover to stop rounding errors accumulating.
+                self._pushes = 0
+                self.mean = sum(closed) / len(closed)
+                self.m2 = sum((v - self.mean) ** 2 for v in closed)
+        else:
+            closed.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(closed)
+            self.m2 += delta * (value - self.mean)
+
+
+class VolumeEngine:
+    """
+    Per-symbol volume Z-Score engine.
+
+    Each configured timeframe is seeded once from REST klines. From then on the engine is fed
+    1m candle updates and builds the higher timeframe bars locally, so Z-Scores are read from
+    memory without any network round-trip. The values match what a fresh REST fetch of
+    `lookback` candles per timeframe would give.
+    """
+
+    def __init__(self, lookback: int, timeframes: list) -> None:
+        """
+        Initialize the VolumeEngine object.
+
+        :param lookback: Candles per timeframe used for the Z-Score.
+        :param timeframes: Timeframes to track, keys of TIMEFRAME_MS.
+        """
+        self.windows = {timeframe: RollingWindow(TIMEFRAME_MS[timeframe], lookback)
+                        for timeframe in timeframes}
+        self.minute_open = None
+        self.minute_volume = 0.0
+        self.valid = True
+
+    def seed(self, timeframe: str, bars: list, now_ms: int = None) -> None:
+        """
+        Seeds one timeframe from REST klines.
+
+        Without 1m klines the minute in progress is taken from the wall clock. How much of its
+        volume the forming bars already hold is not known then, so updates of that minute only
+        count from the first one on.
+
+        :param timeframe: The timeframe the klines belong to.
+        :param bars: Klines as returned by the exchange, oldest first.
+        :param now_ms: Current time in milliseconds, the wall clock by default.
+        :return: None
+        """
+        self.windows[timeframe].seed(bars)
+        if not bars:
+            return
+        if timeframe == "1m":
+            self.minute_open = int(bars[-1][0])
+            self.minute_volume = float(bars[-1][5])
+        elif "1m" not in self.windows:
+            if now_ms is None:
+                now_ms = int(time.time() * 1000)
+            minute_open = max(now_ms - now_ms % MINUTE_MS, int(bars[-1][0]))
+            if self.minute_open is None or minute_open > self.minute_open:
+                self.minute_open = minute_open
+                self.minute_volume = None
+
+    def update(self, minute_open: int, volume: float) -> bool:
+        """
+        Applies a 1m candle update. The volume is the candle's cumulative volume so far.
+
+        Updates for the current or the next minute are applied; older ones are ignored. If a
+        minute was skipped the higher timeframe bars can no longer be trusted and the engine
+        is marked invalid.
+
+        :param minute_open: Open time of the 1m candle in milliseconds.
+        :param volume: Volume of the candle so far.
+        :return: False if the engine is invalid and needs to be seeded again, True otherwise.
+        """
+        if self.minute_open is None or minute_open == self.minute_open + MINUTE_MS:
+            delta = volume
+        elif minute_open == self.minute_open:
+            delta = 0.0 if self.minute_volume is None else volume - self.minute_volume
+        elif minute_open < self.minute_open:
+            return self.valid
+        else:
+            self.valid = False
+            return False
+        self.minute_open = minute_open
+        self.minute_volume = volume
+        for window in self.windows.values():
+            window.add(minute_open, delta)
+        return self.valid
+
+    def is_current(self, now_ms: int) -> bool:
+        """
+        :param now_ms: Current time in milliseconds.
+        :return: True if the engine is valid and has seen the minute that is currently forming.
+        """
+        return self.valid and self.minute_open is not None \
+            and self.minute_open >= now_ms - now_ms % MINUTE_MS
+
+    def zscores(self) -> dict:
+        """
+        :return: Dictionary of timeframe to Z-Score (or NEW_MARKET) in the configured order.
+        """
+        return {timeframe: window.zscore() for timeframe, window in self.windows.items()}
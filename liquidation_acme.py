@@ -1,260 +1,343 @@
 import asyncio
-import json
-import locale
-import queue
-import statistics
-from datetime import datetime
-
-import websockets
-from tabulate import tabulate
-from websockets import exceptions
-
-from config import Config
-from Lib import acme, exchange, discord
-
-locale.setlocale(locale.LC_MONETARY, 'en_US.UTF-8')
-messages = queue.Queue()
-conf = Config("config.yaml")
-
-# Initiate Acme
-acme.init()
-# Keep track of when each symbol was last calculated
-cache = {}
-# Store the Z-Score timeframes
-zscore_tables = {}
-# Output formatting for tables
-output_table = []
-output_confirmation = []
-# Keep track of open trades
-trade_book = {}
-
-
-
-async def binance_liquidations() -> None:
+import time
+
+from context import AppContext
+from lib import acme, exchange, events, metrics, sinks, streams, zscore
+from lib.candles import OPEN, CLOSE
+from lib.tradebook import Side, TradeBook
+
+# Configuration and components of this process, created on first use; see use_context().
+context = AppContext()
+# Marker shown next to each ACME zone level
+PNZ_EMOJI = {
+    1: "⬜",
+    3: "🟨",
+    4: "🟦",
+    5: "🟩",
+    6: "🟪",
+}
+
+
+def use_context(app: AppContext) -> None:
     """
-    This is an asynchronous coroutine that establishes a connection with the Binance
+    Makes the processing functions use `app`, e.g. one reading another configuration file.
+    Must be called before the current context's components are used.
+
+    :param app: The application context.
+    :return: None
+    """
+    global context
+    context = app
+
+
+async def binance_liquidations(deliver=None) -> None:
+    """
+    This is an asynchronous coroutine that holds several connections to the Binance
     cryptocurrency exchange's liquidation data websocket server and continuously monitors
     the stream of data.
 
-    If the connection to the server is lost, the function automatically attempts to
-    reconnect after a brief delay.
+    Every connection receives every liquidation; the first copy of each one is used and the
+    others are dropped, matched on symbol, trade time, quantity and price. A connection that
+    is lost is reopened while the others keep delivering, and each connection is replaced
+    before the server's 24 hour disconnect, at staggered times, so reconnecting costs no
+    events. See `liquidation_stream` in the configuration.
 
     Each message received from the server is a JSON string representing a liquidation
-    event. The function loads the JSON string into a Python dictionary and puts it into
-    a global queue for further processing.
+    event. The function decodes it once into a LiquidationEvent and hands it to the
+    coalescer, which merges the orders of a cascade on one symbol and side and puts the
+    aggregate into a global bounded priority queue, keyed by liquidation value, for further
+    processing. Depending on the configured overflow policy a full queue either pauses
+    reading from the websocket or sheds queued events.
+
+    :param deliver: Coroutine function the decoded events are passed to instead of the
+    coalescer, e.g. the coordinator's routing to shard processes.
+    """
+    deliver = deliver or context.coalescer.put
+    recorder = context.recorder
+
+    async def handle(message: dict) -> None:
+        received = time.time()
+        metrics.LIQUIDATIONS_RECEIVED.inc()
+        if recorder is not None:
+            recorder.record(message)
+        event = events.LiquidationEvent.from_message(message)
+        # Clock skew can put the trade time slightly ahead of the receive time.
+        metrics.STAGE_SECONDS.observe(max(0.0, received - event.trade_time / 1000), "stream")
+        await deliver(event)
+
+    stream = streams.RedundantStream(f"{exchange.settings['stream_url']}/ws/!forceOrder@arr", handle,
+                                     liquidation_key, **context.conf.liquidation_stream)
+    await stream.run()
+
+
+def liquidation_key(message: dict) -> tuple:
+    """
+    :param message: A decoded forceOrder message.
+    :return: Identity of the liquidation, the same in every connection's copy of it.
+    """
+    order = message["o"]
+    return order["s"], order["T"], order["q"], order["p"]
+
+
+async def process_messages() -> None:
     """
-    while True:  # Add a loop for automatic reconnection
+    This function is an asynchronous coroutine that runs a pool of `conf.workers` worker
+    coroutines taking liquidation events from the global queue.
+
+    Every worker claims the symbol with the largest queued event whenever it is free, so
+    events are processed largest liquidation first whenever they back up, and a slow symbol
+    only holds up its own worker. Events for one symbol are handled one at a time, in the
+    order they were queued: while a symbol is being processed its other events stay in the
+    queue, where they count towards its size and overflow policy. The workers sleep on the
+    queue while nothing can be claimed rather than polling it.
+    """
+    workers = [asyncio.create_task(process_worker()) for _ in range(context.conf.workers)]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+async def process_worker() -> None:
+    """
+    Worker coroutine claiming events from the global queue, one at a time.
+
+    An error while processing one event is reported and does not stop the worker.
+    """
+    messages = context.messages
+    while True:
+        event = await messages.claim()
         try:
-            async with websockets.connect("wss://fstream.binance.com/ws/!forceOrder@arr",
-                                          ping_interval=20, ping_timeout=10) as websocket:
-                while True:
-                    msg = await websocket.recv()
-                    if msg is None:
-                        break  # Connection closed cleanly
-                    else:
-                        messages.put(json.loads(msg)["o"])
-        except websockets.exceptions.ConnectionClosedError as e:
-            print(f"Connection closed unexpectedly: {e}. Retrying connection...")
+            await process_event(event)
         except Exception as e:
-            print(f"Unexpected error occurred: {e}. Retrying connection...")
+            print(f"Error processing {event.symbol} liquidation: {e!r}")
         finally:
-            await asyncio.sleep(1)  # Wait before reconnecting
+            await messages.release(event)
 
 
-async def process_messages() -> None:
+async def process_event(event: events.LiquidationEvent) -> None:
     """
-    This function is an asynchronous coroutine that continuously monitors and processes messages
-    from a global queue. The messages represent cryptocurrency liquidation events.
+    Processes a single liquidation event, which may be the aggregate of a cascade.
 
-    Each message in the queue is a dictionary containing details about a single liquidation event.
-    The function pulls messages from the queue, extracts the relevant details (such as symbol,
-    quantity, and price), and formats this data into a human-readable text block.
+    The function checks the ACME zones and volume Z-Scores of the event's symbol and, for
+    events inside an ACME zone, takes the entry and publishes an Alert record to the output
+    sinks. Nothing is formatted here: each sink renders the alert when it consumes it. All
+    state is local to the call, so events can be processed concurrently.
 
-    When the queue is empty, the function waits for a short period (0.01 seconds) before checking
-    the queue again to avoid excessive CPU usage.
+    :param event: The liquidation event.
     """
-    while True:
-        if not messages.empty():
-            msg = messages.get()
-            symbol = msg["s"]
-            quantity = float(msg["q"])
-            price = float(msg["p"])
-            liq_value = round(float(quantity * price), 2)
-
-            if symbol in conf.excluded_symbols:
-                print(f"{symbol} Liquidation in excluded list.")
-
-            elif liq_value > conf.filters["liquidation"]:
-                candle_open, candle_close, scaled_open, scaled_close = await get_scaled_price(symbol)
-
-                output_table.append(["Symbol", symbol])
-                output_table.append(["Side", "Buyer Liquidated" if msg["S"] == "SELL" else "Seller Liquidated"])
-                output_table.append(["Quantity", msg["q"]])
-                output_table.append(["Price", msg["p"]])
-                output_table.append(["Liquidation Value", locale.currency(liq_value, grouping=True)])
-                output_table.append(["Timestamp", datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-                output_table.append(["Scaled Price", scaled_close])
-
-                pnz = await get_pnz(scaled_open, scaled_close)
-
-                if pnz:
-                    zscore_vol = await volume_filter(symbol, conf.zscore_lookback, conf.zscore_timeframes)
-
-                    print('-' * 65)
-
-                    # 1. Print volume analysis
-                    zs_table = tabulate([['Z-Score'] + [zs for zs in zscore_vol.values()]],
-                                        headers=['Timeframe'] + [zs for zs in zscore_vol.keys()],
-                                        tablefmt="simple",
-                                        floatfmt=".2f")
-                    print(zs_table)
-                    print('-' * 65)
-
-                    # 2. Print symbol info
-                    table = tabulate(output_table, tablefmt="plain")
-                    print(table)
-                    print('-' * 65)
-
-                    if any(z_score > conf.filters["zscore"] for z_score in zscore_vol.values()):
-                        side = "🟥 🟥 🟥 SELL 🟥 🟥 🟥" if msg["S"] == "BUY" else "🟩 🟩 🟩 BUY 🟩 🟩 🟩"
-                        output_confirmation.append(f"{side} conditions are met")
-
-                        # Check if the symbol already exists in the trade_book
-                        if symbol in trade_book:
-                            # Append the new trade to the existing list
-                            trade_book[symbol].append((scaled_close, side))
-                        else:
-                            # Create a new list for the symbol
-                            trade_book[symbol] = [(scaled_close, side)]
-
-                        if conf.discord_webhook_enabled:
-                            discord.send_to_channel(zs_table, table, side)
-
-                else:
-                    output_confirmation.append(f"{symbol} Liquidation: ACME not detected.")
-
-                # 3. Print confirmation messages
-                for confirmation in output_confirmation:
-                    print(confirmation)
-
-                # Reset tables
-                output_table.clear()
-                output_confirmation.clear()
+    symbol = event.symbol
+    conf = context.conf
+
+    if symbol in conf.excluded_symbols:
+        metrics.LIQUIDATIONS_PROCESSED.inc("excluded")
+        print(f"{symbol} Liquidation in excluded list.")
+
+    elif round(event.value, 2) > conf.filters["liquidation"]:
+        started = time.perf_counter()
+        scaled_price = await get_scaled_price(symbol)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, "price")
+        if not scaled_price:
+            metrics.LIQUIDATIONS_PROCESSED.inc("no_data")
+            print(f"{symbol} Liquidation: no kline data available.")
+            return
+        candle_open, candle_close, scaled_open, scaled_close = scaled_price
+
+        zone_rows = []
+        started = time.perf_counter()
+        pnz = await get_pnz(scaled_open, scaled_close, zone_rows)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, "pnz")
+
+        if not pnz:
+            metrics.LIQUIDATIONS_PROCESSED.inc("no_zone")
+            print(f"{symbol} Liquidation: ACME not detected.")
+            return
+
+        zscore_vol = await volume_filter(symbol, conf.zscore_lookback, conf.zscore_timeframes)
+
+        signal = None
+        if any(isinstance(z_score, float) and z_score > conf.filters["zscore"]
+               for z_score in zscore_vol.values()):
+            metrics.LIQUIDATIONS_PROCESSED.inc("entry")
+            # Liquidated buyers (forced SELL) are bought, liquidated sellers are sold.
+            signal = Side.SELL if event.side == "BUY" else Side.BUY
+            context.trade_book.add(symbol, scaled_close, signal)
+            if context.mark_prices is not None:
+                context.mark_prices.follow(symbol)
         else:
-            await asyncio.sleep(0.01)  # prevent CPU spin when the queue is empty
+            metrics.LIQUIDATIONS_PROCESSED.inc("no_signal")
+
+        # The sinks format and output the alert in their own time.
+        context.alert_sinks.publish(sinks.Alert(event, zscore_vol, zone_rows, scaled_close, signal))
+
+    else:
+        metrics.LIQUIDATIONS_PROCESSED.inc("filtered")
 
 
 async def volume_filter(symbol: str, n: int, timeframes: list) -> dict:
-    last_time = cache.get(symbol)
-    if last_time is not None:
-        if (datetime.now() - last_time).seconds < 5 * 60:
-            return zscore_tables[symbol]
-
-    tasks = []
-    for timeframe in timeframes:
-        parameters = {
-            'symbol': symbol,
-            'interval': timeframe,
-            'limit': n,
-        }
-        tasks.append(exchange.fetch_kline(parameters))
-
-    responses = await asyncio.gather(*tasks)
-
-    zscores = {}
-    for response, timeframe in zip(responses, timeframes):
-        volumes = [float(bar[5]) for bar in response]
-        try:
-            mean_volume = statistics.mean(volumes)
-            std_volume = statistics.stdev(volumes)
-            current_volume = volumes[-2]
-            z_score = (current_volume - mean_volume) / std_volume
-            zscores[timeframe] = z_score
-        except statistics.StatisticsError:
-            print(f"Not enough data points to calculate standard deviation for {symbol} in {timeframe} timeframe.")
-            zscores[timeframe] = "new market"  # using "new market" as the placeholder for new/insufficient data
+    """
+    Volume Z-Scores of the symbol for each timeframe.
+
+    The symbol's rolling engine is seeded with `n` candles per timeframe the first time, or
+    again whenever it has missed a minute of 1m updates. Otherwise the Z-Scores are read
+    straight from memory, kept current by the streamed 1m candles. Concurrent calls for a
+    symbol whose engine needs seeding share one set of fetches.
 
-    zscore_tables[symbol] = zscores
-    cache[symbol] = datetime.now()
+    :param symbol: Symbol to compute the Z-Scores for.
+    :param n: Candles per timeframe in the Z-Score window.
+    :param timeframes: Timeframes to compute.
+    :return: Dictionary of timeframe to Z-Score, or "new market" if there is not enough data.
+    """
+    started = time.perf_counter()
+    volume_engines = context.volume_engines
+    cached = volume_engines.peek(symbol)
+    hit = cached is not None and volume_engines.validate(cached)
+    seeded = False
+
+    async def seed() -> zscore.VolumeEngine:
+        nonlocal seeded
+        seeded = True
+        tasks = []
+        for timeframe in timeframes:
+            parameters = {
+                'symbol': symbol,
+                'interval': timeframe,
+                'limit': n,
+            }
+            tasks.append(exchange.fetch_kline(parameters))
+
+        responses = await asyncio.gather(*tasks)
+
+        new_engine = zscore.VolumeEngine(n, timeframes)
+        for response, timeframe in zip(responses, timeframes):
+            new_engine.seed(timeframe, response)
+        return new_engine
+
+    engine = await volume_engines.get(symbol, seed)
+
+    zscores = engine.zscores()
+    metrics.VOLUME_FILTER_SECONDS.observe(time.perf_counter() - started,
+                                          "hit" if hit else "miss" if seeded else "coalesced")
+    for timeframe, z_score in zscores.items():
+        if z_score == zscore.NEW_MARKET:
+            print(f"Not enough data points to calculate standard deviation for {symbol} in {timeframe} timeframe.")
 
     return zscores
 
 
 async def get_scaled_price(symbol: str) -> list:
-    parameters = {
-        'symbol': symbol,
-        'interval': '1m',
-        'limit': 1,
-    }
-    data = await exchange.fetch_kline(parameters)
-
-    if not data:
-        return []
-
-    candle_open = float(data[0][1])
-    candle_close = float(data[0][4])
+    """
+    Current 1m candle open and close of a symbol, raw and scaled.
+
+    The candle is read from the streamed candle store; REST is only used when the symbol
+    has no fresh streamed candle yet, e.g. right after it becomes active. REST klines are
+    cached briefly and fetched once for any number of concurrent callers, so a cascade on a
+    new symbol costs one request.
+
+    :param symbol: Symbol, e.g. 'BTCUSDT'.
+    :return: List of [open, close, scaled open, scaled close], empty if no data is available.
+    """
+    candles = context.candles
+    candles.track(symbol)
+    candle = candles.get(symbol)
+    if candle is not None:
+        candle_open = candle[OPEN]
+        candle_close = candle[CLOSE]
+    else:
+        async def fetch() -> list:
+            # The previous candle comes along so its final volume reaches the Z-Score engine.
+            parameters = {
+                'symbol': symbol,
+                'interval': '1m',
+                'limit': 2,
+            }
+            bars = await exchange.fetch_kline(parameters)
+            for bar in bars:
+                context.feed_volume_engine(symbol, int(bar[0]), float(bar[5]))
+            return bars
+
+        data = await context.recent_klines.get(symbol, fetch)
+
+        if not data:
+            return []
+
+        candle_open = float(data[-1][1])
+        candle_close = float(data[-1][4])
+
     scale_factor = acme.get_scale(min(candle_open, candle_close))
     return [candle_open, candle_close, candle_open / scale_factor, candle_close / scale_factor]
 
 
-async def price_tracker(open_trades_book: dict) -> dict:
+async def price_tracker(open_trades_book: TradeBook, symbols: list = None) -> dict:
+    """
+    Current scaled price of every symbol in the trade book, or of the given ones.
 
-    open_market_prices = {}
+    Prices come from the streamed candle store. Symbols without a fresh candle are priced
+    from one shared all-symbols ticker snapshot, so a cycle costs at most one request no
+    matter how many symbols are open. A symbol that cannot be priced is left out of the
+    result rather than failing the cycle.
 
-    for symbol, average_price in open_trades_book.items():
-        parameters = {
-            'symbol': symbol,
-            'interval': '1m',
-            'limit': 1,
-        }
-        data = await exchange.fetch_kline(parameters)
-        candle_open = float(data[0][1])
-        candle_close = float(data[0][4])
-        scale_factor = acme.get_scale(min(candle_open, candle_close))
-        open_market_prices[symbol] = candle_close / scale_factor  # add live price to the dictionary
+    :param open_trades_book: The trade book.
+    :param symbols: Symbols to price, all of the trade book's by default.
+    :return: Dictionary of symbol to scaled live price.
+    """
+    open_market_prices = {}
+    snapshot = None
+    candles = context.candles
+
+    for symbol in open_trades_book.symbols() if symbols is None else symbols:
+        candles.track(symbol)
+        candle = candles.get(symbol)
+        if candle is not None:
+            price = candle[CLOSE]
+            scale_factor = acme.get_scale(min(candle[OPEN], price))
+        else:
+            if snapshot is None:
+                snapshot = await exchange.price_snapshot()
+            price = snapshot.get(symbol)
+            if price is None:
+                print(f"{symbol} No price available, skipping this cycle.")
+                continue
+            scale_factor = acme.get_scale(price)
+        open_market_prices[symbol] = price / scale_factor  # add live price to the dictionary
 
     return open_market_prices
 
 
-# Total profit
-total_profit = 0.0
-
-
-async def market_exits(open_trades_book: dict, open_market_prices: dict) -> dict:
-    global total_profit  # Declare global at the beginning of the function
-    trade_performance = {}
+async def market_exits(open_trades_book: TradeBook, open_market_prices: dict) -> list:
+    """
+    Closes the entries whose take profit or stop loss the live prices reached.
 
-    for symbol in list(open_trades_book.keys()):
-        trade_performance[symbol] = {}
-        entry_number = 1
+    Only entries whose precomputed trigger prices were crossed are touched; their gains are
+    added to the trade book's total profit. Symbols without a price this cycle keep their
+    entries as they are.
 
-        for entry in open_trades_book[symbol][:]:
-            entry_price, side = entry
-            live_price = open_market_prices[symbol]
-            if side == "🟩 🟩 🟩 BUY 🟩 🟩 🟩":
-                percentage_gain = ((live_price - entry_price) / entry_price) * 100
-            else:
-                percentage_gain = ((entry_price - live_price) / entry_price) * 100
+    :param open_trades_book: The trade book.
+    :param open_market_prices: Dictionary of symbol to scaled live price.
+    :return: List of tradebook.Exit for the entries closed.
+    """
+    exits = []
+    for symbol, live_price in open_market_prices.items():
+        exits.extend(open_trades_book.update(symbol, live_price))
 
-            # If percentage gain hits +0.6% or dips -0.5%, remove the trade
-            if percentage_gain >= 0.6 or percentage_gain <= -0.5:
-                open_trades_book[symbol].remove(entry)
-                total_profit += percentage_gain  # Update the total_profit
+    print(f"Total Profit: {open_trades_book.total_profit}%")
 
-            trade_performance[symbol][f'entry_{entry_number}'] = {
-                'entry_price': entry_price,
-                'market_price': live_price,
-                'percentage_gain': percentage_gain,
-                'side': side
-            }
-            entry_number += 1
+    return exits
 
-        # If no more trades for symbol, remove it from open_trades_book
-        if not open_trades_book[symbol]:
-            del open_trades_book[symbol]
 
-    print(f"Total Profit: {total_profit}%")  # Print total_profit at the end of the function
+def exit_performance(trade_performance: dict, exits: list) -> dict:
+    """
+    Adds entries closed outside a polling cycle, e.g. on a pushed mark price, to the trade
+    book performance, so the summary reports them at their exit price.
 
+    :param trade_performance: Dictionary from TradeBook.performance.
+    :param exits: List of tradebook.Exit.
+    :return: The same dictionary.
+    """
+    for closed in exits:
+        trade_performance.setdefault(closed.symbol, []).append(
+            (closed.entry_price, closed.exit_price, closed.gain, closed.side))
     return trade_performance
 
 
@@ -290,28 +373,15 @@ async def market_exits(open_trades_book: dict, open_market_prices: dict) -> dict
 ###########################################################################################
 
 
-async def get_pnz(scaled_open: float, scaled_close: float) -> bool:
-    emoji_map = {
-        1: "⬜",
-        3: "🟨",
-        4: "🟦",
-        5: "🟩",
-        6: "🟪",
-    }
-
-    flag_pnz_sm = False
-    seen_tups = set()
-
-    for tup in acme.pnz_sm[1]:
-        if tup not in seen_tups and acme.through_pnz_small([tup], scaled_open, scaled_close):
-            seen_tups.add(tup)
-            flag_pnz_sm = True
-            output_table.append([f"ACME Small {emoji_map.get(1, '')}", tup])
+async def get_pnz(scaled_open: float, scaled_close: float, output_table: list) -> bool:
+    crossed = acme.small_zones_crossed(scaled_open, scaled_close)
+    for tup in crossed:
+        output_table.append([f"ACME Small {PNZ_EMOJI.get(1, '')}", tup])
 
-    for key in range(3, 6):
-        for tup in acme.pnz_lg[key]:
-            if acme.price_within([tup], scaled_close):
-                output_table.append([f"ACME Big {key} {emoji_map.get(key, '')} ", tup])
-                return True
+    large = acme.large_zone_containing(scaled_close)
+    if large is not None:
+        key, tup = large
+        output_table.append([f"ACME Big {key} {PNZ_EMOJI.get(key, '')} ", tup])
+        return True
 
-    return flag_pnz_sm
+    return bool(crossed)
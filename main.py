@@ -1,39 +1,312 @@
+import argparse
 import asyncio
+import multiprocessing
 import pprint
-from Lib import discord
+import time
+
+# Taken before the application modules are imported, so --profile-startup can report them.
+IMPORTS_STARTED = time.perf_counter()
+
+from context import AppContext
+from lib import acme, discord, exchange, metrics, sharding
 from liquidation_acme import binance_liquidations,\
-    process_messages, price_tracker, market_exits, trade_book, total_profit
+    process_messages, price_tracker, market_exits, exit_performance, use_context
+
+IMPORTS_SECONDS = time.perf_counter() - IMPORTS_STARTED
 
 
-async def price_tracking_task() -> None:
+async def price_tracking_task(context: AppContext, report=None) -> None:
     """
-    This function runs the price tracker every 10 seconds.
+    This function reports the trade book every 3 seconds.
+
+    Exits of symbols with a fresh pushed mark price have already been taken on each update
+    and are added to the summary here; only the symbols without one, or all of them when mark
+    prices are disabled, are priced here with the price tracker and exited.
+
+    :param context: The application context.
+    :param report: Callable taking the trade book performance and total profit, used by a
+    shard process to send them to the coordinator instead of posting its own summary.
     """
+    trade_book = context.trade_book
+    mark_prices = context.mark_prices
     while True:
-        prices_side = await price_tracker(trade_book)
-        trade_performance = await market_exits(trade_book, prices_side)
+        prices_side = {}
+        pushed_exits = []
+        if mark_prices is not None:
+            mark_prices.sync()
+            prices_side = mark_prices.prices()
+            pushed_exits = mark_prices.take_exits()
+        stale = [symbol for symbol in trade_book.symbols() if symbol not in prices_side]
+        polled = await price_tracker(trade_book, stale) if stale else {}
+        prices_side.update(polled)
+        # Taken before the exits, so the summary still shows the entries closed this cycle.
+        trade_performance = exit_performance(trade_book.performance(prices_side), pushed_exits)
+        await market_exits(trade_book, polled)
         # print()
         # pprint.pprint(trade_performance)
         # print()
-        discord.send_dictionary_to_channel(trade_performance, total_profit)
+        if report is None:
+            discord.send_dictionary_to_channel(trade_performance, trade_book.total_profit)
+        else:
+            report(trade_performance, trade_book.total_profit)
 
         await asyncio.sleep(3)  # wait for 3 seconds
 
 
-async def main():
+async def queue_monitor_task(context: AppContext) -> None:
+    """
+    This function reports the liquidation queue depth and shed events every 60 seconds
+    whenever the queue is backed up or has dropped events since the last report, along
+    with the Discord dispatcher queue depth and delivery latency.
+
+    :param context: The application context.
+    """
+    messages = context.messages
+    last_dropped = 0
+    while True:
+        await asyncio.sleep(60)
+        stats = messages.stats()
+        if stats["depth"] or stats["dropped"] != last_dropped:
+            print(f"Liquidation queue: depth {stats['depth']}, high water {stats['high_water']}, "
+                  f"dropped {stats['dropped']} ({stats['dropped'] - last_dropped} new)")
+        last_dropped = stats["dropped"]
+
+        discord_stats = discord.stats()
+        if discord_stats["depth"] or discord_stats["latency_avg"] is not None:
+            print(f"Discord queue: depth {discord_stats['depth']}, sent {discord_stats['sent']}, "
+                  f"dropped {discord_stats['dropped'] + discord_stats['failed']}, "
+                  f"rate limited {discord_stats['rate_limited']}, "
+                  f"average latency {discord_stats['latency_avg'] or 0:.2f}s")
+
+
+async def main(context: AppContext):
     """
     Executes the main program flow
+
+    :param context: The started application context.
     """
+    conf = context.conf
+    journal = context.journal
+    # Restore open entries and total profit before any new liquidation is processed.
+    context.load_journal(journal)
+
     tasks = [
         binance_liquidations(),
         process_messages(),
-        asyncio.create_task(price_tracking_task())
+        asyncio.create_task(context.coalescer.run()),
+        asyncio.create_task(price_tracking_task(context)),
+        asyncio.create_task(queue_monitor_task(context)),
+        asyncio.create_task(discord.run_dispatcher()),
+        asyncio.create_task(context.alert_sinks.run()),
+        asyncio.create_task(context.candles.run())
 
     ]
+    if context.mark_prices is not None:
+        tasks.append(asyncio.create_task(context.mark_prices.run()))
+    if context.recorder is not None:
+        tasks.append(asyncio.create_task(context.recorder.run()))
+    if journal is not None:
+        tasks.append(asyncio.create_task(journal.run()))
+    if conf.metrics["enabled"]:
+        metrics.gauge("acme_liquidation_queue_depth", "Liquidation events waiting to be processed.",
+                      context.messages.qsize)
+        metrics.gauge("acme_discord_queue_depth", "Discord messages waiting to be delivered.",
+                      lambda: discord.stats()["depth"])
+        metrics.gauge("acme_rest_weight_available", "Request weight left in the limiter's bucket.",
+                      lambda: exchange.limiter().available())
+        tasks.append(asyncio.create_task(metrics.serve(conf.metrics["host"], conf.metrics["port"])))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await exchange.close()
+
+
+def shard_process(config_file: str, index: int, shards: int, inbox, outbox, tables: str) -> None:
+    """
+    Entry point of a shard process: attaches the shared ACME tables and runs the shard.
 
-    await asyncio.gather(*tasks)
+    :param config_file: Path of the configuration file.
+    :param index: Index of the shard.
+    :param shards: Number of shards.
+    :param inbox: multiprocessing.Queue of the shard's liquidation events, None to stop.
+    :param outbox: multiprocessing.Queue of messages to the coordinator.
+    :param tables: Name of the shared memory block holding the ACME tables.
+    """
+    context = AppContext(config_file)
+    use_context(context)
+    try:
+        context.start(tables)
+        asyncio.run(run_shard(context, index, shards, inbox, outbox))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acme.detach_tables()
+
+
+async def run_shard(context: AppContext, index: int, shards: int, inbox, outbox) -> None:
+    """
+    Processes the liquidations of the symbols owned by one shard until the coordinator
+    sends None.
+
+    The shard runs the whole pipeline for its symbols: coalescing, the worker pool, price
+    tracking and exits for its own trade book and the candle streams of its symbols. Alerts,
+    Discord messages and trade book reports go to the coordinator. The shard gets an equal share of
+    the request weight budget, as the exchange counts weight per IP address.
+    """
+    conf = context.conf
+    coalescer = context.coalescer
+    exchange.share_weight(1 / shards)
+    context.alert_sinks.forward_to(lambda alert: outbox.put(("alert", alert)))
+    discord.forward_to(lambda url, content, entry: outbox.put(("message", url, content, entry)))
+    shard_journal = context.shard_journal(index)
+    context.load_journal(shard_journal)
+    events = sharding.relay(inbox)
+
+    async def receive() -> None:
+        while (event := await events.get()) is not None:
+            await coalescer.put(event)
+
+    receiver = asyncio.create_task(receive())
+    tasks = [
+        asyncio.create_task(process_messages()),
+        asyncio.create_task(coalescer.run()),
+        asyncio.create_task(price_tracking_task(
+            context, lambda performance, total_profit: outbox.put(("report", index, performance, total_profit)))),
+        asyncio.create_task(queue_monitor_task(context)),
+        asyncio.create_task(context.candles.run()),
+    ]
+    if context.mark_prices is not None:
+        tasks.append(asyncio.create_task(context.mark_prices.run()))
+    if shard_journal is not None:
+        tasks.append(asyncio.create_task(shard_journal.run()))
+    if conf.metrics["enabled"]:
+        metrics.gauge("acme_liquidation_queue_depth", "Liquidation events waiting to be processed.",
+                      context.messages.qsize)
+        tasks.append(asyncio.create_task(metrics.serve(conf.metrics["host"], conf.metrics["port"] + 1 + index)))
+    try:
+        await receiver
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await exchange.close()
+
+
+async def coordinate(context: AppContext, shards: int) -> None:
+    """
+    Runs the bot over `shards` processes.
+
+    The ACME tables are published once in shared memory. This process reads the liquidation
+    stream and routes each event to the shard owning its symbol on a consistent hash ring, so
+    a symbol is always handled by the same shard. It outputs the alerts and posts the Discord
+    messages the shards forward and, every 3 seconds, one summary combining their latest trade book reports.
+    A shard process that exits stops the whole run, rather than silently losing its symbols.
+
+    :param context: The started application context.
+    :param shards: Number of shard processes.
+    """
+    conf = context.conf
+    alert_sinks = context.alert_sinks
+    tables = acme.share_tables()
+    spawn = multiprocessing.get_context("spawn")
+    inboxes = [spawn.Queue() for _ in range(shards)]
+    outbox = spawn.Queue()
+    processes = [spawn.Process(target=shard_process,
+                               args=(context.config_file, index, shards, inboxes[index], outbox, tables.name),
+                               name=f"acme-shard-{index}")
+                 for index in range(shards)]
+    for process in processes:
+        process.start()
+    ring = sharding.HashRing(shards)
+    board = sharding.ShardBoard(shards)
+
+    async def route(event) -> None:
+        inboxes[ring.shard_for(event.symbol)].put(event)
+
+    async def receive_reports() -> None:
+        reports = sharding.relay(outbox)
+        while True:
+            kind, *payload = await reports.get()
+            if kind == "alert":
+                alert_sinks.publish(*payload)
+            elif kind == "message":
+                discord.enqueue(*payload)
+            else:
+                board.update(*payload)
+
+    async def watch() -> None:
+        while True:
+            await asyncio.sleep(1)
+            for process in processes:
+                if process.exitcode is not None:
+                    raise RuntimeError(f"Shard process {process.name} exited with code {process.exitcode}.")
+
+    async def summary() -> None:
+        while True:
+            await asyncio.sleep(3)
+            if board.reported():
+                performance, total_profit = board.combined()
+                print(f"Total Profit: {total_profit}% ({board.reported()} of {shards} shards reporting)")
+                discord.send_dictionary_to_channel(performance, total_profit)
+
+    tasks = [
+        binance_liquidations(route),
+        asyncio.create_task(receive_reports()),
+        asyncio.create_task(summary()),
+        asyncio.create_task(watch()),
+        asyncio.create_task(discord.run_dispatcher()),
+        asyncio.create_task(alert_sinks.run()),
+    ]
+    if context.recorder is not None:
+        tasks.append(asyncio.create_task(context.recorder.run()))
+    if conf.metrics["enabled"]:
+        metrics.gauge("acme_discord_queue_depth", "Discord messages waiting to be delivered.",
+                      lambda: discord.stats()["depth"])
+        tasks.append(asyncio.create_task(metrics.serve(conf.metrics["host"], conf.metrics["port"])))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # Shards finish their journals on the way out, so they are asked to stop first.
+        for inbox in inboxes:
+            inbox.put(None)
+        for process in processes:
+            await asyncio.to_thread(process.join, 30)
+            if process.is_alive():
+                process.terminate()
+        tables.close()
+        tables.unlink()
+
+
+def profile_startup(context: AppContext) -> None:
+    """
+    Runs every startup phase without connecting to anything and prints the time each took.
+
+    :param context: The application context, not yet started.
+    :return: None
+    """
+    context.timings["imports"] = IMPORTS_SECONDS
+    context.start()
+    context.load_journal(context.journal)
+    context.build()
+    print(context.report())
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="ACME liquidation bot.")
+    parser.add_argument("--config", default="config.yaml", help="configuration file (default: config.yaml)")
+    parser.add_argument("--shards", type=int,
+                        help="processes to spread the symbols over (default: the config file's shards)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="time each startup phase, print the timings and exit")
+    arguments = parser.parse_args()
+    app = AppContext(arguments.config)
+    use_context(app)
+    if arguments.profile_startup:
+        profile_startup(app)
+        raise SystemExit
+    shards = arguments.shards if arguments.shards is not None else app.conf.shards
     print("starting")
-    asyncio.run(main())
+    app.start()
+    asyncio.run(main(app) if shards <= 1 else coordinate(app, shards))
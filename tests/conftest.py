@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+import pytest
+import websockets
+
+# The tests import the application modules the way main.py does, from the project root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def websocket_server():
+    """
+    :return: Coroutine function starting a local websocket server that sends the given raw
+    messages to every client and keeps the connection open, returning the server and its URL.
+    """
+    async def serve(messages: list):
+        async def handler(websocket, *_):
+            for message in messages:
+                await websocket.send(message)
+            await websocket.wait_closed()
+
+        server = await websockets.serve(handler, "127.0.0.1", 0)
+        return server, f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    return serve
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    """
+    Polls `condition` until it is true, failing the test after `timeout` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def until():
+    return wait_until
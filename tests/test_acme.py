@@ -0,0 +1,60 @@
+import asyncio
+import math
+import random
+
+import pytest
+
+import liquidation_acme
+from lib import acme
+
+
+def scan_pnz(scaled_open: float, scaled_close: float) -> tuple:
+    """
+    The linear scan get_pnz did before the zone index, as (small zones crossed, large zone or None).
+    """
+    small = []
+    for tup in acme.pnz_sm[1]:
+        if tup not in small and acme.through_pnz_small([tup], scaled_open, scaled_close):
+            small.append(tup)
+    for key in acme.PNZ_LG_KEYS:
+        for tup in acme.pnz_lg[key]:
+            if acme.price_within([tup], scaled_close):
+                return small, (key, tup)
+    return small, None
+
+
+@pytest.fixture(scope="module")
+def candles() -> list:
+    acme.ensure_init()
+    rng = random.Random(8)
+    bounds = sorted({bound for zones in [acme.pnz_sm[1]] + [acme.pnz_lg[key] for key in acme.PNZ_LG_KEYS]
+                     for zone in zones for bound in zone})
+    # Prices on and right next to every boundary, where an off-by-one would show.
+    edges = [price for bound in bounds
+             for price in (bound, math.nextafter(bound, 0), math.nextafter(bound, math.inf))]
+    prices = edges + [rng.uniform(1, acme.FRAME_CEILING) for _ in range(3000)]
+    pairs = [(rng.choice(prices), rng.choice(prices)) for _ in range(6000)]
+    return pairs + [(price, price) for price in edges]
+
+
+def test_zone_lookups_match_the_linear_scan(candles):
+    for scaled_open, scaled_close in candles:
+        small, large = scan_pnz(scaled_open, scaled_close)
+        assert acme.small_zones_crossed(scaled_open, scaled_close) == small, (scaled_open, scaled_close)
+        assert acme.large_zone_containing(scaled_close) == large, scaled_close
+    assert acme.zone_hits(candles[:500]) == [scan_pnz(*candle) for candle in candles[:500]]
+
+
+def test_get_pnz_rows_match_the_linear_scan(candles):
+    async def rows(candle) -> tuple:
+        output_table = []
+        hit = await liquidation_acme.get_pnz(*candle, output_table)
+        return hit, [row[1] for row in output_table]
+
+    async def scenario():
+        for candle in candles[:2000]:
+            small, large = scan_pnz(*candle)
+            expected = small + ([large[1]] if large else [])
+            assert await rows(candle) == (bool(expected), expected), candle
+
+    asyncio.run(scenario())
@@ -0,0 +1,130 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+import liquidation_acme
+from context import AppContext
+from lib import acme, backtest, exchange, recorder, sinks
+from lib.events import LiquidationEvent
+from lib.zscore import MINUTE_MS, TIMEFRAME_MS
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.yaml")
+DAY_START = 1_700_006_400_000  # A 4h boundary.
+MINUTES = 1440
+
+
+class NoCandles:
+    """
+    Candle store without streamed candles, so prices come from REST.
+    """
+
+    def track(self, symbol: str) -> None:
+        pass
+
+    def get(self, symbol: str):
+        return None
+
+
+def record_day(directory: str, rng: np.random.Generator) -> dict:
+    """
+    Records a day of liquidations and returns the 1m klines of its symbols as backtest.run takes them.
+    """
+    klines = {}
+    messages = []
+    for symbol, start_price in (("BTCUSDT", 36000.0), ("ETHUSDT", 2000.0), ("DOGEUSDT", 0.08)):
+        closes = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, MINUTES)))
+        opens = np.concatenate(([start_price], closes[:-1]))
+        volumes = rng.lognormal(3, 0.4, MINUTES)
+        volumes[rng.choice(MINUTES, 40, replace=False)] *= rng.uniform(3, 10, 40)
+        times = DAY_START + np.arange(MINUTES) * MINUTE_MS
+        klines[symbol] = np.column_stack((times, opens, closes, volumes))
+        for minute in rng.choice(np.arange(240, MINUTES), 60, replace=False):
+            trade_time = int(times[minute] + rng.integers(0, MINUTE_MS))
+            messages.append({"e": "forceOrder", "E": trade_time + 5, "o": {
+                "s": symbol, "S": str(rng.choice(["BUY", "SELL"])), "o": "LIMIT", "X": "FILLED",
+                "q": f"{rng.uniform(0.1, 50):.3f}", "p": f"{opens[minute]:.5f}", "T": trade_time}})
+    messages.sort(key=lambda message: message["E"])
+
+    async def write():
+        log = recorder.Recorder(directory)
+        for message in messages:
+            log.record(message)
+        await log.flush()
+
+    asyncio.run(write())
+    return klines
+
+
+def kline_rows(grid: tuple, interval: str, limit: int, minute: int) -> list:
+    """
+    REST klines as the exchange returns them at the start of `minute`: the closed bars and the
+    forming bar built from the minutes closed so far. Bars starting before the recording are
+    left out, as the backtest leaves them out.
+    """
+    start, first_minute, opens, closes, volumes = grid
+    size = TIMEFRAME_MS[interval] // MINUTE_MS
+    bar = minute // size
+    rows = []
+    for index in range(max(bar - (limit - 1), -(-first_minute // size)), bar + 1):
+        first, last = index * size, min((index + 1) * size, minute + 1)
+        volume = volumes[first:last].sum() if index < bar else volumes[first:minute].sum()
+        # The forming candle's close is the recorded 1m close, the backtest's documented approximation.
+        rows.append([start + first * MINUTE_MS, str(opens[first]), "0", "0", str(closes[last - 1]),
+                     str(volume)])
+    return rows
+
+
+def replay_live(monkeypatch, events: list, klines: dict) -> list:
+    """
+    Processes each event with process_event in a fresh context, with the exchange answering
+    as it would have at the event's minute.
+
+    :return: List of (signal, Z-Scores) per event, (None, None) for events without an alert.
+    """
+    grids = {symbol: backtest.minute_grid(rows) for symbol, rows in klines.items()}
+    now = {}
+
+    async def fetch_kline(parameters: dict, lane: int = exchange.ENTRY) -> list:
+        grid = grids[parameters["symbol"]]
+        return kline_rows(grid, parameters["interval"], parameters["limit"], (now["time"] - grid[0]) // MINUTE_MS)
+
+    monkeypatch.setattr(exchange, "fetch_kline", fetch_kline)
+    results = []
+    for event in events:
+        alerts = []
+        context = AppContext(CONFIG)
+        context.__dict__.update(candles=NoCandles(), mark_prices=None, alert_sinks=sinks.Fanout([]))
+        context.alert_sinks.forward_to(alerts.append)
+        monkeypatch.setattr(liquidation_acme, "context", context)
+        now["time"] = event.trade_time
+        asyncio.run(liquidation_acme.process_event(event))
+        results.append((alerts[0].signal, alerts[0].zscores) if alerts else (None, None))
+    return results
+
+
+def test_backtest_takes_the_entries_of_the_live_path(tmp_path, monkeypatch):
+    acme.ensure_init()
+    klines = record_day(str(tmp_path), np.random.default_rng(7))
+    [(day, columns, symbols)] = list(recorder.iterate(str(tmp_path)))
+    events = recorder.to_events(columns, symbols)
+
+    conf = AppContext(CONFIG).conf
+    result = backtest.run(events, klines, conf.filters["liquidation"], conf.filters["zscore"],
+                          conf.zscore_lookback, conf.zscore_timeframes, conf.excluded_symbols)
+
+    live_events = [LiquidationEvent(str(symbol), str(side), repr(float(quantity)), repr(float(price)), int(time))
+                   for symbol, side, quantity, price, time in
+                   zip(events["symbol"], events["side"], events["quantity"], events["price"], events["time"])]
+    live = replay_live(monkeypatch, live_events, klines)
+
+    entries = result["entry"]
+    assert 0 < entries.sum() < len(entries)
+    for index, (signal, zscores) in enumerate(live):
+        assert (signal is not None) == entries[index], index
+        if signal is not None:
+            assert int(signal) == result["side"][index]
+        if zscores is not None:
+            values = [np.nan if isinstance(value, str) else value for value in zscores.values()]
+            assert values == pytest.approx(list(result["zscores"][index]), rel=1e-9, abs=1e-9, nan_ok=True)
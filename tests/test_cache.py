@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from lib.cache import AsyncCache
+
+
+def test_concurrent_gets_share_one_load():
+    loads = 0
+
+    async def scenario():
+        cache = AsyncCache(10)
+        release = asyncio.Event()
+
+        async def loader():
+            nonlocal loads
+            loads += 1
+            await release.wait()
+            return "value"
+
+        waiters = [asyncio.create_task(cache.get("key", loader)) for _ in range(50)]
+        await asyncio.sleep(0.01)
+        release.set()
+        values = await asyncio.gather(*waiters)
+        assert await cache.get("key", loader) == "value"
+        return values, cache.stats()
+
+    values, stats = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert loads == 1
+    assert values == ["value"] * 50
+    assert stats == {"size": 1, "hits": 1, "misses": 1, "coalesced": 49, "evictions": 0}
+
+
+def test_cancelled_caller_does_not_cancel_the_load():
+    async def scenario():
+        cache = AsyncCache(10)
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return 42
+
+        first = asyncio.create_task(cache.get("key", loader))
+        second = asyncio.create_task(cache.get("key", loader))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await second == 42
+        assert first.cancelled()
+        assert cache.peek("key") == 42
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        cache = AsyncCache(10)
+        release = asyncio.Event()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            raise RuntimeError("fetch failed")
+
+        waiters = [asyncio.create_task(cache.get("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert calls == 1 and len(cache) == 0
+
+        async def loader():
+            return "ok"
+
+        assert await cache.get("key", loader) == "ok"
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_expired_invalid_and_uncacheable_values_are_loaded_again(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("lib.cache.time.monotonic", lambda: now[0])
+    loads = []
+
+    async def scenario():
+        cache = AsyncCache(2, ttl=1.0, validate=lambda value: value != "stale", cacheable=bool)
+
+        def loader(value):
+            async def load():
+                loads.append(value)
+                return value
+            return load
+
+        assert await cache.get("a", loader("a1")) == "a1"
+        assert await cache.get("a", loader("a2")) == "a1"
+        now[0] += 1.0
+        assert await cache.get("a", loader("a3")) == "a3"  # Expired.
+        cache.put("b", "stale")
+        assert await cache.get("b", loader("b1")) == "b1"  # Rejected by validate.
+        assert await cache.get("c", loader("")) == ""  # Not cacheable.
+        assert cache.peek("c") is None
+        cache.put("d", "d1")  # Evicts the least recently used, a.
+        assert cache.peek("a") is None and cache.evictions == 1
+
+    asyncio.run(scenario())
+    assert loads == ["a1", "a3", "b1", ""]
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        AsyncCache(0)
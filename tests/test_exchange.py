@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from lib import exchange
+from lib.cache import AsyncCache
+
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    """
+    Fresh snapshot state, with ticker fetches answered from the returned list in order.
+    """
+    responses = []
+
+    async def fetch_ticker_prices(lane=exchange.BACKGROUND):
+        return responses.pop(0)
+
+    monkeypatch.setattr(exchange, "fetch_ticker_prices", fetch_ticker_prices)
+    monkeypatch.setattr(exchange, "_price_snapshots", AsyncCache(maxsize=1, ttl=0, name="price_snapshot"))
+    monkeypatch.setattr(exchange, "_last_prices", ({}, 0.0))
+    return responses
+
+
+def test_failed_refresh_serves_a_recent_snapshot(snapshots):
+    snapshots.extend([{"BTCUSDT": 50000.0}, {}])
+
+    async def scenario():
+        first = await exchange.price_snapshot(max_age=0)
+        second = await exchange.price_snapshot(max_age=0)
+        return first, second
+
+    assert asyncio.run(scenario()) == ({"BTCUSDT": 50000.0}, {"BTCUSDT": 50000.0})
+
+
+def test_failed_refresh_drops_an_old_snapshot(snapshots, monkeypatch):
+    snapshots.extend([{"BTCUSDT": 50000.0}, {}])
+
+    async def scenario():
+        await exchange.price_snapshot(max_age=0)
+        prices, fetched_at = exchange._last_prices
+        monkeypatch.setattr(exchange, "_last_prices", (prices, fetched_at - exchange.PRICE_SNAPSHOT_MAX_STALE - 1))
+        return await exchange.price_snapshot(max_age=0)
+
+    assert asyncio.run(scenario()) == {}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """
+    Fresh REST client state, restored afterwards.
+    """
+    monkeypatch.setattr(exchange, "settings", dict(exchange.settings, max_retries=2))
+    monkeypatch.setattr(exchange, "_session", None)
+    monkeypatch.setattr(exchange, "_limiter", None)
+    monkeypatch.setattr(exchange, "_weight_share", 1.0)
+    monkeypatch.setattr(exchange, "_backoff", lambda attempt: 0.0)
+
+
+def test_retry_after_parsing():
+    assert exchange._retry_after("2") == 2.0
+    assert exchange._retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert exchange._retry_after("") is None
+    assert exchange._retry_after("soon") is None
+
+
+def test_http_date_retry_after_is_retried(client):
+    from aiohttp import web
+
+    answers = [web.Response(status=503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+               web.json_response([[1, "2"]])]
+
+    async def klines(request):
+        return answers.pop(0)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get("/fapi/v1/klines", klines)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        exchange.configure(rest_url=f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+        try:
+            return await exchange.fetch_kline({"symbol": "BTCUSDT", "interval": "1m", "limit": 1})
+        finally:
+            await exchange.close()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == [[1, "2"]]
+
+
+def test_limiter_state_survives_a_new_session(client):
+    async def scenario():
+        exchange.get_session()
+        limiter = exchange.limiter()
+        limiter.pause(30)
+        await exchange.close()
+        exchange.configure(weight_limit=1200)
+        exchange.get_session()
+        try:
+            return limiter, exchange.limiter()
+        finally:
+            await exchange.close()
+
+    before, after = asyncio.run(scenario())
+    assert after is before
+    assert after.limit == 1200
+    assert after.available() < 0
+
+
+def test_shards_together_use_the_whole_weight_limit():
+    shards = [exchange.WeightLimiter(2400, share=0.5) for _ in range(2)]
+    used = 0
+
+    async def scenario():
+        nonlocal used
+        progress = True
+        while progress:
+            progress = False
+            for limiter in shards:
+                if limiter.available() >= 100:
+                    await limiter.acquire(100)
+                    used += 100
+                    # The header of each response counts the weight of both shards.
+                    limiter.observe(used)
+                    progress = True
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert used == 2400
+
+
+def test_share_weight_resizes_the_limiter(client):
+    async def scenario():
+        exchange.get_session()
+        exchange.share_weight(0.5)
+        try:
+            return exchange.limiter()
+        finally:
+            await exchange.close()
+
+    limiter = asyncio.run(scenario())
+    assert limiter.limit == exchange.settings["weight_limit"] / 2
+    limiter.observe(exchange.settings["weight_limit"] / 2)
+    assert limiter.available() == pytest.approx(limiter.limit / 2, rel=1e-3)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+
+from lib import journal
+from lib.journal import TradeJournal
+from lib.tradebook import Side, TradeBook
+
+
+def write_log(directory, generation: int, data: bytes) -> str:
+    path = os.path.join(directory, f"wal-{generation:08d}.bin")
+    with open(path, "wb") as log_file:
+        log_file.write(data)
+    return path
+
+
+def records() -> bytes:
+    return (journal.encode_open(1, "BTCUSDT", 100.0, Side.BUY)
+            + journal.encode_open(2, "ETHUSDT", 50.0, Side.SELL)
+            + journal.encode_exit(1, "BTCUSDT", 0.6))
+
+
+def load(directory) -> TradeBook:
+    book = TradeBook()
+    TradeJournal(str(directory), fsync=False).load(book)
+    return book
+
+
+def test_decode_round_trip():
+    assert list(journal.decode(records())) == [
+        ("open", 1, "BTCUSDT", 100.0, Side.BUY),
+        ("open", 2, "ETHUSDT", 50.0, Side.SELL),
+        ("exit", 1, "BTCUSDT", 0.6),
+    ]
+
+
+def test_torn_tail_ends_replay(tmp_path):
+    torn = journal.encode_open(3, "SOLUSDT", 20.0, Side.BUY)
+    write_log(tmp_path, 1, records() + torn[:-3])
+    book = load(tmp_path)
+    assert book.symbols() == ["ETHUSDT"]
+    assert book.total_profit == 0.6
+
+
+def test_zero_filled_tail_ends_replay(tmp_path):
+    write_log(tmp_path, 1, records() + bytes(64))
+    book = load(tmp_path)
+    assert [entry_id for entry_id, _, _ in book.entries("ETHUSDT")] == [2]
+    assert book.total_profit == 0.6
+
+
+def test_unknown_kind_and_short_record_end_replay():
+    unknown = journal._frame(bytes([9]) + bytes(20))
+    short = journal._frame(bytes([journal.OPEN, 1, 2]))
+    assert len(list(journal.decode(records() + unknown + records()))) == 3
+    assert len(list(journal.decode(records() + short))) == 3
+
+
+def test_snapshot_and_log_replay(tmp_path):
+    async def session():
+        book = TradeBook()
+        first = TradeJournal(str(tmp_path), fsync=False)
+        first.load(book)
+        book.add("BTCUSDT", 100.0, Side.BUY)
+        book.add("ETHUSDT", 50.0, Side.SELL)
+        await first.snapshot()
+        # Changes after the snapshot only live in the log of the new generation.
+        book.add("SOLUSDT", 20.0, Side.BUY)
+        book.update("BTCUSDT", 101.0)
+        await first.flush()
+        return book
+
+    before = asyncio.run(session())
+    after = load(tmp_path)
+    assert sorted(after.symbols()) == sorted(before.symbols()) == ["ETHUSDT", "SOLUSDT"]
+    for symbol in before.symbols():
+        assert after.entries(symbol) == before.entries(symbol)
+    assert after.total_profit == before.total_profit
+    assert after.next_id == before.next_id
+
+
+def test_failed_append_keeps_the_records_for_the_next_flush(tmp_path, monkeypatch, capsys):
+    async def session():
+        book = TradeBook()
+        trade_journal = TradeJournal(str(tmp_path), flush_interval=0.01, fsync=False)
+        trade_journal.load(book)
+        append = trade_journal._append
+        failures = []
+
+        def failing(records):
+            if not failures:
+                failures.append(len(records))
+                raise OSError(28, "No space left on device")
+            append(records)
+
+        monkeypatch.setattr(trade_journal, "_append", failing)
+        book.add("BTCUSDT", 100.0, Side.BUY)
+        assert await trade_journal.flush() is False
+        assert len(trade_journal._buffer) == 1
+        runner = asyncio.create_task(trade_journal.run())
+        book.add("ETHUSDT", 50.0, Side.SELL)
+        await asyncio.sleep(0.1)
+        assert not runner.done() and not trade_journal._buffer
+        runner.cancel()
+        return book, failures
+
+    before, failures = asyncio.run(asyncio.wait_for(session(), 10))
+    assert failures == [1]
+    assert "Trade journal failed to write 1 records" in capsys.readouterr().out
+    after = load(tmp_path)
+    assert sorted(after.symbols()) == ["BTCUSDT", "ETHUSDT"]
+    for symbol in before.symbols():
+        assert after.entries(symbol) == before.entries(symbol)
+
+
+def test_failed_write_cuts_off_the_torn_batch(tmp_path, monkeypatch):
+    trade_journal = TradeJournal(str(tmp_path), fsync=False)
+    trade_journal.load(TradeBook())
+    write_log(tmp_path, trade_journal.generation, records())
+    pending = [(trade_journal.generation, journal.encode_open(3, "SOLUSDT", 20.0, Side.BUY))]
+    real_open = open
+
+    class Full:
+        def __init__(self, log_file):
+            self._file = log_file
+
+        def __getattr__(self, name):
+            return getattr(self._file, name)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return self._file.__exit__(*exc)
+
+        def write(self, data):
+            self._file.write(data[:5])  # Half a record reaches the disk.
+            self._file.flush()
+            raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: Full(real_open(*args, **kwargs)))
+    try:
+        trade_journal._append(pending)
+    except OSError:
+        pass
+    monkeypatch.undo()
+    assert len(pending) == 1
+    trade_journal._append(pending)
+    assert not pending
+    with open(trade_journal._log_path(trade_journal.generation), "rb") as log_file:
+        assert [record[1] for record in journal.decode(log_file.read())] == [1, 2, 1, 3]
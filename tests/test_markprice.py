@@ -0,0 +1,59 @@
+import asyncio
+import json
+import time
+
+from liquidation_acme import exit_performance
+from lib.markprice import MarkPriceFeed
+from lib.tradebook import Side, TradeBook
+
+
+def update(symbol: str, price: str = None) -> str:
+    data = {"e": "markPriceUpdate", "E": int(time.time() * 1000), "s": symbol}
+    if price is not None:
+        data["p"] = price
+    return json.dumps({"stream": f"{symbol.lower()}@markPrice@1s", "data": data})
+
+
+def test_bad_mark_price_does_not_stop_exits(websocket_server, until):
+    book = TradeBook(take_profit=0.6, stop_loss=-0.5)
+    book.add("BTCUSDT", 50.0, Side.BUY)
+    book.add("ETHUSDT", 20.0, Side.SELL)
+
+    async def scenario():
+        # A payload without a price, then prices reaching the take profit of both entries.
+        server, url = await websocket_server([update("BTCUSDT"), update("BTCUSDT", "not a number"),
+                                              update("BTCUSDT", "50.5"), update("ETHUSDT", "19.8")])
+        feed = MarkPriceFeed(url, book)
+        feed.sync()
+        task = asyncio.create_task(feed.run())
+        try:
+            await until(lambda: not len(book))
+            await until(lambda: not feed.client.streams)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+        return feed
+
+    feed = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert book.total_profit > 1.2
+    # The exits reach the trade book summary at the price that took them.
+    exits = feed.take_exits()
+    assert [(e.symbol, e.entry_price, e.exit_price) for e in exits] == [("BTCUSDT", 50.0, 50.5),
+                                                                        ("ETHUSDT", 20.0, 19.8)]
+    assert exit_performance({}, exits) == {"BTCUSDT": [(50.0, 50.5, exits[0].gain, Side.BUY)],
+                                           "ETHUSDT": [(20.0, 19.8, exits[1].gain, Side.SELL)]}
+    assert feed.take_exits() == []
+
+
+def test_follows_the_trade_book():
+    book = TradeBook()
+    feed = MarkPriceFeed("ws://127.0.0.1:1", book)
+    book.add("BTCUSDT", 50.0, Side.BUY)
+    feed.follow("BTCUSDT")
+    feed.follow("BTCUSDT")
+    assert feed.client.streams == {"btcusdt@markPrice@1s"}
+    book.update("BTCUSDT", 100.0)
+    feed.sync()
+    assert feed.client.streams == set()
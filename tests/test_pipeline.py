@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from lib.events import LiquidationEvent
+from lib.pipeline import CascadeCoalescer, LiquidationQueue
+
+
+def event(symbol: str, side: str = "SELL", quantity: str = "1", price: str = "100") -> LiquidationEvent:
+    return LiquidationEvent(symbol, side, quantity, price, 1_700_000_000_000)
+
+
+async def drain(queue: LiquidationQueue) -> list:
+    items = []
+    while queue.qsize():
+        items.append(await queue.get())
+    return items
+
+
+def test_queue_hands_out_largest_first_and_ties_in_arrival_order():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=10)
+        for item, value in (("a", 5.0), ("b", 9.0), ("c", 5.0), ("d", 1.0), ("e", 9.0)):
+            await queue.put(item, value)
+        return await drain(queue)
+
+    assert asyncio.run(scenario()) == ["b", "e", "a", "c", "d"]
+
+
+def test_queue_block_waits_for_a_free_slot():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=2)
+        await queue.put("a", 1.0)
+        await queue.put("b", 2.0)
+        blocked = asyncio.create_task(queue.put("c", 3.0))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await queue.get() == "b"
+        assert await asyncio.wait_for(blocked, 1) is True
+        assert await drain(queue) == ["c", "a"]
+        assert queue.stats() == {"depth": 0, "high_water": 2, "put": 3, "dropped": 0}
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_queue_drop_smallest_sheds_the_smallest_event():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=3, overflow="drop_smallest")
+        for item, value in (("a", 5.0), ("b", 1.0), ("c", 3.0)):
+            await queue.put(item, value)
+        assert await queue.put("d", 4.0) is True  # Replaces b.
+        assert await queue.put("e", 3.0) is False  # No larger than anything queued.
+        assert queue.dropped == 2
+        return await drain(queue)
+
+    assert asyncio.run(scenario()) == ["a", "d", "c"]
+
+
+def test_queue_drop_oldest_sheds_the_longest_queued_event():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=3, overflow="drop_oldest")
+        for item, value in (("a", 9.0), ("b", 1.0), ("c", 3.0)):
+            await queue.put(item, value)
+        assert await queue.put("d", 0.5) is True  # Replaces a, however large.
+        assert await queue.put("e", 2.0) is True  # Replaces b.
+        assert queue.dropped == 2
+        return await drain(queue)
+
+    assert asyncio.run(scenario()) == ["c", "e", "d"]
+
+
+def test_queue_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        LiquidationQueue(overflow="drop_newest")
+    with pytest.raises(ValueError):
+        LiquidationQueue(maxsize=0)
+
+
+def test_coalescer_blocks_new_aggregates_while_the_queue_is_full():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=1)
+        coalescer = CascadeCoalescer(queue, window=0.01)
+        await coalescer.put(event("ETHUSDT"))
+        await queue.put(event("BTCUSDT"), 100.0)  # The ETHUSDT aggregate now waits for room.
+        runner = asyncio.create_task(coalescer.run())
+        await asyncio.sleep(0.05)
+        blocked = asyncio.create_task(coalescer.put(event("SOLUSDT")))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        # An order for a waiting aggregate is still absorbed without waiting.
+        await asyncio.wait_for(coalescer.put(event("ETHUSDT", quantity="2")), 1)
+        assert coalescer.merged == 1
+
+        assert (await queue.get()).symbol == "BTCUSDT"
+        aggregate = await asyncio.wait_for(queue.get(), 1)
+        assert (aggregate.symbol, aggregate.count, aggregate.quantity) == ("ETHUSDT", 2, 3.0)
+        await asyncio.wait_for(blocked, 1)
+        assert (await asyncio.wait_for(queue.get(), 1)).symbol == "SOLUSDT"
+        runner.cancel()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_coalescer_does_not_block_when_the_queue_sheds():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=1, overflow="drop_oldest")
+        coalescer = CascadeCoalescer(queue, window=0.01)
+        await queue.put(event("BTCUSDT"), 100.0)
+        await asyncio.wait_for(coalescer.put(event("ETHUSDT")), 1)
+        assert coalescer.pending() == 1
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+def test_aggregate_that_grew_while_blocked_is_ranked_by_its_final_value():
+    async def scenario():
+        queue = LiquidationQueue(maxsize=2)
+        coalescer = CascadeCoalescer(queue, window=0.01)
+        await coalescer.put(event("ETHUSDT"))  # Worth 100.
+        await queue.put("a", 500.0)
+        await queue.put("b", 300.0)
+        runner = asyncio.create_task(coalescer.run())
+        await asyncio.sleep(0.05)
+        await coalescer.put(event("ETHUSDT", quantity="10"))  # Absorbed while waiting, now 1100.
+        assert await queue.get() == "a"
+        await asyncio.sleep(0.05)  # The aggregate takes the freed slot.
+        aggregate = await queue.get()
+        runner.cancel()
+        return aggregate, await queue.get()
+
+    aggregate, last = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert (aggregate.symbol, aggregate.value) == ("ETHUSDT", 1100.0)
+    assert last == "b"
@@ -0,0 +1,33 @@
+import asyncio
+
+from lib.simulator import Market, Simulator
+
+
+class Client:
+    def __init__(self, fail: bool = False) -> None:
+        self.closed = False
+        self.fail = fail
+        self.received = []
+
+    async def send_str(self, message: str) -> None:
+        if self.fail:
+            raise ConnectionResetError("Cannot write to closing transport")
+        self.received.append(message)
+
+
+def test_broadcast_survives_a_client_that_disconnects():
+    async def events():
+        for number in range(3):
+            yield {"number": number}
+
+    async def scenario():
+        simulator = Simulator(Market(["BTCUSDT"]), events())
+        gone, staying = Client(fail=True), Client()
+        simulator._liquidation_clients.update((gone, staying))
+        await simulator._broadcast()
+        return simulator, gone, staying
+
+    simulator, gone, staying = asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert staying.received == ['{"number": 0}', '{"number": 1}', '{"number": 2}']
+    assert simulator._liquidation_clients == {staying}
+    assert simulator.sent == 3
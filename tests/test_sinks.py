@@ -0,0 +1,83 @@
+import asyncio
+import socket
+import tracemalloc
+
+import pytest
+
+from lib import sinks
+
+
+class ListSink(sinks.Sink):
+    name = "list"
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        super().__init__(maxsize)
+        self.batches = []
+
+    async def write(self, batch: list) -> None:
+        self.batches.append(batch)
+
+
+def test_sink_without_write_cannot_be_created():
+    class Incomplete(sinks.Sink):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_sink_writes_submitted_alerts_in_batches(until):
+    async def scenario():
+        sink = ListSink(maxsize=2)
+        for alert in ("a", "b", "c"):
+            sink.submit(alert)
+        assert sink.dropped == 1
+        runner = asyncio.create_task(sink.run())
+        await until(lambda: sink.written == 2)
+        runner.cancel()
+        assert sink.batches == [["a", "b"]]
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+
+
+class Record:
+    def to_dict(self) -> dict:
+        return {"symbol": "BTCUSDT"}
+
+
+def listening(port: int) -> bool:
+    with socket.socket() as probe:
+        return probe.connect_ex(("127.0.0.1", port)) == 0
+
+
+def test_socket_sink_discards_what_clients_send(until):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    async def scenario():
+        sink = sinks.SocketSink(port=port)
+        runner = asyncio.create_task(sink.run())
+        await until(lambda: listening(port))
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await until(lambda: sink._clients)
+        tracemalloc.start()
+        try:
+            chunk = b"x" * 65536
+            for _ in range(128):  # 8 MB the sink must not hold on to.
+                writer.write(chunk)
+                await writer.drain()
+            await asyncio.sleep(0.2)
+            grown = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        await sink.write([Record()])
+        line = await asyncio.wait_for(reader.readline(), 5)
+        writer.close()
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return grown, line
+
+    grown, line = asyncio.run(asyncio.wait_for(scenario(), 20))
+    assert grown < 2_000_000
+    assert line == b'{"symbol": "BTCUSDT"}\n'
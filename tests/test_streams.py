@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+from liquidation_acme import liquidation_key
+from lib import metrics
+from lib.streams import RedundantStream, StreamClient
+
+
+def combined(symbol: str, price: str) -> str:
+    return json.dumps({"stream": f"{symbol.lower()}@markPrice@1s", "data": {"s": symbol, "p": price}})
+
+
+def test_bad_messages_do_not_end_the_stream(websocket_server, until):
+    received = []
+
+    def handler(stream, data):
+        if data["s"] == "BADUSDT":
+            raise KeyError("listener error")
+        received.append(float(data["p"]))
+
+    async def scenario():
+        server, url = await websocket_server(["not json", json.dumps({"stream": "x@kline_1m", "data": {}}),
+                                              combined("BADUSDT", "1"), combined("BTCUSDT", "2")])
+        client = StreamClient(url, handler)
+        task = asyncio.create_task(client.run())
+        try:
+            await until(lambda: received)
+            assert client.connected
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert received == [2.0]
+
+
+def force_order(symbol: str, trade_time: int) -> str:
+    return json.dumps({"e": "forceOrder", "E": trade_time + 1,
+                       "o": {"s": symbol, "S": "SELL", "q": "1.5", "p": "100.0", "T": trade_time}})
+
+
+def test_redundant_connections_deliver_each_message_once(websocket_server, until):
+    messages = [force_order(symbol, trade_time) for trade_time in (1, 2, 3) for symbol in ("BTCUSDT", "ETHUSDT")]
+    received = []
+
+    async def handler(message):
+        received.append(liquidation_key(message))
+
+    async def scenario():
+        server, url = await websocket_server(messages)
+        stream = RedundantStream(url, handler, liquidation_key, connections=3)
+        duplicates = metrics.STREAM_DUPLICATES.value()
+        task = asyncio.create_task(stream.run())
+        try:
+            await until(lambda: stream.open == 3 and metrics.STREAM_DUPLICATES.value() - duplicates == 12)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert received == [liquidation_key(json.loads(message)) for message in messages]
+
+
+def test_bad_message_does_not_drop_redundant_connections(websocket_server, until):
+    messages = ["not json", json.dumps({"e": "forceOrder"}), force_order("BADUSDT", 1), force_order("BTCUSDT", 2)]
+    received = []
+
+    async def handler(message):
+        if message["o"]["s"] == "BADUSDT":
+            raise KeyError("handler error")
+        received.append(liquidation_key(message))
+
+    async def scenario():
+        server, url = await websocket_server(messages)
+        stream = RedundantStream(url, handler, liquidation_key, connections=2)
+        errors = metrics.STREAM_MESSAGE_ERRORS.value()
+        opened = metrics.STREAM_CONNECTIONS.value("opened")
+        task = asyncio.create_task(stream.run())
+        try:
+            # Both connections fail to decode the first two; the handler error is seen once.
+            await until(lambda: received and metrics.STREAM_MESSAGE_ERRORS.value() - errors == 5)
+            await asyncio.sleep(0.1)
+            assert stream.open == 2
+            assert metrics.STREAM_CONNECTIONS.value("opened") - opened == 2
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(asyncio.wait_for(scenario(), 10))
+    assert received == [("BTCUSDT", 2, "1.5", "100.0")]
+
+
+def test_redundant_stream_forgets_the_oldest_keys():
+    received = []
+
+    async def handler(message):
+        received.append(message["o"]["T"])
+
+    async def scenario():
+        stream = RedundantStream("ws://unused", handler, liquidation_key, dedup_size=2)
+        for trade_time in (1, 2, 1, 3, 2, 1):
+            await stream._receive(force_order("BTCUSDT", trade_time))
+
+    asyncio.run(scenario())
+    # 3 pushes 1 out, so the second 2 is still a duplicate and the last 1 is new again.
+    assert received == [1, 2, 3, 1]
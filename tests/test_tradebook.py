@@ -0,0 +1,76 @@
+import asyncio
+import random
+from collections import Counter
+
+import pytest
+
+import liquidation_acme
+from lib.tradebook import Side, TradeBook, TAKE_PROFIT, STOP_LOSS
+
+
+def baseline_exits(book: dict, prices: dict) -> tuple:
+    """
+    market_exits as it worked on the plain dict of symbol to [(entry price, side)].
+
+    :return: Tuple of (exits as (symbol, entry price, side, gain), summed gain).
+    """
+    exits = []
+    profit = 0.0
+    for symbol in list(book):
+        live_price = prices.get(symbol)
+        if live_price is None:
+            continue
+        for entry in book[symbol][:]:
+            entry_price, side = entry
+            if side == Side.BUY:
+                gain = ((live_price - entry_price) / entry_price) * 100
+            else:
+                gain = ((entry_price - live_price) / entry_price) * 100
+            if gain >= TAKE_PROFIT or gain <= STOP_LOSS:
+                book[symbol].remove(entry)
+                profit += gain
+                exits.append((symbol, entry_price, side, gain))
+        if not book[symbol]:
+            del book[symbol]
+    return exits, profit
+
+
+@pytest.mark.parametrize("trial", range(20))
+def test_trade_book_exits_like_the_baseline(trial, capsys):
+    rng = random.Random(trial)
+    symbols = [f"S{i}USDT" for i in range(5)]
+    # Prices on a coarse grid, so gains land exactly on the exit levels now and then.
+    level = {symbol: rng.choice([1.0, 10.0, 50.0]) for symbol in symbols}
+
+    def price(symbol: str) -> float:
+        return round(level[symbol] * (1 + rng.randint(-12, 12) / 1000), 4)
+
+    trade_book = TradeBook()
+    expected = {}
+    expected_profit = 0.0
+
+    async def cycle(prices: dict) -> list:
+        return await liquidation_acme.market_exits(trade_book, prices)
+
+    for _ in range(60):
+        for _ in range(rng.randint(0, 8)):
+            symbol = rng.choice(symbols)
+            # Half the entries at the level itself, which the exit levels are whole grid steps from.
+            entry_price = level[symbol] if rng.random() < 0.5 else price(symbol)
+            side = rng.choice([Side.BUY, Side.SELL])
+            trade_book.add(symbol, entry_price, side)
+            expected.setdefault(symbol, []).append((entry_price, side))
+        prices = {symbol: price(symbol) for symbol in rng.sample(symbols, rng.randint(0, len(symbols)))}
+
+        exits = asyncio.run(cycle(prices))
+        expected_exits, profit = baseline_exits(expected, prices)
+        expected_profit += profit
+
+        assert Counter((e.symbol, e.entry_price, e.side, e.gain) for e in exits) == Counter(expected_exits)
+        assert {symbol: [(price, side) for _, price, side in trade_book.entries(symbol)]
+                for symbol in trade_book.symbols()} == expected
+        assert trade_book.total_profit == pytest.approx(expected_profit, rel=1e-9, abs=1e-9)
+        performance = trade_book.performance(prices)
+        for symbol, rows in performance.items():
+            assert [(entry_price, side) for entry_price, _, _, side in rows] == expected[symbol]
+    capsys.readouterr()
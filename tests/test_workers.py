@@ -0,0 +1,149 @@
+import asyncio
+import os
+
+import pytest
+
+import liquidation_acme
+from context import AppContext
+from lib import pipeline
+from lib.events import LiquidationEvent
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.yaml")
+
+
+def event(symbol: str, value: float) -> LiquidationEvent:
+    return LiquidationEvent(symbol, "SELL", f"{value:.3f}", "1.0", 0)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    context = AppContext(CONFIG)
+    context.__dict__["messages"] = pipeline.LiquidationQueue(100)
+    monkeypatch.setattr(liquidation_acme, "context", context)
+    return context
+
+
+async def run_workers(app, workers: int, events: list, process) -> None:
+    app.conf.workers = workers
+    for item in events:
+        await app.messages.put(item, item.value)
+    task = asyncio.create_task(liquidation_acme.process_messages())
+    try:
+        await process()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def test_backlog_is_processed_largest_first(app, monkeypatch):
+    processed = []
+
+    async def process_event(item):
+        processed.append(item.value)
+
+    monkeypatch.setattr(liquidation_acme, "process_event", process_event)
+
+    async def scenario():
+        async def done():
+            while len(processed) < 5:
+                await asyncio.sleep(0)
+        await run_workers(app, 1, [event(f"S{i}USDT", float(i)) for i in (3, 1, 5, 2, 4)], done)
+
+    asyncio.run(scenario())
+    assert processed == [5.0, 4.0, 3.0, 2.0, 1.0]
+
+
+def test_busy_symbol_keeps_order_without_blocking_others(app, monkeypatch):
+    processed = []
+    release = None
+
+    async def process_event(item):
+        if item.value == 100.0:
+            await release.wait()  # The first AUSDT event is slow.
+        processed.append((item.symbol, item.value))
+
+    monkeypatch.setattr(liquidation_acme, "process_event", process_event)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+
+        async def done():
+            while ("BUSDT", 10.0) not in processed:
+                await asyncio.sleep(0)
+            # Other symbols go ahead while AUSDT's worker is busy, and its later event waits for it.
+            assert ("AUSDT", 50.0) not in processed
+            release.set()
+            while len(processed) < 3:
+                await asyncio.sleep(0)
+
+        await run_workers(app, 2, [event("AUSDT", 100.0), event("AUSDT", 50.0), event("BUSDT", 10.0)], done)
+
+    asyncio.run(scenario())
+    assert processed == [("BUSDT", 10.0), ("AUSDT", 100.0), ("AUSDT", 50.0)]
+
+
+def test_error_does_not_stop_the_worker(app, monkeypatch):
+    processed = []
+
+    async def process_event(item):
+        if item.symbol == "BADUSDT":
+            raise ValueError("bad event")
+        processed.append(item.symbol)
+
+    monkeypatch.setattr(liquidation_acme, "process_event", process_event)
+
+    async def scenario():
+        async def done():
+            while not processed:
+                await asyncio.sleep(0)
+        await run_workers(app, 1, [event("BADUSDT", 2.0), event("GOODUSDT", 1.0)], done)
+
+    asyncio.run(scenario())
+    assert processed == ["GOODUSDT"]
+
+
+def test_busy_symbol_events_stay_queued_in_arrival_order(app, monkeypatch):
+    processed = []
+    release = None
+
+    async def process_event(item):
+        if item.value == 100.0:
+            await release.wait()
+        processed.append((item.symbol, item.value))
+
+    monkeypatch.setattr(liquidation_acme, "process_event", process_event)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+
+        async def done():
+            while ("BUSDT", 1.0) not in processed:
+                await asyncio.sleep(0)
+            # AUSDT's later events wait in the bounded queue, not in the workers.
+            assert app.messages.qsize() == 2
+            release.set()
+            while len(processed) < 4:
+                await asyncio.sleep(0)
+
+        await run_workers(app, 2, [event("AUSDT", 100.0), event("AUSDT", 10.0), event("AUSDT", 50.0),
+                                   event("BUSDT", 1.0)], done)
+
+    asyncio.run(scenario())
+    assert processed == [("BUSDT", 1.0), ("AUSDT", 100.0), ("AUSDT", 10.0), ("AUSDT", 50.0)]
+
+
+def test_busy_symbol_events_are_subject_to_the_overflow_policy():
+    async def scenario():
+        queue = pipeline.LiquidationQueue(2, overflow="drop_smallest")
+        await queue.put(event("AUSDT", 100.0), 100.0)
+        await queue.put(event("AUSDT", 5.0), 5.0)
+        claimed = await queue.claim()
+        await queue.put(event("AUSDT", 1.0), 1.0)
+        await queue.put(event("BUSDT", 50.0), 50.0)  # Sheds the smallest waiting AUSDT event.
+        assert queue.dropped == 1
+        await queue.release(claimed)
+        return [(await queue.claim()).value, (await queue.claim()).value]
+
+    assert asyncio.run(asyncio.wait_for(scenario(), 10)) == [50.0, 5.0]
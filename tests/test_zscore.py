@@ -0,0 +1,89 @@
+import random
+import statistics
+
+import pytest
+
+from lib import zscore
+
+START = 1_700_006_400_000  # A 4h boundary.
+TIMEFRAMES = ["1m", "3m", "15m", "1h"]
+LOOKBACK = 27
+
+
+def rest_klines(minute_volumes: list, minute: int, partial: float, timeframe: str, limit: int) -> list:
+    """
+    Klines a REST request would return at `minute`, with `partial` traded in it so far.
+    """
+    size = zscore.TIMEFRAME_MS[timeframe] // zscore.MINUTE_MS
+    bar = minute // size
+    rows = []
+    for index in range(bar - (limit - 1), bar + 1):
+        first = index * size
+        volume = sum(minute_volumes[first:min(first + size, minute)])
+        if index == bar:
+            volume += partial
+        rows.append([START + first * zscore.MINUTE_MS, "1", "1", "1", "1", str(volume)])
+    return rows
+
+
+def baseline_zscore(bars: list):
+    """
+    The Z-Score as volume_filter computed it from a fresh REST fetch.
+    """
+    volumes = [float(bar[5]) for bar in bars]
+    try:
+        return (volumes[-2] - statistics.mean(volumes)) / statistics.stdev(volumes)
+    except (statistics.StatisticsError, ZeroDivisionError):
+        return zscore.NEW_MARKET
+
+
+def test_engine_matches_a_fresh_rest_fetch_every_minute():
+    rng = random.Random(5)
+    minutes = 2000
+    # Heavy tailed volumes with bursts, at a magnitude where cancellation would show.
+    minute_volumes = [rng.lognormvariate(12, 1.5) * (rng.random() < 0.05 and 20 or 1) for _ in range(minutes)]
+    first = 1800  # Enough history for a full 1h window.
+    engine = zscore.VolumeEngine(LOOKBACK, TIMEFRAMES)
+    for timeframe in TIMEFRAMES:
+        engine.seed(timeframe, rest_klines(minute_volumes, first, 0.0, timeframe, LOOKBACK))
+
+    for minute in range(first, minutes):
+        so_far = 0.0
+        for share in (0.2, 0.5, 1.0):
+            so_far = minute_volumes[minute] * share
+            assert engine.update(START + minute * zscore.MINUTE_MS, so_far)
+        for timeframe, value in engine.zscores().items():
+            expected = baseline_zscore(rest_klines(minute_volumes, minute, so_far, timeframe, LOOKBACK))
+            assert value == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_engine_is_invalid_after_a_skipped_minute():
+    engine = zscore.VolumeEngine(LOOKBACK, ["1m"])
+    engine.seed("1m", [[START, "1", "1", "1", "1", "5"], [START + zscore.MINUTE_MS, "1", "1", "1", "1", "2"]])
+    assert engine.update(START, 9.0)  # An older minute is ignored.
+    assert engine.zscores()["1m"] == baseline_zscore([[0, 0, 0, 0, 0, 5.0], [0, 0, 0, 0, 0, 2.0]])
+    assert not engine.update(START + 3 * zscore.MINUTE_MS, 1.0)
+    assert not engine.is_current(START + 3 * zscore.MINUTE_MS)
+
+
+def test_engine_reports_a_new_market_without_closed_bars():
+    engine = zscore.VolumeEngine(LOOKBACK, ["1m", "5m"])
+    engine.seed("1m", [[START, "1", "1", "1", "1", "5"]])
+    assert engine.zscores() == {"1m": zscore.NEW_MARKET, "5m": zscore.NEW_MARKET}
+
+
+def test_engine_without_1m_follows_the_wall_clock_minute():
+    minute = START + 7 * zscore.MINUTE_MS  # Inside the 3m bar opened at START + 6 minutes.
+    engine = zscore.VolumeEngine(LOOKBACK, ["3m", "15m"])
+    engine.seed("3m", [[START + 3 * zscore.MINUTE_MS, "1", "1", "1", "1", "8"],
+                       [START + 6 * zscore.MINUTE_MS, "1", "1", "1", "1", "5"]], minute + 20_000)
+    engine.seed("15m", [[START - 15 * zscore.MINUTE_MS, "1", "1", "1", "1", "40"],
+                        [START, "1", "1", "1", "1", "20"]], minute + 20_000)
+    assert engine.is_current(minute + 30_000)
+    # The seeded bars already hold the minute's volume so far; only what trades later is added.
+    assert engine.update(minute, 2.0)
+    assert engine.update(minute, 3.0)
+    assert (engine.windows["3m"].volume, engine.windows["15m"].volume) == (6.0, 21.0)
+    assert engine.update(minute + zscore.MINUTE_MS, 4.0)
+    assert (engine.windows["3m"].volume, engine.windows["15m"].volume) == (10.0, 25.0)
+    assert engine.is_current(minute + zscore.MINUTE_MS)